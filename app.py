@@ -8,158 +8,1397 @@ import datetime
 import time
 import os
 import hashlib
+import shutil
+import signal
+import atexit
+import threading
+import heapq
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
 from werkzeug.security import generate_password_hash, check_password_hash
+import question_dedup
+import question_difficulty
+import question_search
+import question_table
+import question_topics
+import review_schedule
+from exam_blueprint import DEFAULT_BLUEPRINT, load_blueprints
+from leaderboard import METRICS as LEADERBOARD_METRICS, LeaderboardService
+from wrong_sampler import WrongSampler
+from question_bank import QuestionBank, QuestionLayout, QuestionSet, load_bank, load_cached_bank, normalize_question_id, source_stat
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here-change-in-production'
 
 # 数据文件路径
 QUESTIONS_FILE = 'full_questions.json'
+QUESTIONS_CACHE_FILE = 'questions_cache.pkl'
 USER_DATA_FILE = os.environ.get('USER_DATA_FILE', 'user_data.json')
 DB_URL = os.environ.get('DATABASE_URL') or os.environ.get('POSTGRES_URL') or os.environ.get('PG_URL')
 
 # 检查是否在Railway环境中
 IS_RAILWAY = os.environ.get('RAILWAY_ENVIRONMENT') is not None
 
-# 全局缓存
-_questions_cache = None
-_questions_cache_time = 0
-CACHE_DURATION = 300  # 缓存5分钟
+# 全局缓存：题库索引整体替换，进行中的请求始终持有完整的旧索引或新索引
+_question_bank = None
+_question_bank_lock = threading.Lock()
+_question_watcher = None
+# 最近一次题库加载的近似重复/版本差异报告（后台生成）
+_question_bank_report = None
+QUESTION_BANK_REPORT = os.environ.get('QUESTION_BANK_REPORT', '1') == '1'
+QUESTIONS_WATCH_INTERVAL = float(os.environ.get('QUESTIONS_WATCH_INTERVAL', 5))  # 检查题库文件变化的间隔（秒）
+_question_layouts = None  # 历史题库布局（布局ID -> 题目ID列表），用于解析旧布局下保存的位图
+_question_archive = None  # 历史题库版本中被修改/删除的题目，考试记录按自己的题库版本评分与展示
 
 # 用户数据缓存（避免重复计算）
 _user_stats_cache = {}
 _user_stats_cache_time = {}
+# 未做题模式的乱序排列缓存：(布局ID, 未做题位图, 种子) -> 题库序号列表
+_practice_permutations = OrderedDict()
+PRACTICE_PERMUTATION_CACHE_SIZE = 256
+# 错题模式的加权抽样器：user_id -> WrongSampler（LRU，超出上限时丢弃最久未用的，下次抽样重建）
+_wrong_samplers = OrderedDict()
+_wrong_samplers_lock = threading.Lock()
+WRONG_SAMPLER_CACHE_SIZE = 1024
 USER_STATS_CACHE_DURATION = 60  # 用户统计缓存1分钟
+EXAM_BLUEPRINTS_FILE = os.environ.get('EXAM_BLUEPRINTS_FILE', 'exam_blueprints.json')  # 自定义考试蓝图（可选）
+EXAM_BLUEPRINTS = load_blueprints(EXAM_BLUEPRINTS_FILE)
+EXAM_AUTOSAVE_FLUSH_INTERVAL = float(os.environ.get('EXAM_AUTOSAVE_FLUSH_INTERVAL', 10))  # 考试增量作答落盘间隔（秒）
+EXAM_BLOB_SAVE_INTERVAL = float(os.environ.get('EXAM_BLOB_SAVE_INTERVAL', 300))  # blob 模式下增量作答最长多久整体保存一次（秒）
+EXAM_SESSION_IDLE_SECONDS = 4 * 3600  # 超过该时间无改动的考试会话从内存移除
+EXAM_EXPIRY_SCHEDULER = os.environ.get('EXAM_EXPIRY_SCHEDULER', '1') == '1'  # 后台结算超时考试
+EXAM_EXPIRY_GRACE = float(os.environ.get('EXAM_EXPIRY_GRACE', 30))  # 超时后再等待的秒数，让前端的自动交卷先到
+WRONG_RECENT_LIMIT = int(os.environ.get('WRONG_RECENT_LIMIT', 5))  # 每道错题保留的最近作答次数
+PRACTICE_BATCH_MAX = int(os.environ.get('PRACTICE_BATCH_MAX', 50))  # 批量练习一次最多取题/交题数
+WRONG_SAMPLER_HALF_LIFE_DAYS = float(os.environ.get('WRONG_SAMPLER_HALF_LIFE_DAYS', 14))  # 错题模式：最后做错时间每隔多少天权重减半
+WRONG_SAMPLER_AVOID_LAST = int(os.environ.get('WRONG_SAMPLER_AVOID_LAST', 5))  # 错题模式：避开最近出过的题数
+QUESTION_TOPICS_FILE = os.environ.get('QUESTION_TOPICS_FILE', 'question_topics.json')  # 题目主题索引（由 question_topics.py 生成，可选）
 
 # 确保数据目录存在
 DATA_DIR = os.path.dirname(USER_DATA_FILE) if os.path.dirname(USER_DATA_FILE) else '.'
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR, exist_ok=True)
 
-# 简易数据库KV持久化（可选：当配置了 DATABASE_URL 时启用）
-_db_conn = None
+# 用户数据存储模式：blob（整体一个JSON，默认）/ per_user（按用户分行存储）/ journal（追加日志+快照）
+USER_STORAGE_MODE = os.environ.get('USER_STORAGE_MODE', 'blob')
+USER_ROWS_DIR = os.environ.get('USER_ROWS_DIR') or os.path.join('/data' if IS_RAILWAY else DATA_DIR, 'users')
+# 每个用户拆分成的分区 -> 对应整体结构中的顶层键
+USER_ROW_SECTIONS = {
+    'profile': 'user_profiles',
+    'progress': 'users',
+    'wrong_records': 'wrong_questions',
+    'exam_records': 'exam_records'
+}
+USER_ROWS_MIGRATED_KEY = 'user_rows_migrated'
+# 题库布局登记表：与用户数据放在一起，题库增删题后仍能解析旧位图
+QUESTION_LAYOUTS_FILE = os.path.join('/data' if IS_RAILWAY else DATA_DIR, 'question_layouts.json')
+QUESTION_LAYOUTS_KEY = 'question_layouts'
+# 题库版本存档：每次替换题库时保存旧版本中被修改/删除的题目
+QUESTION_ARCHIVE_FILE = os.path.join('/data' if IS_RAILWAY else DATA_DIR, 'question_archive.json')
+QUESTION_ARCHIVE_KEY = 'question_archive'
+# 全站题目难度统计（所有用户的作答/答对次数），与用户数据放在一起
+QUESTION_DIFFICULTY_FILE = os.path.join('/data' if IS_RAILWAY else DATA_DIR, 'question_difficulty.json')
+QUESTION_DIFFICULTY_KEY = 'question_difficulty'
+DIFFICULTY_FLUSH_INTERVAL = float(os.environ.get('DIFFICULTY_FLUSH_INTERVAL', 30))  # 难度计数落盘间隔（秒）
+DIFFICULTY_REBUILD_WORKERS = int(os.environ.get('DIFFICULTY_REBUILD_WORKERS', 0)) or None  # 重建时的进程数（0=CPU核数）
+_question_difficulty = None
+_question_difficulty_lock = threading.Lock()
+_difficulty_pending = []  # 计数器加载完成前记下的作答
+_difficulty_flush_worker = None
+# 群组排行榜（考试平均分/最高分/已做题数），与用户数据放在一起
+LEADERBOARD_FILE = os.path.join('/data' if IS_RAILWAY else DATA_DIR, 'leaderboard.json')
+LEADERBOARD_KEY = 'leaderboard'
+LEADERBOARD_FLUSH_INTERVAL = float(os.environ.get('LEADERBOARD_FLUSH_INTERVAL', 30))  # 排行榜落盘间隔（秒）
+LEADERBOARD_TOP_MAX = 100  # /get_leaderboard 一次最多返回的名次数
+COHORT_NAME_MAX = 20  # 用户填写的群组名称最大长度
+_leaderboard = None
+_leaderboard_lock = threading.Lock()
+_leaderboard_pending = []  # 排行榜加载完成前记下的更新 (user_id, 群组, 指标)
+_leaderboard_flush_worker = None
+
+# journal 模式：快照沿用整体数据文件，日志与其放在同一目录
+JOURNAL_SNAPSHOT_FILE = '/data/user_data.json' if IS_RAILWAY else USER_DATA_FILE
+JOURNAL_FILE = f"{JOURNAL_SNAPSHOT_FILE}.journal"
+JOURNAL_PENDING_FILE = f"{JOURNAL_FILE}.compacting"
+JOURNAL_COMPACT_INTERVAL = int(os.environ.get('JOURNAL_COMPACT_INTERVAL', 300))  # 秒
+JOURNAL_COMPACT_BYTES = int(os.environ.get('JOURNAL_COMPACT_BYTES', 4 * 1024 * 1024))
+
+# 延迟写（write-behind）：请求只标记脏用户，后台线程按间隔/批量合并落盘（blob/per_user 模式可用）
+# journal 模式本身只追加小记录，不再叠加延迟写
+WRITE_BEHIND = (os.environ.get('WRITE_BEHIND', '').lower() in ('1', 'true', 'yes')
+                and USER_STORAGE_MODE != 'journal')
+WRITE_BEHIND_INTERVAL = float(os.environ.get('WRITE_BEHIND_INTERVAL', 2))  # 秒
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 200))  # 脏用户数达到即提前刷新
 
-def get_db_conn():
-    global _db_conn
+# 简易数据库KV持久化（可选：当配置了 DATABASE_URL 时启用）
+# 连接池大小可按考试高峰并发调整，借出超时后按数据库不可用处理
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))  # 秒
+DB_RETRY_INTERVAL = 30  # 连接失败后间隔多久再重试（秒）
+_db_pool = None
+_db_pool_lock = threading.Lock()
+_db_retry_at = 0
+
+def init_db_pool():
+    """创建连接池并执行一次建表；未配置或暂不可用时返回 None"""
+    global _db_pool, _db_retry_at
     if not DB_URL:
         return None
-    try:
-        import psycopg2
-        if _db_conn is None or _db_conn.closed:
+    if _db_pool is not None:
+        return _db_pool
+    with _db_pool_lock:
+        if _db_pool is not None or time.time() < _db_retry_at:
+            return _db_pool
+        pool = None
+        try:
+            from db_pool import DBConnectionPool
             # Railway Postgres 通常需要 SSL，若 URL 已含 sslmode 则尊重之
-            _db_conn = psycopg2.connect(DB_URL)
-            with _db_conn.cursor() as cur:
-                cur.execute("CREATE TABLE IF NOT EXISTS kv_store (key TEXT PRIMARY KEY, value TEXT)")
-                _db_conn.commit()
-        return _db_conn
-    except Exception as e:
-        print(f"DB unavailable: {e}")
-        return None
+            pool = DBConnectionPool(DB_URL, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT)
+            with pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("CREATE TABLE IF NOT EXISTS kv_store (key TEXT PRIMARY KEY, value TEXT)")
+                    cur.execute(
+                        "CREATE TABLE IF NOT EXISTS user_rows ("
+                        "user_id TEXT NOT NULL, section TEXT NOT NULL, value TEXT,"
+                        " PRIMARY KEY (user_id, section))"
+                    )
+                conn.commit()
+            _db_pool = pool
+        except Exception as e:
+            print(f"DB unavailable: {e}")
+            if pool is not None:
+                # 建表失败：关闭已建立的连接，稍后重试时重新建池
+                pool.closeall()
+            _db_retry_at = time.time() + DB_RETRY_INTERVAL
+        return _db_pool
+
+def db_available():
+    return init_db_pool() is not None
+
+@contextmanager
+def db_connection():
+    """从连接池借出连接（数据库未配置/不可用时得到 None），用完自动归还"""
+    pool = init_db_pool()
+    conn = None
+    if pool is not None:
+        try:
+            conn = pool.getconn()
+        except Exception as e:
+            print(f"DB unavailable: {e}")
+    try:
+        yield conn
+    finally:
+        if conn is not None:
+            pool.putconn(conn)
 
 def db_load_json(key: str):
-    conn = get_db_conn()
-    if not conn:
-        return None
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT value FROM kv_store WHERE key=%s", (key,))
-            row = cur.fetchone()
-            if row and row[0]:
-                try:
-                    return json.loads(row[0])
-                except Exception:
-                    return None
-    except Exception as e:
-        print(f"DB load error: {e}")
+    with db_connection() as conn:
+        if not conn:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT value FROM kv_store WHERE key=%s", (key,))
+                row = cur.fetchone()
+                if row and row[0]:
+                    try:
+                        return json.loads(row[0])
+                    except Exception:
+                        return None
+        except Exception as e:
+            print(f"DB load error: {e}")
     return None
 
 def db_save_json(key: str, obj) -> bool:
-    conn = get_db_conn()
-    if not conn:
-        return False
-    try:
-        payload = json.dumps(obj, ensure_ascii=False, default=str)
-        with conn.cursor() as cur:
-            cur.execute(
-                "INSERT INTO kv_store(key, value) VALUES(%s, %s)"
-                " ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
-                (key, payload)
-            )
+    with db_connection() as conn:
+        if not conn:
+            return False
+        try:
+            payload = json.dumps(obj, ensure_ascii=False, default=_json_default)
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO kv_store(key, value) VALUES(%s, %s)"
+                    " ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
+                    (key, payload)
+                )
+                conn.commit()
+            return True
+        except Exception as e:
+            print(f"DB save error: {e}")
+            return False
+
+def _json_default(obj):
+    """JSON序列化兜底：位图编码为字符串，set 转为 list，其余对象转字符串"""
+    if isinstance(obj, QuestionSet):
+        return obj.encode()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+# ===== 按用户分行存储（USER_STORAGE_MODE=per_user）=====
+# 已持久化分区内容的摘要，内容未变化的分区不重复写入
+_user_row_digests = {}
+
+def _user_row_file(user_id):
+    return os.path.join(USER_ROWS_DIR, quote(str(user_id), safe='') + '.json')
+
+def db_load_user_rows(user_id=None):
+    """从 user_rows 表读取用户分区，返回 {user_id: {section: obj}}；user_id 为空时读取全部用户"""
+    with db_connection() as conn:
+        if not conn:
+            return None
+        try:
+            with conn.cursor() as cur:
+                if user_id is None:
+                    cur.execute("SELECT user_id, section, value FROM user_rows")
+                else:
+                    cur.execute("SELECT user_id, section, value FROM user_rows WHERE user_id=%s", (user_id,))
+                rows = cur.fetchall()
+        except Exception as e:
+            print(f"DB load error: {e}")
+            return None
+    result = {}
+    for uid, section, value in rows:
+        if not value:
+            continue
+        try:
+            result.setdefault(uid, {})[section] = json.loads(value)
+            _user_row_digests[(uid, section)] = hashlib.md5(value.encode('utf-8')).hexdigest()
+        except Exception:
+            continue
+    return result
+
+def db_save_user_rows(user_id: str, payloads: dict) -> bool:
+    """在同一事务中写入单个用户的若干分区（payloads: {section: json字符串}）"""
+    with db_connection() as conn:
+        if not conn:
+            return False
+        try:
+            with conn.cursor() as cur:
+                for section, payload in payloads.items():
+                    cur.execute(
+                        "INSERT INTO user_rows(user_id, section, value) VALUES(%s, %s, %s)"
+                        " ON CONFLICT (user_id, section) DO UPDATE SET value = EXCLUDED.value",
+                        (user_id, section, payload)
+                    )
             conn.commit()
+            return True
+        except Exception as e:
+            # 未提交的事务由连接池归还时回滚
+            print(f"DB save error: {e}")
+            return False
+
+def file_load_user_rows(user_id=None):
+    """从按用户拆分的文件读取用户分区；user_id 为空时读取目录下全部用户"""
+    if user_id is None:
+        if not os.path.isdir(USER_ROWS_DIR):
+            return {}
+        user_ids = [unquote(name[:-5]) for name in os.listdir(USER_ROWS_DIR) if name.endswith('.json')]
+    else:
+        user_ids = [user_id]
+    result = {}
+    for uid in user_ids:
+        path = _user_row_file(uid)
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result[uid] = json.load(f)
+        except Exception as e:
+            print(f"Warning: Failed to load user row file {path}: {e}")
+    return result
+
+def _row_user_ids():
+    """按用户存储中的全部用户ID（只读ID，不加载数据）"""
+    with db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT DISTINCT user_id FROM user_rows")
+                    return [row[0] for row in cur.fetchall()]
+            except Exception as e:
+                print(f"DB load error: {e}")
+    if not os.path.isdir(USER_ROWS_DIR):
+        return []
+    return [unquote(name[:-5]) for name in os.listdir(USER_ROWS_DIR) if name.endswith('.json')]
+
+def _load_user_rows(user_id=None):
+    """读取按用户存储的数据并拼装为与整体存储相同的结构"""
+    rows = db_load_user_rows(user_id)
+    if not rows:
+        rows = file_load_user_rows(user_id)
+    data = {key: {} for key in USER_ROW_SECTIONS.values()}
+    for uid, sections in rows.items():
+        for section, key in USER_ROW_SECTIONS.items():
+            if sections.get(section) is not None:
+                data[key][uid] = sections[section]
+    return data
+
+def _save_user_rows(data, user_ids):
+    """只写入指定用户的分区；内容未变化的用户/分区直接跳过"""
+    use_db = db_available()
+    for uid in user_ids:
+        payloads = {}
+        for section, key in USER_ROW_SECTIONS.items():
+            if uid in data.get(key, {}):
+                payloads[section] = json.dumps(data[key][uid], ensure_ascii=False, default=_json_default)
+        digests = {section: hashlib.md5(p.encode('utf-8')).hexdigest() for section, p in payloads.items()}
+        changed = {section: p for section, p in payloads.items()
+                   if _user_row_digests.get((uid, section)) != digests[section]}
+        if not changed:
+            continue
+        # 摘要只在写入成功后更新：写入失败时下次保存会再次写入（哪怕内容相同），存储得以修复
+        saved = db_save_user_rows(uid, changed) if use_db else True
+        try:
+            os.makedirs(USER_ROWS_DIR, exist_ok=True)
+            path = _user_row_file(uid)
+            temp_file = f"{path}.tmp"
+            body = '{' + ','.join(f'{json.dumps(section)}:{p}' for section, p in payloads.items()) + '}'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                f.write(body)
+            os.replace(temp_file, path)
+        except Exception as e:
+            print(f"Warning: Failed to save user row file for {uid}: {e}")
+            saved = False
+        if not saved:
+            continue
+        for section in changed:
+            _user_row_digests[(uid, section)] = digests[section]
+
+def _user_rows_migrated():
+    if db_load_json(USER_ROWS_MIGRATED_KEY):
         return True
+    return os.path.exists(os.path.join(USER_ROWS_DIR, '.migrated'))
+
+def migrate_user_data_to_rows(force=False):
+    """一次性迁移：把整体 user_data 拆分写入按用户存储，返回迁移的用户数"""
+    if not force and _user_rows_migrated():
+        return 0
+    blob = _load_blob_user_data()
+    user_ids = _user_ids_in(blob)
+    for uid in user_ids:
+        _save_user_rows(blob, [uid])
+    marker = {'migrated_time': datetime.datetime.now().isoformat(), 'user_count': len(user_ids)}
+    db_save_json(USER_ROWS_MIGRATED_KEY, marker)
+    try:
+        os.makedirs(USER_ROWS_DIR, exist_ok=True)
+        with open(os.path.join(USER_ROWS_DIR, '.migrated'), 'w', encoding='utf-8') as f:
+            json.dump(marker, f)
     except Exception as e:
-        print(f"DB save error: {e}")
-        return False
+        print(f"Warning: Failed to write migration marker: {e}")
+    print(f"Migrated {len(user_ids)} users to per-user storage")
+    return len(user_ids)
+
+def _user_ids_in(data):
+    """数据中涉及的全部用户ID"""
+    user_ids = set()
+    for key in USER_ROW_SECTIONS.values():
+        user_ids.update((data.get(key) or {}).keys())
+    return user_ids
+
+# ===== 追加写日志 + 快照压缩（USER_STORAGE_MODE=journal）=====
+# 内存中的数据（快照 + 已回放日志）是该模式下的权威数据源
+_journal_lock = threading.RLock()
+_journal_compact_lock = threading.Lock()
+_journal_compact_event = threading.Event()
+_journal_state = None
+_journal_seq = 0
+_journal_fp = None
+_journal_compactor = None
+
+def journal_event(kind, user_id, **payload):
+    """构造一条日志事件（非 journal 模式下 save_user_data 会忽略它）；t、u、seq 为日志保留字段"""
+    payload.update({'t': kind, 'u': user_id})
+    return payload
+
+def _read_journal(path):
+    """逐行读取日志，跳过崩溃时写了一半的记录"""
+    events = []
+    if not os.path.exists(path):
+        return events
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Warning: skipped corrupt journal line in {path}")
+    return events
+
+def _apply_user_event(data, event, bank):
+    """把一条日志事件应用到用户数据上（启动回放与快照压缩共用）
+
+    回放的数据可能是压缩用的副本，与内存中的错题抽样器无关，因此不更新抽样器（sync_sampler=False）。
+    """
+    kind = event.get('t')
+    user_id = event.get('u')
+    if kind == 'user':
+        for section, key in USER_ROW_SECTIONS.items():
+            if section in event['sections']:
+                data[key][user_id] = event['sections'][section]
+        if user_id in data['users']:
+            _normalize_user_progress(data['users'][user_id])
+        if user_id in data['wrong_questions']:
+            data['wrong_questions'][user_id] = _compact_wrong_records(data['wrong_questions'][user_id])
+        return
+    if kind == 'profile':
+        data['user_profiles'][user_id] = event['profile']
+        return
+
+    _ensure_user_structure(data, user_id)
+    user = data['users'][user_id]
+    if kind == 'answer':
+        question = bank.get(event['q'])
+        if question:
+            _apply_answer(data, user_id, question, event['a'], event['ok'], event['ts'], sync_sampler=False)
+        else:
+            # 题目已从题库移除：只恢复集合与计数
+            user['answered_questions'].add(event['q'])
+            if not event['ok']:
+                user['wrong_questions'].add(event['q'])
+                _record_wrong(data, user_id, normalize_question_id(event['q']), event['a'], event['ts'], sync_sampler=False)
+    elif kind == 'served':
+        # 旧版本在出题时直接标记为已做
+        user['answered_questions'].add(event['q'])
+    elif kind == 'cursor':
+        # 游标推进只记录 {'pos': 位置}，新建游标时记录完整游标
+        cursors = user.setdefault('practice_cursors', {})
+        cursors[event['k']] = dict(cursors.get(event['k']) or {}, **event['cursor'])
+    elif kind == 'important':
+        qid = event['q']
+        if isinstance(qid, str) and qid.isdigit():
+            qid = int(qid)
+        if event['mark']:
+            user['important_questions'].add(qid)
+        else:
+            user['important_questions'].discard(qid)
+    elif kind == 'exam_start':
+        record = _compact_exam_record(event['record'], bank)
+        data['exam_records'][user_id].append(record)
+        _index_exam(user, record)
+    elif kind == 'exam_save':
+        record = _find_exam_record(data, user_id, event['exam_id'])
+        if record:
+            record['answers'] = event['answers']
+            record['answers_seq'] = event.get('answers_seq', record.get('answers_seq', 0))
+            record['last_saved'] = event['ts']
+    elif kind == 'exam_patch':
+        record = _find_exam_record(data, user_id, event['exam_id'])
+        if record and record.get('status') == 'ongoing':
+            record['answers'] = record.get('answers') or {}
+            _apply_answer_changes(record['answers'], event['changes'])
+            record['answers_seq'] = event.get('answers_seq', record.get('answers_seq', 0))
+            record['last_saved'] = event['ts']
+    elif kind == 'exam_finalize':
+        record = _find_exam_record(data, user_id, event['exam_id'])
+        if record and record.get('status') != 'completed':
+            record['answers'] = event['answers']
+            _grade_exam_record(data, user_id, record, event['ts'], sync_sampler=False)
+
+def _replay_journal(data, paths, min_seq):
+    """按顺序回放日志文件中 seq > min_seq 的事件，返回最后一条 seq"""
+    bank = load_question_bank()
+    last_seq = min_seq
+    for path in paths:
+        for event in _read_journal(path):
+            if event.get('seq', 0) <= last_seq:
+                continue
+            _apply_user_event(data, event, bank)
+            last_seq = event['seq']
+    return last_seq
+
+def _read_journal_snapshot():
+    """读取最近一次快照；没有快照文件时沿用整体存储的加载逻辑（数据库/环境变量）"""
+    data = None
+    if os.path.exists(JOURNAL_SNAPSHOT_FILE):
+        try:
+            with open(JOURNAL_SNAPSHOT_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Warning: Failed to load journal snapshot: {e}")
+    if not data:
+        data = _load_blob_user_data()
+    for key in USER_ROW_SECTIONS.values():
+        data.setdefault(key, {})
+    return normalize_user_data(data)
+
+def _journal_load_state():
+    """首次使用时加载快照并回放日志尾部，之后直接返回内存数据"""
+    global _journal_state, _journal_seq, _journal_fp, _journal_compactor
+    if _journal_state is not None:
+        return _journal_state
+    with _journal_lock:
+        if _journal_state is not None:
+            return _journal_state
+        data = _read_journal_snapshot()
+        _journal_seq = _replay_journal(data, (JOURNAL_PENDING_FILE, JOURNAL_FILE), data.get('journal_seq', 0))
+        os.makedirs(os.path.dirname(JOURNAL_FILE) or '.', exist_ok=True)
+        _journal_fp = open(JOURNAL_FILE, 'a', encoding='utf-8')
+        if _journal_fp.tell() > 0:
+            with open(JOURNAL_FILE, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b'\n'
+            if torn:
+                # 崩溃时写了一半的记录：另起一行，之后的事件不会与它连在一起
+                _journal_fp.write('\n')
+                _journal_fp.flush()
+        _journal_state = data
+        print(f"User data loaded from journal snapshot, replayed up to seq {_journal_seq}")
+
+        _journal_compactor = threading.Thread(target=_journal_compactor_loop, name='journal-compactor', daemon=True)
+        _journal_compactor.start()
+        return _journal_state
+
+def _journal_append(events):
+    """追加写入事件并 fsync；日志超过阈值时唤醒压缩线程"""
+    global _journal_seq
+    with _journal_lock:
+        lines = []
+        for event in events:
+            _journal_seq += 1
+            event['seq'] = _journal_seq
+            lines.append(json.dumps(event, ensure_ascii=False, default=_json_default))
+        _journal_fp.write('\n'.join(lines) + '\n')
+        _journal_fp.flush()
+        os.fsync(_journal_fp.fileno())
+        size = _journal_fp.tell()
+    if size >= JOURNAL_COMPACT_BYTES:
+        _journal_compact_event.set()
+
+def compact_journal(force=False):
+    """把日志折叠进快照：轮转当前日志 -> 读取上次快照 -> 回放 -> 原子写入新快照
+
+    force=True 时即使没有新日志也重写快照（数据格式迁移后写回）
+    """
+    global _journal_fp
+    with _journal_compact_lock:
+        with _journal_lock:
+            if _journal_fp is not None and _journal_fp.tell() > 0:
+                _journal_fp.close()
+                if os.path.exists(JOURNAL_PENDING_FILE):
+                    # 上次压缩未完成：把当前日志接到待压缩段之后
+                    with open(JOURNAL_FILE, 'rb') as src, open(JOURNAL_PENDING_FILE, 'ab') as dst:
+                        shutil.copyfileobj(src, dst)
+                    os.remove(JOURNAL_FILE)
+                else:
+                    os.replace(JOURNAL_FILE, JOURNAL_PENDING_FILE)
+                _journal_fp = open(JOURNAL_FILE, 'a', encoding='utf-8')
+        if not os.path.exists(JOURNAL_PENDING_FILE) and not force:
+            return False
+
+        snapshot = _read_journal_snapshot()
+        snapshot['journal_seq'] = _replay_journal(snapshot, (JOURNAL_PENDING_FILE,), snapshot.get('journal_seq', 0))
+        temp_file = f"{JOURNAL_SNAPSHOT_FILE}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, default=_json_default)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, JOURNAL_SNAPSHOT_FILE)
+        if db_available():
+            db_save_json('user_data', snapshot)
+        if os.path.exists(JOURNAL_PENDING_FILE):
+            os.remove(JOURNAL_PENDING_FILE)
+        print(f"Journal compacted into snapshot up to seq {snapshot['journal_seq']}")
+        return True
 
-def load_questions():
-    """加载题目数据（带缓存）"""
-    global _questions_cache, _questions_cache_time
-    
-    current_time = time.time()
-    
-    # 检查缓存是否有效
-    if (_questions_cache is not None and 
-        current_time - _questions_cache_time < CACHE_DURATION):
-        return _questions_cache
-    
-    # 尝试从pickle缓存加载
+def _journal_compactor_loop():
+    while True:
+        _journal_compact_event.wait(JOURNAL_COMPACT_INTERVAL)
+        _journal_compact_event.clear()
+        try:
+            compact_journal()
+        except Exception as e:
+            print(f"Journal compaction failed: {e}")
+
+# ===== 延迟写（WRITE_BEHIND=1）=====
+# 常驻内存的用户数据：blob 模式整体加载一次，per_user 模式按需逐个加载
+_resident_lock = threading.RLock()
+_resident_data = None
+_resident_users = set()
+_dirty_users = set()
+_write_behind_wakeup = threading.Event()
+_write_behind_worker = None
+_write_behind_stats = {
+    'flush_count': 0,
+    'flushed_users': 0,
+    'failed_flushes': 0,
+    'last_batch_size': 0,
+    'last_flush_ms': 0.0,
+    'max_flush_ms': 0.0,
+    'total_flush_ms': 0.0,
+    'last_flush_time': None
+}
+
+def _ensure_resident():
+    global _resident_data
+    with _resident_lock:
+        if _resident_data is None:
+            if USER_STORAGE_MODE == 'per_user':
+                _resident_data = {key: {} for key in USER_ROW_SECTIONS.values()}
+            else:
+                _resident_data = _load_blob_user_data()
+                for key in USER_ROW_SECTIONS.values():
+                    _resident_data.setdefault(key, {})
+        return _resident_data
+
+def _resident_view(user_id=None):
+    """返回常驻数据；传入 user_id 时只返回该用户的视图（与常驻数据共享对象）"""
+    _ensure_resident()
+    with _resident_lock:
+        if USER_STORAGE_MODE == 'per_user' and (user_id is None or user_id not in _resident_users):
+            loaded = normalize_user_data(_load_user_rows(user_id))
+            for key in USER_ROW_SECTIONS.values():
+                for uid, value in loaded[key].items():
+                    # 已常驻（可能尚未落盘）的用户以内存为准
+                    if uid not in _resident_users:
+                        _resident_data[key][uid] = value
+            _resident_users.update(_user_ids_in(loaded))
+            if user_id is not None:
+                _resident_users.add(user_id)
+        if user_id is None:
+            return _resident_data
+        return {key: ({user_id: _resident_data[key][user_id]} if user_id in _resident_data[key] else {})
+                for key in USER_ROW_SECTIONS.values()}
+
+def _mark_users_dirty(data):
+    """把请求视图并回常驻数据并标记为脏用户，由后台线程落盘"""
+    global _write_behind_worker
+    user_ids = _user_ids_in(data)
+    resident = _ensure_resident()
+    with _resident_lock:
+        if data is not resident:
+            for key in USER_ROW_SECTIONS.values():
+                resident[key].update(data.get(key) or {})
+        _resident_users.update(user_ids)
+        _dirty_users.update(user_ids)
+        queue_depth = len(_dirty_users)
+        if _write_behind_worker is None or not _write_behind_worker.is_alive():
+            _write_behind_worker = threading.Thread(target=_write_behind_loop, name='write-behind', daemon=True)
+            _write_behind_worker.start()
+    if queue_depth >= WRITE_BEHIND_BATCH_SIZE:
+        _write_behind_wakeup.set()
+    return user_ids
+
+def flush_dirty_users():
+    """把当前所有脏用户合并写入一次（group commit），返回本批用户数"""
+    global _dirty_users
+    with _resident_lock:
+        if not _dirty_users:
+            return 0
+        batch, _dirty_users = _dirty_users, set()
+        resident = _resident_data
+    start = time.time()
     try:
-        import pickle
-        with open('questions_cache.pkl', 'rb') as f:
-            cache_data = pickle.load(f)
-        _questions_cache = cache_data['questions']
-        _questions_cache_time = current_time
-        print(f"Questions loaded from cache: {len(_questions_cache)} questions")
-        return _questions_cache
+        if USER_STORAGE_MODE == 'per_user':
+            _save_user_rows(resident, batch)
+        else:
+            _save_blob_user_data(resident)
     except Exception as e:
-        print(f"Cache loading failed: {e}, falling back to JSON")
-        
-        # 回退到JSON加载
+        # 写入失败（或序列化时数据正被修改）：放回队列等待下次刷新
+        with _resident_lock:
+            _dirty_users.update(batch)
+        _write_behind_stats['failed_flushes'] += 1
+        print(f"Write-behind flush failed, will retry: {e}")
+        return 0
+    elapsed_ms = (time.time() - start) * 1000
+    _write_behind_stats['flush_count'] += 1
+    _write_behind_stats['flushed_users'] += len(batch)
+    _write_behind_stats['last_batch_size'] = len(batch)
+    _write_behind_stats['last_flush_ms'] = round(elapsed_ms, 2)
+    _write_behind_stats['max_flush_ms'] = round(max(_write_behind_stats['max_flush_ms'], elapsed_ms), 2)
+    _write_behind_stats['total_flush_ms'] += elapsed_ms
+    _write_behind_stats['last_flush_time'] = datetime.datetime.now().isoformat()
+    return len(batch)
+
+def drain_write_behind(max_attempts=5):
+    """刷新直到队列为空（进程退出前调用）"""
+    for _ in range(max_attempts):
+        flush_dirty_users()
+        if not _dirty_users:
+            return True
+    print(f"Warning: {len(_dirty_users)} dirty users could not be flushed")
+    return False
+
+def get_write_behind_stats():
+    stats = dict(_write_behind_stats)
+    stats['queue_depth'] = len(_dirty_users)
+    stats['resident_users'] = len(_resident_users) if USER_STORAGE_MODE == 'per_user' else len((_resident_data or {}).get('users', {}))
+    stats['avg_flush_ms'] = round(stats.pop('total_flush_ms') / stats['flush_count'], 2) if stats['flush_count'] else 0.0
+    stats['interval_seconds'] = WRITE_BEHIND_INTERVAL
+    stats['batch_size'] = WRITE_BEHIND_BATCH_SIZE
+    return stats
+
+def _write_behind_loop():
+    while True:
+        _write_behind_wakeup.wait(WRITE_BEHIND_INTERVAL)
+        _write_behind_wakeup.clear()
+        flush_dirty_users()
+
+def _on_sigterm(signum, frame):
+    print("SIGTERM received, flushing exam sessions and write-behind queue...")
+    flush_exam_sessions()
+    if WRITE_BEHIND:
+        drain_write_behind()
+    save_question_difficulty()
+    save_leaderboard()
+    if callable(_previous_sigterm_handler):
+        _previous_sigterm_handler(signum, frame)
+    else:
+        raise SystemExit(0)
+
+_previous_sigterm_handler = None
+
+def reload_question_bank():
+    """按需重建题库索引（源文件内容未变时保持原索引）"""
+    global _question_bank
+    with _question_bank_lock:
+        current = _question_bank
+        # 首次加载时缓存里可能还是上次运行的题库版本，先取出来用于存档
+        previous = current if current is not None else load_cached_bank(QUESTIONS_CACHE_FILE)
+        try:
+            bank, origin = load_bank(QUESTIONS_FILE, QUESTIONS_CACHE_FILE, current)
+        except Exception as e:
+            print(f"Error loading questions: {e}")
+            # 如果加载失败但有缓存，继续使用缓存
+            if current is not None:
+                return current
+            bank, origin = load_cached_bank(QUESTIONS_CACHE_FILE), 'stale cache'
+            if bank is None:
+                bank, origin = QuestionBank([]), 'empty fallback'
+        if bank is not current:
+            register_question_layout(bank.layout)
+            if previous is not None and previous.version and bank.version and previous.version != bank.version:
+                archive_question_bank(previous, bank)
+            _question_bank = bank
+            print(f"Questions loaded from {origin}: {len(bank)} questions")
+            # 后台预建检索索引，第一次搜索不用等待
+            threading.Thread(target=question_search.search_index, args=(bank,), name='search-index', daemon=True).start()
+            if QUESTION_BANK_REPORT:
+                threading.Thread(target=_report_question_bank, args=(bank, current), name='question-report', daemon=True).start()
+        return bank
+
+def _report_question_bank(bank, previous):
+    """生成题库报告：内部近似重复，以及（运行中替换题库时）与上一版本的差异"""
+    global _question_bank_report
+    try:
+        report = question_dedup.bank_report(bank.questions, previous.questions if previous is not None else None)
+    except Exception as e:
+        print(f"Warning: Failed to build question bank report: {e}")
+        return
+    report['bank_version'] = bank.version
+    report['generated_time'] = datetime.datetime.now().isoformat()
+    _question_bank_report = report
+    print(f"Question bank report: {question_dedup.summarize(report)}")
+    diff = report.get('diff')
+    if diff and diff['answer_changed']:
+        print(f"Warning: {len(diff['answer_changed'])} questions changed their answer or type; "
+              f"exam records keep the old version, practice and wrong-question views use the new one")
+
+def _load_question_layouts():
+    global _question_layouts
+    if _question_layouts is None:
+        layouts = None
+        if os.path.exists(QUESTION_LAYOUTS_FILE):
+            try:
+                with open(QUESTION_LAYOUTS_FILE, 'r', encoding='utf-8') as f:
+                    layouts = json.load(f)
+            except Exception as e:
+                print(f"Warning: Failed to load question layouts: {e}")
+        if layouts is None:
+            layouts = db_load_json(QUESTION_LAYOUTS_KEY)
+        _question_layouts = layouts or {}
+    return _question_layouts
+
+def register_question_layout(layout):
+    """登记题库布局（位图持久化前必须已登记）"""
+    layouts = _load_question_layouts()
+    if layout.layout_id in layouts:
+        return
+    layouts[layout.layout_id] = list(layout.ids)
+    try:
+        os.makedirs(os.path.dirname(QUESTION_LAYOUTS_FILE) or '.', exist_ok=True)
+        temp_file = f"{QUESTION_LAYOUTS_FILE}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(layouts, f)
+        os.replace(temp_file, QUESTION_LAYOUTS_FILE)
+    except Exception as e:
+        print(f"Warning: Failed to save question layouts: {e}")
+    db_save_json(QUESTION_LAYOUTS_KEY, layouts)
+
+def lookup_question_layout(layout_id):
+    ids = _load_question_layouts().get(layout_id)
+    return QuestionLayout(ids) if ids is not None else None
+
+def _load_question_archive():
+    """题库版本存档：{'versions': [被替换的版本, ...], 'changed': {版本: {题目ID: 该版本中的题目}}}
+
+    changed[v] 只保存 v 与其下一个版本之间被修改或删除的题目。
+    """
+    global _question_archive
+    if _question_archive is None:
+        archive = None
+        if os.path.exists(QUESTION_ARCHIVE_FILE):
+            try:
+                with open(QUESTION_ARCHIVE_FILE, 'r', encoding='utf-8') as f:
+                    archive = json.load(f)
+            except Exception as e:
+                print(f"Warning: Failed to load question archive: {e}")
+        if archive is None:
+            archive = db_load_json(QUESTION_ARCHIVE_KEY)
+        archive = archive or {}
+        archive.setdefault('versions', [])
+        archive.setdefault('changed', {})
+        _question_archive = archive
+    return _question_archive
+
+def archive_question_bank(previous, bank):
+    """题库替换时存档旧版本中被修改/删除的题目（在题库锁内调用）"""
+    archive = _load_question_archive()
+    if archive['versions'] and archive['versions'][-1] == previous.version:
+        return
+    changed = {str(q['id']): q for q in previous.questions if bank.get(q['id']) != q}
+    archive['changed'] = dict(archive['changed'])
+    archive['changed'][previous.version] = changed
+    archive['versions'] = archive['versions'] + [previous.version]
+    try:
+        os.makedirs(os.path.dirname(QUESTION_ARCHIVE_FILE) or '.', exist_ok=True)
+        temp_file = f"{QUESTION_ARCHIVE_FILE}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(archive, f, ensure_ascii=False)
+        os.replace(temp_file, QUESTION_ARCHIVE_FILE)
+    except Exception as e:
+        print(f"Warning: Failed to save question archive: {e}")
+    db_save_json(QUESTION_ARCHIVE_KEY, archive)
+    print(f"Question bank {previous.version[:12]} archived: {len(changed)} questions changed or removed")
+
+def archived_question(version, question_id, bank):
+    """题目在指定题库版本中的内容：从该版本起沿版本链找第一份存档，都没有则与当前题库相同"""
+    if version is None or version == bank.version:
+        return bank.get(question_id)
+    archive = _load_question_archive()
+    versions = archive['versions']
+    try:
+        # 题库改回旧内容时同一版本可能出现多次，从最后一次开始即可（同一版本内容相同）
+        start = len(versions) - 1 - versions[::-1].index(version)
+    except ValueError:
+        return bank.get(question_id)
+    key = str(question_id)
+    changed = archive['changed']
+    for later in versions[start:]:
+        question = changed.get(later, {}).get(key)
+        if question is not None:
+            return question
+    return bank.get(question_id)
+
+def get_question_difficulty():
+    """全站题目难度计数器；后台加载完成前返回空计数器"""
+    stats = _question_difficulty
+    return stats if stats is not None else question_difficulty.DifficultyStats()
+
+def _load_question_difficulty():
+    """启动时在后台加载难度计数：文件/数据库都没有时从用户历史重建；加载期间记下的作答随后补记"""
+    global _question_difficulty
+    data = None
+    if os.path.exists(QUESTION_DIFFICULTY_FILE):
         try:
-            with open(QUESTIONS_FILE, 'r', encoding='utf-8') as f:
+            with open(QUESTION_DIFFICULTY_FILE, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-            _questions_cache = data['questions']
-            _questions_cache_time = current_time
-            print(f"Questions loaded from JSON: {len(_questions_cache)} questions")
-            return _questions_cache
-        except Exception as e2:
-            print(f"Error loading questions: {e2}")
-            # 如果加载失败但有缓存，返回缓存
-            if _questions_cache is not None:
-                return _questions_cache
-            # 否则返回空列表
-            return []
+        except Exception as e:
+            print(f"Warning: Failed to load question difficulty stats: {e}")
+    if data is None:
+        data = db_load_json(QUESTION_DIFFICULTY_KEY)
+    if data:
+        stats = question_difficulty.DifficultyStats.from_json(data)
+    else:
+        stats = rebuild_question_difficulty(swap=False)
+    with _question_difficulty_lock:
+        stats.record(_difficulty_pending)
+        _difficulty_pending.clear()
+        _question_difficulty = stats
+    if not data:
+        save_question_difficulty(stats, force=True)
+
+def _iter_all_user_data():
+    """依次产出包含全部用户的数据块（per_user 模式逐个加载用户，其余模式整体加载一次）"""
+    if USER_STORAGE_MODE == 'per_user' and not WRITE_BEHIND:
+        for uid in _row_user_ids():
+            yield load_user_data(uid)
+    else:
+        yield load_user_data()
+
+def _difficulty_histories():
+    """逐个用户提取重建难度统计所需的历史"""
+    for data in _iter_all_user_data():
+        for uid in _user_ids_in(data):
+            user = data['users'].get(uid) or {}
+            yield question_difficulty.user_history(
+                user.get('answered_questions') or (),
+                {qid: entry.get('count', 0) for qid, entry in (data['wrong_questions'].get(uid) or {}).items()},
+                data['exam_records'].get(uid) or []
+            )
+
+def rebuild_question_difficulty(swap=True):
+    """从全部用户历史重新统计难度（进程池并行），swap=True 时替换当前计数器并保存
+
+    重建期间记到旧计数器上的作答以历史记录为准（不再补记）。
+    """
+    global _question_difficulty
+    started = time.time()
+    stats = question_difficulty.rebuild(_difficulty_histories(), workers=DIFFICULTY_REBUILD_WORKERS)
+    print(f"Question difficulty rebuilt: {len(stats)} questions in {time.time() - started:.2f}s")
+    if swap:
+        with _question_difficulty_lock:
+            _question_difficulty = stats
+        save_question_difficulty(stats, force=True)
+    return stats
+
+def save_question_difficulty(stats=None, force=False):
+    """把难度计数写入文件与数据库（没有变化时跳过）"""
+    stats = stats or _question_difficulty
+    if stats is None or not (force or stats.dirty):
+        return False
+    revision, data = stats.snapshot()
+    try:
+        os.makedirs(os.path.dirname(QUESTION_DIFFICULTY_FILE) or '.', exist_ok=True)
+        temp_file = f"{QUESTION_DIFFICULTY_FILE}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(temp_file, QUESTION_DIFFICULTY_FILE)
+    except Exception as e:
+        print(f"Warning: Failed to save question difficulty stats: {e}")
+    db_save_json(QUESTION_DIFFICULTY_KEY, data)
+    stats.mark_saved(revision)
+    return True
+
+def record_question_difficulty(outcomes):
+    """累加一批作答 [(题目ID, 是否答对)] 的全站计数，由后台线程定期落盘"""
+    global _difficulty_flush_worker
+    if not outcomes:
+        return
+    with _question_difficulty_lock:
+        if _question_difficulty is None:
+            _difficulty_pending.extend(outcomes)
+        else:
+            _question_difficulty.record(outcomes)
+    if _difficulty_flush_worker is None or not _difficulty_flush_worker.is_alive():
+        _difficulty_flush_worker = threading.Thread(target=_difficulty_flush_loop, name='difficulty-flush', daemon=True)
+        _difficulty_flush_worker.start()
+
+def _difficulty_flush_loop():
+    while True:
+        time.sleep(DIFFICULTY_FLUSH_INTERVAL)
+        try:
+            save_question_difficulty()
+        except Exception as e:
+            print(f"Question difficulty flush failed: {e}")
+
+# ===== 群组排行榜 =====
+def _user_cohorts(profile):
+    """用户所在的群组：全站、注册月份，以及用户自己填写的群组（班级/团队）"""
+    cohorts = ['all']
+    created = (profile or {}).get('created_time') or ''
+    if len(created) >= 7:
+        cohorts.append(f"month:{created[:7]}")
+    if (profile or {}).get('cohort'):
+        cohorts.append(f"group:{profile['cohort']}")
+    return cohorts
+
+def _cohort_label(cohort):
+    if cohort == 'all':
+        return '全站'
+    kind, _, name = cohort.partition(':')
+    return f"{name} 注册" if kind == 'month' else name
+
+def _leaderboard_metrics(user_data, user_id, exams=True):
+    """用户的排行指标：已做题数；exams=True 时另算已完成考试的平均分与最高分"""
+    user = user_data['users'].get(user_id) or {}
+    metrics = {'answered': len(user.get('answered_questions') or ())}
+    if exams:
+        scores = [record.get('total_score', 0) for record in user_data['exam_records'].get(user_id) or []
+                  if record.get('status') == 'completed']
+        metrics['exam_avg'] = round(sum(scores) / len(scores), 2) if scores else None
+        metrics['best_score'] = max(scores) if scores else None
+    return metrics
+
+def get_leaderboard():
+    """群组排行榜；后台加载完成前返回 None"""
+    return _leaderboard
+
+def _load_leaderboard():
+    """启动时在后台加载排行榜：文件/数据库都没有时扫描全部用户重建；加载期间的更新随后补上"""
+    global _leaderboard
+    data = None
+    if os.path.exists(LEADERBOARD_FILE):
+        try:
+            with open(LEADERBOARD_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Warning: Failed to load leaderboard: {e}")
+    if data is None:
+        data = db_load_json(LEADERBOARD_KEY)
+    service = LeaderboardService.from_json(data) if data else rebuild_leaderboard(swap=False)
+    with _leaderboard_lock:
+        for user_id, cohorts, metrics in _leaderboard_pending:
+            service.update(user_id, cohorts, metrics)
+        _leaderboard_pending.clear()
+        _leaderboard = service
+    if not data:
+        save_leaderboard(service, force=True)
+
+def rebuild_leaderboard(swap=True):
+    """扫描全部用户重建排行榜，swap=True 时替换当前排行榜并保存"""
+    global _leaderboard
+    started = time.time()
+    service = LeaderboardService()
+    for data in _iter_all_user_data():
+        for uid in _user_ids_in(data):
+            if uid in data['users'] and uid in data['user_profiles']:
+                service.update(uid, _user_cohorts(data['user_profiles'][uid]), _leaderboard_metrics(data, uid))
+    print(f"Leaderboard rebuilt: {len(service)} users in {time.time() - started:.2f}s")
+    if swap:
+        with _leaderboard_lock:
+            _leaderboard = service
+        save_leaderboard(service, force=True)
+    return service
+
+def save_leaderboard(service=None, force=False):
+    """把排行榜（各用户的群组与指标值）写入文件与数据库（没有变化时跳过）"""
+    service = service or _leaderboard
+    if service is None or not (force or service.dirty):
+        return False
+    revision, data = service.snapshot()
+    try:
+        os.makedirs(os.path.dirname(LEADERBOARD_FILE) or '.', exist_ok=True)
+        temp_file = f"{LEADERBOARD_FILE}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temp_file, LEADERBOARD_FILE)
+    except Exception as e:
+        print(f"Warning: Failed to save leaderboard: {e}")
+    db_save_json(LEADERBOARD_KEY, data)
+    service.mark_saved(revision)
+    return True
+
+def update_leaderboard(user_data, user_id, exams=False):
+    """用户作答或考试结算后更新其所在群组的排行（O(log n)），由后台线程定期落盘"""
+    global _leaderboard_flush_worker
+    profile = user_data['user_profiles'].get(user_id)
+    cohorts = _user_cohorts(profile) if profile is not None else None
+    metrics = _leaderboard_metrics(user_data, user_id, exams)
+    with _leaderboard_lock:
+        if _leaderboard is None:
+            _leaderboard_pending.append((user_id, cohorts, metrics))
+        else:
+            _leaderboard.update(user_id, cohorts, metrics)
+    if _leaderboard_flush_worker is None or not _leaderboard_flush_worker.is_alive():
+        _leaderboard_flush_worker = threading.Thread(target=_leaderboard_flush_loop, name='leaderboard-flush', daemon=True)
+        _leaderboard_flush_worker.start()
+
+def _leaderboard_flush_loop():
+    while True:
+        time.sleep(LEADERBOARD_FLUSH_INTERVAL)
+        try:
+            save_leaderboard()
+        except Exception as e:
+            print(f"Leaderboard flush failed: {e}")
+
+def _question_watch_loop():
+    """轮询题库文件的 mtime/大小，变化时重新加载"""
+    while True:
+        time.sleep(QUESTIONS_WATCH_INTERVAL)
+        try:
+            stat = source_stat(QUESTIONS_FILE)
+        except OSError:
+            continue
+        bank = _question_bank
+        if bank is None or bank.source_stat != stat:
+            reload_question_bank()
+
+def load_question_bank():
+    """获取题库索引（首次调用时加载并启动文件监视线程）"""
+    global _question_watcher
+    bank = _question_bank
+    if bank is not None:
+        return bank
+    bank = reload_question_bank()
+    with _question_bank_lock:
+        if _question_watcher is None:
+            _question_watcher = threading.Thread(target=_question_watch_loop, name='question-watcher', daemon=True)
+            _question_watcher.start()
+    return bank
+
+def load_questions():
+    """加载题目数据（当前题库索引中的题目列表）"""
+    return load_question_bank().questions
+
+def _normalize_user_progress(user):
+    """标准化单个用户的做题进度：ID列表/位图字符串统一转换为 QuestionSet"""
+    bank = load_question_bank()
+    for field in ('answered_questions', 'wrong_questions', 'important_questions'):
+        if field in user and not isinstance(user[field], QuestionSet):
+            try:
+                user[field] = QuestionSet.decode(user[field], bank.layout, lookup_question_layout)
+            except Exception as e:
+                print(f"Error decoding {field}: {e}")
+                user[field] = bank.new_set()
+    if 'review' in user:
+        user['review'] = review_schedule.load_state(user['review'])
+    # JSON 往返后字典键变成字符串，统一为与题库一致的ID类型
+    if 'wrong_count' in user:
+        wrong_count = {}
+        for qid, count in user['wrong_count'].items():
+            qid = normalize_question_id(qid)
+            wrong_count[qid] = wrong_count.get(qid, 0) + count
+        user['wrong_count'] = wrong_count
+    aggregates = user.get('aggregates')
+    if aggregates:
+        wrong_last = {}
+        for qid, timestamp in aggregates.get('wrong_last', {}).items():
+            qid = normalize_question_id(qid)
+            wrong_last[qid] = max(timestamp, wrong_last.get(qid, timestamp))
+        aggregates['wrong_last'] = wrong_last
+    return user
 
 def normalize_user_data(data):
-    """标准化用户数据结构，将list转换为set"""
+    """标准化用户数据结构，将ID列表/位图字符串转换为 QuestionSet"""
     if not data or 'users' not in data:
         return data
     
     for user_id in data['users']:
-        user = data['users'][user_id]
-        # 将list转换为set
-        if 'answered_questions' in user and isinstance(user['answered_questions'], list):
-            user['answered_questions'] = set(user['answered_questions'])
-        if 'wrong_questions' in user and isinstance(user['wrong_questions'], list):
-            user['wrong_questions'] = set(user['wrong_questions'])
-        if 'important_questions' in user and isinstance(user['important_questions'], list):
-            # 规范化important_questions的ID类型
-            imp_list = user['important_questions']
-            norm_set = set()
-            for v in imp_list:
-                if isinstance(v, str) and v.isdigit():
-                    try:
-                        norm_set.add(int(v))
-                    except Exception:
-                        norm_set.add(v)
-                else:
-                    norm_set.add(v)
-            user['important_questions'] = norm_set
+        _normalize_user_progress(data['users'][user_id])
+    
+    wrong_records = data.get('wrong_questions') or {}
+    for user_id in wrong_records:
+        wrong_records[user_id] = _compact_wrong_records(wrong_records[user_id])
+    
+    bank = load_question_bank()
+    for records in (data.get('exam_records') or {}).values():
+        for record in records:
+            _compact_exam_record(record, bank)
     
     return data
 
-def load_user_data():
-    """加载用户数据"""
+def _compact_wrong_records(records):
+    """错题记录标准化为 {题目ID: {'count': 次数, 'recent': [[用户答案, 时间戳], ...]}}
+
+    旧格式（每次做错一条、复制题干与解析的记录列表）在这里迁移；题目文本在读取时从题库关联。
+    """
+    if isinstance(records, list):
+        compacted = {}
+        for record in records:
+            qid = normalize_question_id(record['question_id'])
+            entry = compacted.setdefault(qid, {'count': 0, 'recent': []})
+            entry['count'] += 1
+            entry['recent'].append([record.get('user_answer'), int(_parse_iso(record['timestamp']).timestamp())])
+            del entry['recent'][:-WRONG_RECENT_LIMIT]
+        return compacted
+    # JSON 往返后字典键变成字符串
+    return {normalize_question_id(qid): entry for qid, entry in (records or {}).items()}
+
+def _compact_exam_record(record, bank):
+    """考试记录只保存题目ID与题库版本；旧记录中嵌入的题目副本在这里迁移
+
+    与当前题库不一致（已修改或已删除）的题目保留副本到 question_overrides，历史成绩不受影响。
+    """
+    questions = record.pop('questions', None)
+    if questions is not None:
+        overrides = {}
+        for question in questions:
+            if bank.get(question['id']) != question:
+                overrides[str(question['id'])] = question
+        record['question_ids'] = [question['id'] for question in questions]
+        record.setdefault('bank_version', None if overrides else bank.version)
+        if overrides:
+            record['question_overrides'] = overrides
+    if record.get('wrong_answers'):
+        record['wrong_answers'] = [
+            {'question_id': wrong['question_id'], 'user_answer': wrong.get('user_answer')}
+            for wrong in record['wrong_answers']
+        ]
+    return record
+
+def _exam_question(record, question_id, bank):
+    """考试中的题目：记录自带的副本优先，其次按考试时的题库版本取，评分与展示都不受之后题库修改影响"""
+    overrides = record.get('question_overrides')
+    if overrides and str(question_id) in overrides:
+        return overrides[str(question_id)]
+    return archived_question(record.get('bank_version'), question_id, bank)
+
+def _exam_question_score(record, question):
+    """题目在该场考试中的分值：蓝图指定了题型分值时优先使用"""
+    return (record.get('type_scores') or {}).get(str(question['type']), question['score'])
+
+def _exam_questions(record, bank):
+    """按记录中的题目ID从题库取出试卷题目（题库中已不存在且无副本的题目跳过）"""
+    if 'questions' in record:
+        return record['questions']
+    questions = []
+    for qid in record.get('question_ids', []):
+        question = _exam_question(record, qid, bank)
+        if question is not None:
+            questions.append(question)
+    return questions
+
+def _exam_wrong_answers(record, bank):
+    """展开考试错题：记录中只有题目ID与作答，题干、答案、解析从题库关联"""
+    wrong_answers = []
+    for wrong in record.get('wrong_answers') or []:
+        if 'question_content' in wrong:
+            wrong_answers.append(wrong)
+            continue
+        question = _exam_question(record, wrong['question_id'], bank)
+        if question is None:
+            continue
+        wrong_answers.append({
+            'question_id': question['id'],
+            'user_answer': wrong.get('user_answer'),
+            'correct_answer': question['correct_answer'],
+            'question_content': question['content'],
+            'analysis': question['analysis'],
+            'type': question['type'],
+            'score': _exam_question_score(record, question)
+        })
+    return wrong_answers
+
+def _ensure_user_structure(user_data, user_id):
+    """确保用户数据结构完整"""
+    user = user_data['users'].setdefault(user_id, {})
+    bank = load_question_bank()
+    if 'answered_questions' not in user:
+        user['answered_questions'] = bank.new_set()
+    if 'wrong_questions' not in user:
+        user['wrong_questions'] = bank.new_set()
+    if 'important_questions' not in user:
+        user['important_questions'] = bank.new_set()
+    if 'wrong_count' not in user:
+        user['wrong_count'] = {}
+    
+    if user_id not in user_data['wrong_questions']:
+        user_data['wrong_questions'][user_id] = {}
+    
+    if user_id not in user_data['exam_records']:
+        user_data['exam_records'][user_id] = []
+    
+    if 'aggregates' not in user:
+        _rebuild_user_aggregates(user_data, user_id)
+    elif 'wrong_total' not in user['aggregates']:
+        user['aggregates']['wrong_total'] = sum(user['wrong_count'].values())
+    
+    if 'exam_index' not in user:
+        user['exam_index'] = sorted(
+            (_exam_summary(record) for record in user_data['exam_records'][user_id]),
+            key=_exam_summary_key
+        )
+
+def _exam_summary(record):
+    """考试列表展示用的摘要（不含题目与作答）"""
+    return {
+        'exam_id': record['exam_id'],
+        'start_time': record.get('start_time', ''),
+        'end_time': record.get('end_time'),
+        'status': record.get('status'),
+        'total_score': record.get('total_score', 0),
+        'blueprint': record.get('blueprint')
+    }
+
+def _exam_summary_key(summary):
+    return (summary['start_time'], summary['exam_id'])
+
+def _exam_index_position(index, key):
+    """二分查找：index 中第一个键 >= key 的位置"""
+    lo, hi = 0, len(index)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _exam_summary_key(index[mid]) < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def _index_exam(user, record):
+    """新增或更新考试摘要，摘要列表按 (开始时间, 考试ID) 升序保持有序"""
+    index = user.get('exam_index')
+    if index is None:
+        # 尚未建立索引：由 _ensure_user_structure 统一构建
+        return
+    summary = _exam_summary(record)
+    key = _exam_summary_key(summary)
+    pos = _exam_index_position(index, key)
+    if pos < len(index) and _exam_summary_key(index[pos]) == key:
+        index[pos] = summary
+    else:
+        index.insert(pos, summary)
+
+def _rebuild_user_aggregates(user_data, user_id):
+    """由错题记录与考试记录重建聚合统计（旧数据首次加载时执行一次，之后随作答增量更新）"""
+    user = user_data['users'][user_id]
+    wrong_count = {}
+    wrong_last = {}
+    for qid, entry in _compact_wrong_records(user_data['wrong_questions'].get(user_id)).items():
+        wrong_count[qid] = entry['count']
+        if entry['recent']:
+            wrong_last[qid] = datetime.datetime.fromtimestamp(entry['recent'][-1][1]).isoformat()
+    user['wrong_count'] = wrong_count
+    user['aggregates'] = {
+        'wrong_last': wrong_last,
+        'wrong_total': sum(wrong_count.values()),
+        'score_sum': sum(r.get('total_score', 0) for r in user_data['exam_records'].get(user_id, [])
+                         if r.get('status') == 'completed')
+    }
+
+def _record_wrong(user_data, user_id, question_id, user_answer, timestamp, sync_sampler=True):
+    """记录一次做错：错题聚合（次数 + 最近几次作答）与统计增量更新
+
+    sync_sampler=False（日志回放与压缩）时不改动内存中的错题抽样器。
+    """
+    entry = user_data['wrong_questions'][user_id].setdefault(question_id, {'count': 0, 'recent': []})
+    entry['count'] += 1
+    entry['recent'].append([user_answer, int(_parse_iso(timestamp).timestamp())])
+    del entry['recent'][:-WRONG_RECENT_LIMIT]
+    
+    user = user_data['users'][user_id]
+    user['wrong_count'][question_id] = user['wrong_count'].get(question_id, 0) + 1
+    aggregates = user.setdefault('aggregates', {'wrong_last': {}, 'wrong_total': 0, 'score_sum': 0})
+    aggregates['wrong_last'][question_id] = timestamp
+    if sync_sampler:
+        _sync_wrong_sampler(user_id, question_id, entry, aggregates.get('wrong_total'))
+    aggregates['wrong_total'] = aggregates.get('wrong_total', 0) + 1
+
+def _sync_wrong_sampler(user_id, question_id, entry, wrong_total):
+    """已建好的错题抽样器只更新这一道题；与用户数据不同步（如其他进程写入）时丢弃，下次抽样重建
+
+    wrong_total 为本次做错之前用户的错题总次数。
+    """
+    with _wrong_samplers_lock:
+        sampler = _wrong_samplers.get(user_id)
+        if sampler is None:
+            return
+        question = load_question_bank().get(question_id)
+        if sampler.wrong_total == wrong_total and question is not None:
+            sampler.update(question_id, question['type'], entry['count'], entry['recent'][-1][1])
+            sampler.wrong_total += 1
+        else:
+            del _wrong_samplers[user_id]
+
+def load_user_data(user_id=None):
+    """加载用户数据（per_user/journal 模式下传入 user_id 时只返回该用户）"""
+    if USER_STORAGE_MODE == 'journal':
+        state = _journal_load_state()
+        if user_id is None:
+            return state
+        return {key: ({user_id: state[key][user_id]} if user_id in state[key] else {})
+                for key in USER_ROW_SECTIONS.values()}
+    if WRITE_BEHIND:
+        return _resident_view(user_id)
+    if USER_STORAGE_MODE == 'per_user':
+        return normalize_user_data(_load_user_rows(user_id))
+    return _load_blob_user_data()
+
+def _load_blob_user_data():
+    """从整体存储（数据库 user_data 键 / 持久化卷 / 本地文件）加载用户数据"""
     # 优先从数据库读取（如已配置）
     db_data = db_load_json('user_data')
     
@@ -200,7 +1439,7 @@ def load_user_data():
                 with open(persistent_file, 'r', encoding='utf-8') as f:
                     file_data = json.load(f)
                     # 若DB可用但暂无数据，则用文件数据回填数据库
-                    if get_db_conn():
+                    if db_available():
                         db_save_json('user_data', file_data)
                         print("Synced persistent storage data to database")
                     return normalize_user_data(file_data)
@@ -213,7 +1452,7 @@ def load_user_data():
             try:
                 env_data_parsed = json.loads(env_data)
                 # 若DB可用，则用环境变量数据回填数据库
-                if get_db_conn():
+                if db_available():
                     db_save_json('user_data', env_data_parsed)
                     print("Synced environment variable data to database")
                 return normalize_user_data(env_data_parsed)
@@ -226,7 +1465,7 @@ def load_user_data():
                 with open(USER_DATA_FILE, 'r', encoding='utf-8') as f:
                     file_data = json.load(f)
                     # 若DB可用但暂无数据，则用文件数据回填数据库
-                    if get_db_conn():
+                    if db_available():
                         db_save_json('user_data', file_data)
                         print("Synced local file data to database")
                     return normalize_user_data(file_data)
@@ -241,20 +1480,58 @@ def load_user_data():
         'exam_records': {}
     }
 
-def save_user_data(data):
-    """保存用户数据"""
-    # 转换set为list以便JSON序列化
-    for user_id in data['users']:
-        if 'answered_questions' in data['users'][user_id]:
-            data['users'][user_id]['answered_questions'] = list(data['users'][user_id]['answered_questions'])
-        if 'wrong_questions' in data['users'][user_id]:
-            data['users'][user_id]['wrong_questions'] = list(data['users'][user_id]['wrong_questions'])
-        if 'important_questions' in data['users'][user_id]:
-            data['users'][user_id]['important_questions'] = list(data['users'][user_id]['important_questions'])
+def save_user_data(data, event=None):
+    """保存用户数据（per_user 模式下只写入 data 中包含的用户；journal 模式下只追加 event，可为事件列表）"""
+    global _user_stats_cache
+    if USER_STORAGE_MODE == 'journal':
+        user_ids = _user_ids_in(data)
+        state = _journal_load_state()
+        if data is not state:
+            # 请求视图中新建的条目（如注册、补全结构）并回内存数据
+            with _journal_lock:
+                for key in USER_ROW_SECTIONS.values():
+                    state[key].update(data.get(key) or {})
+        if isinstance(event, list):
+            events = event
+        elif event is not None:
+            events = [event]
+        else:
+            events = [journal_event('user', uid, sections={
+                section: data[key][uid] for section, key in USER_ROW_SECTIONS.items() if uid in data.get(key, {})
+            }) for uid in user_ids]
+        _journal_append(events)
+        for uid in user_ids:
+            _user_stats_cache.pop(uid, None)
+        return
+
+    if WRITE_BEHIND:
+        for uid in _mark_users_dirty(data):
+            _user_stats_cache.pop(uid, None)
+        return
+
+    if USER_STORAGE_MODE == 'per_user':
+        user_ids = _user_ids_in(data)
+        _save_user_rows(data, user_ids)
+        for uid in user_ids:
+            _user_stats_cache.pop(uid, None)
+        return
+
+    folded = _fold_expired_exams(data) | _fold_exam_sessions(data)
+    _save_blob_user_data(data)
+    # 清除用户统计缓存：有事件时只清除相关用户，否则全部清除
+    if event:
+        for item in (event if isinstance(event, list) else [event]):
+            _user_stats_cache.pop(item['u'], None)
+        for uid in folded:
+            _user_stats_cache.pop(uid, None)
+    else:
+        _user_stats_cache.clear()
 
+def _save_blob_user_data(data):
+    """整体写入用户数据（数据库 user_data 键 / 持久化卷 / 本地文件）"""
     # 优先保存到数据库（如已配置）
     db_saved = False
-    if get_db_conn():
+    if db_available():
         try:
             db_save_json('user_data', data)
             db_saved = True
@@ -269,7 +1546,7 @@ def save_user_data(data):
             persistent_file = '/data/user_data.json'
             os.makedirs('/data', exist_ok=True)
             with open(persistent_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+                json.dump(data, f, ensure_ascii=False, indent=2, default=_json_default)
             print(f"Data saved to persistent storage: {persistent_file}")
         except Exception as e:
             print(f"Warning: Failed to save to persistent storage: {e}")
@@ -283,7 +1560,7 @@ def save_user_data(data):
             # 先保存到临时文件，然后重命名（原子操作）
             temp_file = f"{USER_DATA_FILE}.tmp"
             with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+                json.dump(data, f, ensure_ascii=False, indent=2, default=_json_default)
             
             # 原子性地重命名文件
             os.replace(temp_file, USER_DATA_FILE)
@@ -294,17 +1571,13 @@ def save_user_data(data):
             # 如果保存失败，尝试直接保存
             try:
                 with open(USER_DATA_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+                    json.dump(data, f, ensure_ascii=False, indent=2, default=_json_default)
             except Exception as e2:
                 print(f"Critical error: Failed to save user_data: {e2}")
     
     # 如果数据库保存失败且不在Railway环境，记录警告
     if not db_saved and not IS_RAILWAY:
         print("Warning: Database not available, data only saved to local file")
-    
-    # 清除所有用户统计缓存（数据已更新）
-    global _user_stats_cache
-    _user_stats_cache.clear()
 
 def get_client_ip():
     """获取客户端IP"""
@@ -337,27 +1610,16 @@ def require_login(f):
 
 def get_user_data():
     """获取当前用户数据"""
-    user_data = load_user_data()
     user_id = session.get('user_id')
+    if not user_id:
+        return None, None
+    user_data = load_user_data(user_id)
     
     if not user_id or user_id not in user_data['users']:
         return None, None
     
     # 确保用户数据结构完整
-    if 'answered_questions' not in user_data['users'][user_id]:
-        user_data['users'][user_id]['answered_questions'] = set()
-    if 'wrong_questions' not in user_data['users'][user_id]:
-        user_data['users'][user_id]['wrong_questions'] = set()
-    if 'important_questions' not in user_data['users'][user_id]:
-        user_data['users'][user_id]['important_questions'] = set()
-    if 'wrong_count' not in user_data['users'][user_id]:
-        user_data['users'][user_id]['wrong_count'] = {}
-    
-    if user_id not in user_data['wrong_questions']:
-        user_data['wrong_questions'][user_id] = []
-    
-    if user_id not in user_data['exam_records']:
-        user_data['exam_records'][user_id] = []
+    _ensure_user_structure(user_data, user_id)
     
     return user_data, user_id
 
@@ -371,23 +1633,41 @@ def _parse_iso(ts: str):
         except Exception:
             return datetime.datetime.now()
 
-# 辅助函数：按考试记录中的 answers 评分并完成考试
-def _finalize_exam_from_record(user_data, user_id, exam_record):
+# 辅助函数：记录一次练习作答（提交答案与日志回放共用）
+def _apply_answer(user_data, user_id, question, user_answer, is_correct, timestamp, sync_sampler=True):
+    question_id = question['id']
+    user = user_data['users'][user_id]
+    # 只有在题目未被标记为已做时才添加（避免在未做题库模式下重复添加）
+    if question_id not in user['answered_questions']:
+        user['answered_questions'].add(question_id)
+    
+    if not is_correct:
+        user['wrong_questions'].add(question_id)
+        _record_wrong(user_data, user_id, question_id, user_answer, timestamp, sync_sampler)
+    
+    # 复习模式按 SM-2 重新调度该题（日志回放时按原作答时间计算，结果一致）
+    review_schedule.record_review(
+        user.setdefault('review', review_schedule.new_state()),
+        question_id, question['type'], is_correct, _parse_iso(timestamp).timestamp()
+    )
+
+# 辅助函数：按 exam_id 查找考试记录
+def _find_exam_record(user_data, user_id, exam_id):
+    for record in user_data['exam_records'].get(user_id, []):
+        if record.get('exam_id') == exam_id:
+            return record
+    return None
+
+# 辅助函数：按考试记录中的 answers 评分，并把结果写入记录与用户进度（不保存）
+def _grade_exam_record(user_data, user_id, exam_record, end_time, sync_sampler=True):
     answers = exam_record.get('answers', {}) or {}
+    bank = load_question_bank()
     total_score = 0
     wrong_answers = []
-    for question in exam_record['questions']:
+    for question in _exam_questions(exam_record, bank):
         qid = question['id']
-        user_answer = answers.get(str(qid), '')
+        user_answer, is_correct = bank.grade(question, answers.get(str(qid), ''))
         correct_answer = question['correct_answer']
-        if question['type'] == 2:
-            if isinstance(user_answer, str):
-                user_answer = [user_answer] if user_answer else []
-            elif user_answer is None:
-                user_answer = []
-            is_correct = set(correct_answer.split(',')) == set(user_answer)
-        else:
-            is_correct = user_answer == correct_answer
 
         is_unanswered = (
             (question['type'] == 2 and (not user_answer)) or
@@ -395,7 +1675,7 @@ def _finalize_exam_from_record(user_data, user_id, exam_record):
         )
 
         if is_correct:
-            total_score += question['score']
+            total_score += _exam_question_score(exam_record, question)
             user_data['users'][user_id]['answered_questions'].add(qid)
         else:
             wrong_answers.append({
@@ -405,30 +1685,326 @@ def _finalize_exam_from_record(user_data, user_id, exam_record):
                 'question_content': question['content'],
                 'analysis': question['analysis'],
                 'type': question['type'],
-                'score': question['score']
+                'score': _exam_question_score(exam_record, question)
             })
             if not is_unanswered:
                 user_data['users'][user_id]['wrong_questions'].add(qid)
                 user_data['users'][user_id]['answered_questions'].add(qid)
-                wrong_record = {
-                    'question_id': qid,
-                    'user_answer': user_answer,
-                    'correct_answer': correct_answer,
-                    'timestamp': datetime.datetime.now().isoformat(),
-                    'question_content': question['content'],
-                    'analysis': question['analysis'],
-                    'type': question['type']
-                }
-                user_data['wrong_questions'][user_id].append(wrong_record)
-                if qid not in user_data['users'][user_id]['wrong_count']:
-                    user_data['users'][user_id]['wrong_count'][qid] = 0
-                user_data['users'][user_id]['wrong_count'][qid] += 1
-
-    exam_record['end_time'] = datetime.datetime.now().isoformat()
+                _record_wrong(user_data, user_id, qid, user_answer, end_time, sync_sampler)
+
+    aggregates = user_data['users'][user_id].setdefault('aggregates', {'wrong_last': {}, 'score_sum': 0})
+    if exam_record.get('status') == 'completed':
+        aggregates['score_sum'] -= exam_record.get('total_score', 0)
+    aggregates['score_sum'] += total_score
+    exam_record['end_time'] = end_time
     exam_record['status'] = 'completed'
     exam_record['total_score'] = total_score
-    exam_record['wrong_answers'] = wrong_answers
-    save_user_data(user_data)
+    # 记录中只保存题目ID与作答
+    exam_record['wrong_answers'] = [
+        {'question_id': wrong['question_id'], 'user_answer': wrong['user_answer']} for wrong in wrong_answers
+    ]
+    _index_exam(user_data['users'][user_id], exam_record)
+    return total_score, wrong_answers
+
+# ===== 进行中考试的增量作答（/patch_exam_progress）=====
+# (user_id, exam_id) -> {'answers', 'seq', 'pending', 'touched', 'saved'}；pending 为尚未落盘的改动
+# blob 模式下后台线程不整体读写用户数据（会与请求的读-改-写交错，把已交卷的考试改回进行中），
+# 会话改动只留在内存中，由请求侧的下一次整体保存并入（见 _fold_exam_sessions）；
+# 增量保存本身每隔 EXAM_BLOB_SAVE_INTERVAL 才整体保存一次，交卷与离开页面时的整体保存照常立即写入
+_exam_sessions = {}
+_exam_sessions_lock = threading.Lock()
+_exam_flush_worker = None
+
+def _apply_answer_changes(answers, changes):
+    """合并增量作答：值为 None 或空表示清除该题作答"""
+    for qid, answer in changes.items():
+        if answer is None or answer == '' or answer == []:
+            answers.pop(str(qid), None)
+        else:
+            answers[str(qid)] = answer
+
+def _exam_session(user_id, record):
+    """取（或由考试记录建立）考试会话，调用方需持有 _exam_sessions_lock"""
+    global _exam_flush_worker
+    key = (user_id, record['exam_id'])
+    exam_session = _exam_sessions.get(key)
+    if exam_session is None:
+        exam_session = {
+            'answers': dict(record.get('answers') or {}),
+            'seq': record.get('answers_seq', 0),
+            'pending': {},
+            'touched': time.time(),
+            'saved': time.time()
+        }
+        _exam_sessions[key] = exam_session
+        if _exam_flush_worker is None or not _exam_flush_worker.is_alive():
+            _exam_flush_worker = threading.Thread(target=_exam_flush_loop, name='exam-autosave', daemon=True)
+            _exam_flush_worker.start()
+    return exam_session
+
+def _merge_exam_session(user_id, record, close=False):
+    """把会话中尚未落盘的作答并入考试记录；close=True 时（交卷/结算）移除会话"""
+    key = (user_id, record.get('exam_id'))
+    with _exam_sessions_lock:
+        exam_session = _exam_sessions.pop(key, None) if close else _exam_sessions.get(key)
+        if exam_session is not None:
+            record['answers'] = dict(exam_session['answers'])
+            record['answers_seq'] = exam_session['seq']
+            exam_session['pending'] = {}
+    return record
+
+def _blob_whole_writes():
+    """blob 模式（未开启写回缓存）：每次保存都整体读写全部用户数据"""
+    return USER_STORAGE_MODE == 'blob' and not WRITE_BEHIND
+
+def _fold_exam_sessions(data):
+    """blob 模式整体保存前调用：把有改动的考试会话并入即将保存的数据，返回涉及的用户"""
+    timestamp = datetime.datetime.now().isoformat()
+    user_ids = set()
+    with _exam_sessions_lock:
+        for (user_id, exam_id), exam_session in _exam_sessions.items():
+            if not exam_session['pending'] or user_id not in (data.get('exam_records') or {}):
+                continue
+            record = _find_exam_record(data, user_id, exam_id)
+            if not record or record.get('status') != 'ongoing':
+                continue
+            record['answers'] = dict(exam_session['answers'])
+            record['answers_seq'] = exam_session['seq']
+            record['last_saved'] = timestamp
+            exam_session['pending'] = {}
+            exam_session['saved'] = time.time()
+            user_ids.add(user_id)
+    return user_ids
+
+def _fold_expired_exams(data):
+    """blob 模式整体保存前调用：结算排队中的超时考试，返回涉及的用户"""
+    with _exam_deadlines_cond:
+        queued = list(_expired_exam_queue)
+        _expired_exam_queue.clear()
+    user_ids = set()
+    for user_id, exam_id in queued:
+        if user_id not in (data.get('users') or {}):
+            # 保存的不是全部用户的数据：留给下一次保存
+            with _exam_deadlines_cond:
+                _expired_exam_queue.add((user_id, exam_id))
+            continue
+        _ensure_user_structure(data, user_id)
+        record = _find_exam_record(data, user_id, exam_id)
+        if record and record.get('status') == 'ongoing':
+            _close_exam_record(data, user_id, record)
+            user_ids.add(user_id)
+    if user_ids:
+        print(f"Finalized expired exams for {len(user_ids)} users")
+    return user_ids
+
+def _settle_expired_exams(user_data, user_id):
+    """blob 模式下读取考试记录前调用：该用户有排队中的超时考试时先结算并整体保存一次"""
+    if not _blob_whole_writes():
+        return
+    with _exam_deadlines_cond:
+        queued = any(queued_user == user_id for queued_user, _ in _expired_exam_queue)
+    if queued and _fold_expired_exams(user_data):
+        save_user_data(user_data)
+
+def _evict_idle_exam_sessions():
+    now = time.time()
+    with _exam_sessions_lock:
+        for key, exam_session in list(_exam_sessions.items()):
+            if not exam_session['pending'] and now - exam_session['touched'] > EXAM_SESSION_IDLE_SECONDS:
+                del _exam_sessions[key]
+
+def flush_exam_sessions(background=False):
+    """把有改动的考试会话写入考试记录（journal 模式下只追加增量事件）
+
+    blob 模式下后台线程（background=True）只回收空闲会话；退出时在主线程整体保存一次（同时结算排队的超时考试）。
+    """
+    if _blob_whole_writes():
+        _evict_idle_exam_sessions()
+        if background:
+            return 0
+        with _exam_sessions_lock:
+            pending = any(exam_session['pending'] for exam_session in _exam_sessions.values())
+        if not pending and not _expired_exam_queue:
+            return 0
+        data = load_user_data()
+        flushed = len(_fold_expired_exams(data) | _fold_exam_sessions(data))
+        if flushed:
+            save_user_data(data)
+        return flushed
+    now = time.time()
+    with _exam_sessions_lock:
+        batch = []
+        for key, exam_session in list(_exam_sessions.items()):
+            if exam_session['pending']:
+                batch.append((key, dict(exam_session['answers']), exam_session['pending'], exam_session['seq']))
+                exam_session['pending'] = {}
+            elif now - exam_session['touched'] > EXAM_SESSION_IDLE_SECONDS:
+                del _exam_sessions[key]
+    if not batch:
+        return 0
+    timestamp = datetime.datetime.now().isoformat()
+    flushed = 0
+    for (user_id, exam_id), answers, changes, seq in batch:
+        try:
+            user_data = load_user_data(user_id)
+            _ensure_user_structure(user_data, user_id)
+            record = _find_exam_record(user_data, user_id, exam_id)
+            if not record or record.get('status') != 'ongoing':
+                with _exam_sessions_lock:
+                    _exam_sessions.pop((user_id, exam_id), None)
+                continue
+            record['answers'] = answers
+            record['answers_seq'] = seq
+            record['last_saved'] = timestamp
+            save_user_data(user_data, event=journal_event(
+                'exam_patch', user_id, exam_id=exam_id, changes=changes, answers_seq=seq, ts=timestamp
+            ))
+            flushed += 1
+        except Exception as e:
+            print(f"Exam autosave flush failed for {user_id}/{exam_id}: {e}")
+            # 放回会话，下次重试
+            with _exam_sessions_lock:
+                exam_session = _exam_sessions.get((user_id, exam_id))
+                if exam_session is not None:
+                    exam_session['pending'] = {**changes, **exam_session['pending']}
+    return flushed
+
+def _exam_flush_loop():
+    while True:
+        time.sleep(EXAM_AUTOSAVE_FLUSH_INTERVAL)
+        try:
+            flush_exam_sessions(background=True)
+        except Exception as e:
+            print(f"Exam autosave flush failed: {e}")
+
+# ===== 超时考试的后台结算 =====
+# 最小堆：(截止时间戳, user_id, exam_id)；考试提前交卷后堆中条目保留，弹出时按状态跳过
+_exam_deadlines = []
+_exam_deadlines_cond = threading.Condition()
+_exam_scheduler = None
+# blob 模式下到期待结算的 (user_id, exam_id)：由请求侧的下一次整体保存结算（见 _fold_expired_exams），
+# 读取考试记录时也会先结算该用户的（见 _settle_expired_exams）
+_expired_exam_queue = set()
+
+def _exam_deadline(record):
+    return _parse_iso(record['start_time']).timestamp() + record.get('duration_seconds', 3600)
+
+def schedule_exam_expiry(user_id, record):
+    """登记进行中考试的截止时间"""
+    with _exam_deadlines_cond:
+        heapq.heappush(_exam_deadlines, (_exam_deadline(record), user_id, record['exam_id']))
+        _exam_deadlines_cond.notify()
+
+def _finalize_expired_exams(expired):
+    """结算一批超时考试：每个用户保存一次
+
+    blob 模式下后台线程不整体读写用户数据（会覆盖期间请求保存的交卷等结果），只把考试放入队列，
+    由请求侧的下一次整体保存结算，退出时也会结算一次。
+    """
+    if _blob_whole_writes():
+        with _exam_deadlines_cond:
+            _expired_exam_queue.update(expired)
+        return 0
+    by_user = {}
+    for user_id, exam_id in expired:
+        by_user.setdefault(user_id, []).append(exam_id)
+    finalized = 0
+    for user_id, exam_ids in by_user.items():
+        user_data = load_user_data(user_id)
+        if not user_data or user_id not in user_data['users']:
+            continue
+        _ensure_user_structure(user_data, user_id)
+        events = []
+        for exam_id in exam_ids:
+            record = _find_exam_record(user_data, user_id, exam_id)
+            if record and record.get('status') == 'ongoing':
+                events.append(_close_exam_record(user_data, user_id, record)[2])
+        if events:
+            save_user_data(user_data, event=events)
+        finalized += len(events)
+    if finalized:
+        print(f"Finalized {finalized} expired exams")
+    return finalized
+
+def _seed_exam_deadlines():
+    """启动时把所有进行中的考试登记到堆中（只扫描一次）"""
+    data = load_user_data()
+    count = 0
+    for user_id, records in (data.get('exam_records') or {}).items():
+        for record in records:
+            if record.get('status') == 'ongoing' and record.get('start_time'):
+                schedule_exam_expiry(user_id, record)
+                count += 1
+    if count:
+        print(f"Scheduled expiry for {count} ongoing exams")
+
+def _exam_scheduler_loop():
+    try:
+        _seed_exam_deadlines()
+    except Exception as e:
+        print(f"Failed to load ongoing exams for expiry: {e}")
+    while True:
+        with _exam_deadlines_cond:
+            while True:
+                now = time.time()
+                if _exam_deadlines and _exam_deadlines[0][0] + EXAM_EXPIRY_GRACE <= now:
+                    break
+                timeout = _exam_deadlines[0][0] + EXAM_EXPIRY_GRACE - now if _exam_deadlines else None
+                _exam_deadlines_cond.wait(timeout)
+            expired = []
+            while _exam_deadlines and _exam_deadlines[0][0] + EXAM_EXPIRY_GRACE <= now:
+                _, user_id, exam_id = heapq.heappop(_exam_deadlines)
+                expired.append((user_id, exam_id))
+        try:
+            _finalize_expired_exams(expired)
+        except Exception as e:
+            print(f"Exam expiry failed: {e}")
+
+def start_exam_scheduler():
+    global _exam_scheduler
+    if _exam_scheduler is None or not _exam_scheduler.is_alive():
+        _exam_scheduler = threading.Thread(target=_exam_scheduler_loop, name='exam-expiry', daemon=True)
+        _exam_scheduler.start()
+
+# 后台服务在处理第一个请求时启动：debug 模式下 Werkzeug 重载器的父进程只监视文件、不处理请求，
+# 导入时启动会多出一份后台线程，其中过时的难度计数与排行榜还会在退出时覆盖保存的数据
+_background_started = False
+_background_lock = threading.Lock()
+
+@app.before_request
+def start_background_services():
+    global _background_started
+    if _background_started:
+        return
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    if EXAM_EXPIRY_SCHEDULER:
+        start_exam_scheduler()
+    # 后台加载（或首次重建）全站题目难度统计与群组排行榜
+    threading.Thread(target=_load_question_difficulty, name='difficulty-load', daemon=True).start()
+    threading.Thread(target=_load_leaderboard, name='leaderboard-load', daemon=True).start()
+
+# 辅助函数：合并未落盘作答并评分，返回 (总分, 错题, 日志事件)，不保存
+def _close_exam_record(user_data, user_id, exam_record):
+    _merge_exam_session(user_id, exam_record, close=True)
+    end_time = datetime.datetime.now().isoformat()
+    first_close = exam_record.get('status') != 'completed'
+    total_score, wrong_answers = _grade_exam_record(user_data, user_id, exam_record, end_time)
+    if first_close:
+        record_question_difficulty(question_difficulty.exam_outcomes(exam_record))
+    update_leaderboard(user_data, user_id, exams=True)
+    event = journal_event(
+        'exam_finalize', user_id,
+        exam_id=exam_record['exam_id'], answers=exam_record.get('answers', {}), ts=end_time
+    )
+    return total_score, wrong_answers, event
+
+# 辅助函数：按考试记录中的 answers 评分并完成考试
+def _finalize_exam_from_record(user_data, user_id, exam_record):
+    total_score, wrong_answers, event = _close_exam_record(user_data, user_id, exam_record)
+    save_user_data(user_data, event=event)
     
     # 清除用户统计缓存（数据已更新）
     global _user_stats_cache
@@ -483,7 +2059,7 @@ def sync_data_sources():
     success = True
     
     # 同步到数据库
-    if get_db_conn():
+    if db_available():
         try:
             db_save_json('user_data', authoritative_data)
             print("✓ Synced to database")
@@ -497,7 +2073,7 @@ def sync_data_sources():
             persistent_file = '/data/user_data.json'
             os.makedirs('/data', exist_ok=True)
             with open(persistent_file, 'w', encoding='utf-8') as f:
-                json.dump(authoritative_data, f, ensure_ascii=False, indent=2, default=str)
+                json.dump(authoritative_data, f, ensure_ascii=False, indent=2, default=_json_default)
             print("✓ Synced to Railway persistent storage")
         except Exception as e:
             print(f"✗ Failed to sync to Railway persistent storage: {e}")
@@ -508,7 +2084,7 @@ def sync_data_sources():
         try:
             os.makedirs(DATA_DIR, exist_ok=True)
             with open(USER_DATA_FILE, 'w', encoding='utf-8') as f:
-                json.dump(authoritative_data, f, ensure_ascii=False, indent=2, default=str)
+                json.dump(authoritative_data, f, ensure_ascii=False, indent=2, default=_json_default)
             print("✓ Synced to local file")
         except Exception as e:
             print(f"✗ Failed to sync to local file: {e}")
@@ -537,6 +2113,117 @@ def admin_sync_data():
         'message': 'Data synchronization completed' if success else 'Data synchronization failed'
     })
 
+@app.route('/admin/migrate_user_rows', methods=['POST'])
+def admin_migrate_user_rows():
+    """管理员接口：将整体 user_data 迁移为按用户存储（可强制重跑）"""
+    admin_token = request.headers.get('X-Admin-Token')
+    if admin_token != 'sync_2024':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    force = bool((request.get_json(silent=True) or {}).get('force', False))
+    migrated = migrate_user_data_to_rows(force=force)
+    return jsonify({'success': True, 'migrated_users': migrated})
+
+@app.route('/admin/write_behind_stats', methods=['GET'])
+def admin_write_behind_stats():
+    """管理员接口：延迟写队列深度与刷新耗时"""
+    admin_token = request.headers.get('X-Admin-Token')
+    if admin_token != 'sync_2024':
+        return jsonify({'error': 'Unauthorized'}), 401
+    return jsonify({'success': True, 'enabled': WRITE_BEHIND, 'stats': get_write_behind_stats()})
+
+@app.route('/admin/db_pool_stats', methods=['GET'])
+def admin_db_pool_stats():
+    """管理员接口：数据库连接池使用情况（借出/空闲/等待/已创建）"""
+    admin_token = request.headers.get('X-Admin-Token')
+    if admin_token != 'sync_2024':
+        return jsonify({'error': 'Unauthorized'}), 401
+    pool = init_db_pool()
+    if pool is None:
+        return jsonify({'success': False, 'message': 'Database is not configured or unavailable'})
+    return jsonify({'success': True, 'stats': pool.stats()})
+
+@app.route('/admin/question_report', methods=['GET'])
+def admin_question_report():
+    """管理员接口：当前题库的近似重复簇与上一版本的差异（题库加载时后台生成）"""
+    admin_token = request.headers.get('X-Admin-Token')
+    if admin_token != 'sync_2024':
+        return jsonify({'error': 'Unauthorized'}), 401
+    if _question_bank_report is None:
+        return jsonify({'success': False, 'message': 'Report is not ready'})
+    return jsonify({'success': True, 'report': _question_bank_report})
+
+@app.route('/admin/rebuild_difficulty', methods=['POST'])
+def admin_rebuild_difficulty():
+    """管理员接口：从全部用户历史重新统计全站题目难度（进程池并行）"""
+    admin_token = request.headers.get('X-Admin-Token')
+    if admin_token != 'sync_2024':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    started = time.time()
+    stats = rebuild_question_difficulty()
+    return jsonify({'success': True, 'questions': len(stats), 'seconds': round(time.time() - started, 2)})
+
+@app.route('/admin/rebuild_leaderboard', methods=['POST'])
+def admin_rebuild_leaderboard():
+    """管理员接口：扫描全部用户重建群组排行榜"""
+    admin_token = request.headers.get('X-Admin-Token')
+    if admin_token != 'sync_2024':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    started = time.time()
+    service = rebuild_leaderboard()
+    return jsonify({'success': True, 'users': len(service), 'seconds': round(time.time() - started, 2)})
+
+@app.route('/admin/compact_journal', methods=['POST'])
+def admin_compact_journal():
+    """管理员接口：立即把日志折叠进快照（切换存储模式前使用）"""
+    admin_token = request.headers.get('X-Admin-Token')
+    if admin_token != 'sync_2024':
+        return jsonify({'error': 'Unauthorized'}), 401
+    if USER_STORAGE_MODE != 'journal':
+        return jsonify({'success': False, 'message': 'Journal mode is not enabled'})
+    
+    _journal_load_state()
+    compacted = compact_journal()
+    return jsonify({'success': True, 'compacted': compacted, 'seq': _journal_seq})
+
+def rewrite_user_data():
+    """把加载时完成格式转换的用户数据写回存储，返回处理的用户数
+
+    per_user 模式逐个用户加载、写回，内存中同时只有一个用户的数据。
+    """
+    if USER_STORAGE_MODE == 'journal':
+        user_data = _journal_load_state()
+        compact_journal(force=True)
+        return len(_user_ids_in(user_data))
+    if USER_STORAGE_MODE == 'per_user' and not WRITE_BEHIND:
+        user_ids = _row_user_ids()
+        for uid in user_ids:
+            save_user_data(load_user_data(uid))
+        return len(user_ids)
+    user_data = load_user_data()
+    save_user_data(user_data)
+    return len(_user_ids_in(user_data))
+
+@app.route('/admin/migrate_wrong_records', methods=['POST'])
+def admin_migrate_wrong_records():
+    """管理员接口：把旧格式错题记录一次性改写为紧凑格式（平时在加载时按需转换）"""
+    admin_token = request.headers.get('X-Admin-Token')
+    if admin_token != 'sync_2024':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify({'success': True, 'users': rewrite_user_data()})
+
+@app.route('/admin/migrate_exam_records', methods=['POST'])
+def admin_migrate_exam_records():
+    """管理员接口：把嵌入完整题目的旧考试记录改写为题目ID引用（平时在加载时按需转换）"""
+    admin_token = request.headers.get('X-Admin-Token')
+    if admin_token != 'sync_2024':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify({'success': True, 'users': rewrite_user_data()})
+
 @app.route('/')
 def index():
     """主页"""
@@ -553,7 +2240,10 @@ def login():
         username = data.get('username')
         password = data.get('password')
         
-        user_data = load_user_data()
+        if not username:
+            return jsonify({'success': False, 'message': '用户名不存在'})
+        
+        user_data = load_user_data(username)
         
         # 检查用户名是否存在
         if username not in user_data['user_profiles']:
@@ -573,7 +2263,9 @@ def login():
         user_data['user_profiles'][username]['last_ip'] = get_client_ip()
         user_data['user_profiles'][username]['last_user_agent'] = get_user_agent()
         
-        save_user_data(user_data)
+        save_user_data(user_data, event=journal_event(
+            'profile', username, profile=user_data['user_profiles'][username]
+        ))
         
         return jsonify({'success': True, 'message': '登录成功'})
     
@@ -587,6 +2279,7 @@ def register():
         username = data.get('username')
         password = data.get('password')
         confirm_password = data.get('confirm_password')
+        cohort = (data.get('cohort') or '').strip()
         
         # 验证输入
         if not username or not password:
@@ -601,7 +2294,10 @@ def register():
         if password != confirm_password:
             return jsonify({'success': False, 'message': '两次输入的密码不一致'})
         
-        user_data = load_user_data()
+        if len(cohort) > COHORT_NAME_MAX:
+            return jsonify({'success': False, 'message': f'群组名称最多{COHORT_NAME_MAX}个字符'})
+        
+        user_data = load_user_data(username)
         
         # 检查用户名是否已存在
         if username in user_data['user_profiles']:
@@ -615,19 +2311,23 @@ def register():
             'last_ip': None,
             'last_user_agent': None
         }
+        if cohort:
+            user_data['user_profiles'][username]['cohort'] = cohort
         
         # 初始化用户数据
+        bank = load_question_bank()
         user_data['users'][username] = {
-            'answered_questions': set(),
-            'wrong_questions': set(),
+            'answered_questions': bank.new_set(),
+            'wrong_questions': bank.new_set(),
             'wrong_count': {},
-            'important_questions': set()
+            'important_questions': bank.new_set()
         }
         
-        user_data['wrong_questions'][username] = []
+        user_data['wrong_questions'][username] = {}
         user_data['exam_records'][username] = []
         
         save_user_data(user_data)
+        update_leaderboard(user_data, username, exams=True)
         
         return jsonify({'success': True, 'message': '注册成功，请登录'})
     
@@ -645,21 +2345,204 @@ def random_practice():
     """随机做题页面"""
     return render_template('random_practice.html')
 
+def _practice_type_filter(data):
+    """题型筛选参数（0/None=所有，1=单选，2=多选，3=判断）"""
+    type_filter = data.get('type_filter') or data.get('type') or 0
+    try:
+        return int(type_filter)
+    except (TypeError, ValueError):
+        return 0
+
+def _practice_topic(bank, data):
+    """主题筛选参数，返回 (主题ID, 主题位掩码, 错误信息)；未指定主题时前两项为 None"""
+    topic = data.get('topic')
+    if not topic or topic == 'all':
+        return None, None, None
+    index = question_topics.topic_index(bank, QUESTION_TOPICS_FILE)
+    topic_bits = index.mask(str(topic)) if index is not None else None
+    if topic_bits is None:
+        return None, None, '主题不存在，请刷新页面后重试'
+    return str(topic), topic_bits, None
+
+def _practice_permutation(bank, basis, seed):
+    """游标建立时未做题集合（编码后的位图 basis）按种子打乱的题库序号排列，首次用到时生成并缓存"""
+    key = (bank.layout.layout_id, basis, seed)
+    permutation = _practice_permutations.get(key)
+    if permutation is None:
+        permutation = list(QuestionSet.decode(basis, bank.layout).ordinals())
+        random.Random(seed).shuffle(permutation)
+        _practice_permutations[key] = permutation
+        if len(_practice_permutations) > PRACTICE_PERMUTATION_CACHE_SIZE:
+            _practice_permutations.popitem(last=False)
+    else:
+        _practice_permutations.move_to_end(key)
+    return permutation
+
+def _new_practice_cursor(bank, user, type_filter, topic_bits=None):
+    """新游标：只打乱当前未做的题（题型、主题位图与已做题位图求差）"""
+    basis = bank.type_mask(type_filter) & ~user['answered_questions'].rebased(bank.layout).bits
+    if topic_bits is not None:
+        basis &= topic_bits
+    return {
+        'layout': bank.layout.layout_id,
+        'seed': random.getrandbits(32),
+        'pos': 0,
+        'basis': QuestionSet(bank.layout, basis).encode()
+    }
+
+def _next_unanswered(bank, user, type_filter, count=1, topic=None, topic_bits=None):
+    """未做题模式：沿用户的乱序排列游标向后取 count 道未做的题
+
+    游标 {layout, seed, pos, basis} 按题型（指定主题时按 题型@主题）保存在 user['practice_cursors']；
+    basis 为游标建立时未做的题，排列只包含这些题，之后只需跳过游标建立后在其他模式中做过的题。
+    出题只推进游标，不再把题目标记为已做。
+    排列走完但仍有未做的题（出过但没作答）时按当前未做的题重新建立游标。
+    返回 (题目列表, 游标键, 需要保存的游标改动)：新建游标时为完整游标，否则只有 {'pos': 位置}。
+    """
+    if type_filter not in bank.by_type:
+        type_filter = 0
+    cursors = user.setdefault('practice_cursors', {})
+    key = f'{type_filter}@{topic}' if topic else str(type_filter)
+    cursor = cursors.get(key)
+    created = cursor is None or cursor.get('layout') != bank.layout.layout_id or 'basis' not in cursor
+    if created:
+        cursor = _new_practice_cursor(bank, user, type_filter, topic_bits)
+    answered = user['answered_questions']
+    questions = []
+    reshuffled = False
+    while len(questions) < count:
+        permutation = _practice_permutation(bank, cursor['basis'], cursor['seed'])
+        pos = cursor['pos']
+        while pos < len(permutation) and len(questions) < count:
+            question = bank.questions[permutation[pos]]
+            pos += 1
+            if question['id'] not in answered:
+                questions.append(question)
+        cursor = dict(cursor, pos=pos)
+        if len(questions) == count or reshuffled:
+            break
+        reshuffled = created = True
+        cursor = _new_practice_cursor(bank, user, type_filter, topic_bits)
+    # 重新打乱后可能取到本批已出过的题
+    unique = list({question['id']: question for question in questions}.values())
+    if unique:
+        # 没有取到题时调用方不保存，游标保持不变（日志中只记录位置改动，内存与日志须一致）
+        cursors[key] = cursor
+    return unique, key, (cursor if created else {'pos': cursor['pos']})
+
+def _topic_members(bank, bits, keys, key=lambda qid: qid):
+    """位图 bits（题型与主题）与用户的一组题目 keys（按 key(题目ID) 查找）求交集，返回 keys 中的键
+
+    遍历两者中较小的一方，耗时与 min(主题题数, 用户题数) 成正比，不再逐个检查用户的全部题目。
+    """
+    if bits.bit_count() <= len(keys):
+        return [key(q['id']) for q in bank.questions_from_bits(bits) if key(q['id']) in keys]
+    members = []
+    for k in keys:
+        ordinal = bank.ordinal(k)
+        if ordinal is not None and bits >> ordinal & 1:
+            members.append(k)
+    return members
+
+def _draw_wrong_questions(bank, user_data, user_id, type_filter, count=1, topic_bits=None):
+    """错题模式：按做错次数与最后做错时间加权抽取最多 count 道错题（避开最近出过的题）"""
+    if type_filter not in bank.by_type:
+        type_filter = 0
+    total = user_data['users'][user_id]['aggregates'].get('wrong_total', 0)
+    with _wrong_samplers_lock:
+        sampler = _wrong_samplers.get(user_id)
+        if sampler is not None:
+            _wrong_samplers.move_to_end(user_id)
+        if sampler is None or sampler.layout_id != bank.layout.layout_id or sampler.wrong_total != total:
+            sampler = WrongSampler(
+                bank.layout.layout_id,
+                half_life_days=WRONG_SAMPLER_HALF_LIFE_DAYS,
+                avoid_last=WRONG_SAMPLER_AVOID_LAST,
+                recent=sampler.recent if sampler is not None else ()
+            )
+            for qid, entry in user_data['wrong_questions'][user_id].items():
+                question = bank.get(qid)
+                if question is not None and entry['recent']:
+                    sampler.update(question['id'], question['type'], entry['count'], entry['recent'][-1][1])
+            sampler.wrong_total = total
+            _wrong_samplers[user_id] = sampler
+            if len(_wrong_samplers) > WRONG_SAMPLER_CACHE_SIZE:
+                _wrong_samplers.popitem(last=False)
+        if topic_bits is None:
+            drawn = sampler.draw(random, type_filter, count)
+        else:
+            # 指定主题：只在该主题（与题型）内的错题中按同样的权重抽取
+            candidates = _topic_members(bank, bank.type_mask(type_filter) & topic_bits, sampler.types)
+            drawn = sampler.draw_among(random, candidates, count)
+    return [bank.get(qid) for qid in drawn]
+
+def _due_review_questions(bank, user, type_filter, count=1, topic_bits=None):
+    """复习模式：按到期时间取最多 count 道已到期的题，返回 (题目列表, 错误信息)"""
+    if type_filter not in bank.by_type:
+        type_filter = 0
+    state = user.get('review') or review_schedule.new_state()
+    if topic_bits is None:
+        def accept(key):
+            # 已从题库删除的题跳过，否则它们留在堆顶会挡住后面到期的题
+            return bank.ordinal(key) is not None
+
+        def type_of(key):
+            question = bank.get(key)
+            return question['type'] if question is not None else None
+        keys, next_due = review_schedule.due_questions(state, time.time(), type_filter, count, accept, type_of)
+    else:
+        # 指定主题：只查看主题（与题型）内有卡片的题，不逐个弹出堆中其他主题的条目
+        candidates = _topic_members(bank, bank.type_mask(type_filter) & topic_bits, state['cards'], str)
+        keys, next_due = review_schedule.due_among(state, candidates, time.time(), count)
+    questions = [question for question in (bank.get(key) for key in keys) if question is not None]
+    if questions:
+        return questions, None
+    if next_due is not None:
+        due_text = datetime.datetime.fromtimestamp(next_due).strftime('%Y-%m-%d %H:%M')
+        return [], f'暂无到期的复习题，下一道题将于 {due_text} 到期'
+    return [], '暂无复习题，请先在其他模式中练习'
+
+def _practice_candidates(bank, user_stats, mode, type_filter, topic_bits=None):
+    """按练习模式、题型与主题筛选可抽取的题目，返回 (题目列表, 错误信息)"""
+    # 模式与题型筛选都是位图按位运算
+    layout = bank.layout
+    if mode == 'unanswered':
+        mode_bits = layout.full_mask & ~user_stats['answered_questions'].rebased(layout).bits
+        if not mode_bits:
+            return None, '已刷完所有题库，请选择全量题库或者错题库进行练习'
+    elif mode == 'wrong':
+        mode_bits = user_stats['wrong_questions'].rebased(layout).bits
+        if not mode_bits:
+            return None, '暂无错题记录'
+    elif mode == 'important':
+        mode_bits = user_stats['important_questions'].rebased(layout).bits
+        if not mode_bits:
+            return None, '暂无重点题，请在题目详情中标记后再来试试'
+    else:
+        mode_bits = layout.full_mask
+    
+    # 按题型（与主题）筛选
+    mode_bits &= bank.type_mask(type_filter)
+    if topic_bits is not None:
+        mode_bits &= topic_bits
+    available_questions = bank.questions_from_bits(mode_bits)
+    if not available_questions:
+        return None, '所选题型暂无可用题目，请更换题型或模式'
+    return available_questions, None
+
 @app.route('/get_random_question', methods=['POST'])
 @require_login
 def get_random_question():
 	"""获取随机题目"""
 	data = request.get_json()
 	mode = data.get('mode', 'all')
-	# 新增：题型筛选（0/None=所有，1=单选，2=多选，3=判断）
-	type_filter = data.get('type_filter') or data.get('type') or 0
-	try:
-		type_filter = int(type_filter)
-	except (TypeError, ValueError):
-		type_filter = 0
+	type_filter = _practice_type_filter(data)
 	
-	# 使用缓存的题库数据
-	questions = load_questions()
+	# 使用缓存的题库索引
+	bank = load_question_bank()
+	topic, topic_bits, error = _practice_topic(bank, data)
+	if error:
+		return jsonify({'error': error})
 	user_data, user_id = get_user_data()
 	
 	if not user_data or not user_id:
@@ -670,42 +2553,31 @@ def get_random_question():
 	if not user_stats:
 		return jsonify({'error': '用户数据不存在'})
 	
-	answered = user_stats['answered_questions']
-	wrong_questions = user_stats['wrong_questions']
 	important_set = user_stats['important_questions']
-	
 	if mode == 'unanswered':
-		available_questions = [q for q in questions if q['id'] not in answered]
-		if not available_questions:
-			return jsonify({'error': '已刷完所有题库，请选择全量题库或者错题库进行练习'})
+		# 沿乱序排列的游标取下一道未做的题，只记录游标推进
+		served, cursor_key, cursor = _next_unanswered(bank, user_data['users'][user_id], type_filter, 1, topic, topic_bits)
+		if not served:
+			return jsonify({'error': _practice_candidates(bank, user_stats, mode, type_filter, topic_bits)[1] or '所选题型暂无可用题目，请更换题型或模式'})
+		question = served[0]
+		save_user_data(user_data, event=journal_event('cursor', user_id, k=cursor_key, cursor=cursor))
+	elif mode == 'review':
+		# 间隔重复：只出已到期的题，到期最早的优先
+		due, error = _due_review_questions(bank, user_data['users'][user_id], type_filter, 1, topic_bits)
+		if error:
+			return jsonify({'error': error})
+		question = due[0]
 	elif mode == 'wrong':
-		available_questions = [q for q in questions if q['id'] in wrong_questions]
-		if not available_questions:
-			return jsonify({'error': '暂无错题记录'})
-	elif mode == 'important':
-		available_questions = [q for q in questions if q['id'] in important_set]
-		if not available_questions:
-			return jsonify({'error': '暂无重点题，请在题目详情中标记后再来试试'})
+		# 做错次数多、最近做错的题优先
+		drawn = _draw_wrong_questions(bank, user_data, user_id, type_filter, 1, topic_bits)
+		if not drawn:
+			return jsonify({'error': _practice_candidates(bank, user_stats, mode, type_filter, topic_bits)[1] or '所选题型暂无可用题目，请更换题型或模式'})
+		question = drawn[0]
 	else:
-		available_questions = questions
-	
-	# 按题型筛选
-	if type_filter in (1, 2, 3):
-		available_questions = [q for q in available_questions if int(q.get('type', 0)) == type_filter]
-		if not available_questions:
-			return jsonify({'error': '所选题型暂无可用题目，请更换题型或模式'})
-	
-	question = random.choice(available_questions)
-	
-	# 如果是未做题库模式，立即将该题目标记为已做，避免重复
-	# 每道题都要保存，确保数据不丢失
-	if mode == 'unanswered':
-		user_data['users'][user_id]['answered_questions'].add(question['id'])
-		save_user_data(user_data)
-		# 清除用户统计缓存，确保下次获取时数据一致
-		global _user_stats_cache
-		if user_id in _user_stats_cache:
-			del _user_stats_cache[user_id]
+		available_questions, error = _practice_candidates(bank, user_stats, mode, type_filter, topic_bits)
+		if error:
+			return jsonify({'error': error})
+		question = random.choice(available_questions)
 	
 	return jsonify({
 		'id': question['id'],
@@ -725,56 +2597,29 @@ def submit_answer():
     question_id = data.get('question_id')
     user_answer = data.get('answer')  # 可能是字符串或列表
     
-    questions = load_questions()
-    question = next((q for q in questions if q['id'] == question_id), None)
+    bank = load_question_bank()
+    question = bank.get(question_id)
     
     if not question:
         return jsonify({'error': '题目不存在'})
+    question_id = question['id']
     
     user_data, user_id = get_user_data()
     
     if not user_data or not user_id:
         return jsonify({'error': '用户数据不存在'})
     
-    # 只有在题目未被标记为已做时才添加（避免在未做题库模式下重复添加）
-    if question_id not in user_data['users'][user_id]['answered_questions']:
-        user_data['users'][user_id]['answered_questions'].add(question_id)
-    
-    # 处理多选题答案
-    if question['type'] == 2:  # 多选题
-        # 确保user_answer是列表格式
-        if isinstance(user_answer, str):
-            user_answer = [user_answer] if user_answer else []
-        elif user_answer is None:
-            user_answer = []
-        
-        # 多选题答案比较
-        correct_answers = set(question['correct_answer'].split(','))
-        user_answers = set(user_answer)
-        is_correct = correct_answers == user_answers
-    else:
-        # 单选题和判断题
-        is_correct = user_answer == question['correct_answer']
+    # 评判答案（多选题按选项集合比较）
+    user_answer, is_correct = bank.grade(question, user_answer)
     
-    if not is_correct:
-        user_data['users'][user_id]['wrong_questions'].add(question_id)
-        
-        wrong_record = {
-            'question_id': question_id,
-            'user_answer': user_answer,
-            'correct_answer': question['correct_answer'],
-            'timestamp': datetime.datetime.now().isoformat(),
-            'question_content': question['content'],
-            'analysis': question['analysis'],
-            'type': question['type']
-        }
-        user_data['wrong_questions'][user_id].append(wrong_record)
-        
-        if question_id not in user_data['users'][user_id]['wrong_count']:
-            user_data['users'][user_id]['wrong_count'][question_id] = 0
-        user_data['users'][user_id]['wrong_count'][question_id] += 1
+    timestamp = datetime.datetime.now().isoformat()
+    _apply_answer(user_data, user_id, question, user_answer, is_correct, timestamp)
     
-    save_user_data(user_data)
+    save_user_data(user_data, event=journal_event(
+        'answer', user_id, q=question_id, a=user_answer, ok=is_correct, ts=timestamp
+    ))
+    record_question_difficulty([(question_id, is_correct)])
+    update_leaderboard(user_data, user_id)
     
     return jsonify({
         'is_correct': is_correct,
@@ -782,6 +2627,110 @@ def submit_answer():
         'analysis': question['analysis']
     })
 
+@app.route('/get_practice_batch', methods=['POST'])
+@require_login
+def get_practice_batch():
+    """批量取题：一次返回 count 道不重复的题目
+
+    不含答案与解析：前端攒够一批作答后用 /submit_answers 提交，由其返回的判题结果显示答案与解析。
+    """
+    data = request.get_json() or {}
+    mode = data.get('mode', 'all')
+    type_filter = _practice_type_filter(data)
+    try:
+        count = min(max(1, int(data.get('count', 10))), PRACTICE_BATCH_MAX)
+    except (TypeError, ValueError):
+        count = 10
+    
+    bank = load_question_bank()
+    topic, topic_bits, error = _practice_topic(bank, data)
+    if error:
+        return jsonify({'error': error})
+    user_data, user_id = get_user_data()
+    if not user_data or not user_id:
+        return jsonify({'error': '用户数据不存在'})
+    
+    user_stats = get_user_stats_cached(user_id)
+    if not user_stats:
+        return jsonify({'error': '用户数据不存在'})
+    
+    if mode == 'unanswered':
+        # 整批沿游标取题，只保存一次游标推进
+        questions, cursor_key, cursor = _next_unanswered(bank, user_data['users'][user_id], type_filter, count, topic, topic_bits)
+        if not questions:
+            return jsonify({'error': _practice_candidates(bank, user_stats, mode, type_filter, topic_bits)[1] or '所选题型暂无可用题目，请更换题型或模式'})
+        save_user_data(user_data, event=journal_event('cursor', user_id, k=cursor_key, cursor=cursor))
+    elif mode == 'review':
+        questions, error = _due_review_questions(bank, user_data['users'][user_id], type_filter, count, topic_bits)
+        if error:
+            return jsonify({'error': error})
+    elif mode == 'wrong':
+        questions = _draw_wrong_questions(bank, user_data, user_id, type_filter, count, topic_bits)
+        if not questions:
+            return jsonify({'error': _practice_candidates(bank, user_stats, mode, type_filter, topic_bits)[1] or '所选题型暂无可用题目，请更换题型或模式'})
+    else:
+        available_questions, error = _practice_candidates(bank, user_stats, mode, type_filter, topic_bits)
+        if error:
+            return jsonify({'error': error})
+        questions = random.sample(available_questions, min(count, len(available_questions)))
+    
+    important_set = user_stats['important_questions']
+    return jsonify({
+        'questions': [{
+            'id': question['id'],
+            'number': question.get('number'),
+            'content': question['content'],
+            'options': question['options'],
+            'type': question['type'],
+            'score': question['score'],
+            'is_important': (question['id'] in important_set)
+        } for question in questions]
+    })
+
+@app.route('/submit_answers', methods=['POST'])
+@require_login
+def submit_answers():
+    """批量提交答案：answers 为 [{question_id, answer}]，整批判题后只保存一次，返回每题的判题结果、答案与解析"""
+    data = request.get_json() or {}
+    answers = data.get('answers') or []
+    if not isinstance(answers, list):
+        return jsonify({'error': 'answers 必须是列表'})
+    if len(answers) > PRACTICE_BATCH_MAX:
+        return jsonify({'error': f'一次最多提交 {PRACTICE_BATCH_MAX} 道题'})
+    
+    user_data, user_id = get_user_data()
+    if not user_data or not user_id:
+        return jsonify({'error': '用户数据不存在'})
+    
+    bank = load_question_bank()
+    timestamp = datetime.datetime.now().isoformat()
+    results = []
+    events = []
+    for item in answers:
+        question = bank.get(item.get('question_id')) if isinstance(item, dict) else None
+        if not question:
+            results.append({'question_id': item.get('question_id') if isinstance(item, dict) else None, 'error': '题目不存在'})
+            continue
+        user_answer, is_correct = bank.grade(question, item.get('answer'))
+        _apply_answer(user_data, user_id, question, user_answer, is_correct, timestamp)
+        events.append(journal_event(
+            'answer', user_id, q=question['id'], a=user_answer, ok=is_correct, ts=timestamp
+        ))
+        results.append({
+            'question_id': question['id'],
+            'user_answer': user_answer,
+            'is_correct': is_correct,
+            'correct_answer': question['correct_answer'],
+            'analysis': question['analysis']
+        })
+    
+    if events:
+        save_user_data(user_data, event=events)
+        record_question_difficulty([(result['question_id'], result['is_correct']) for result in results if 'error' not in result])
+        update_leaderboard(user_data, user_id)
+    
+    return jsonify({'success': True, 'results': results})
+
 @app.route('/exam')
 @require_login
 def exam():
@@ -791,47 +2740,98 @@ def exam():
 @app.route('/start_exam', methods=['POST'])
 @require_login
 def start_exam():
-    """开始考试（如有未完成考试则恢复）"""
+    """开始考试（如有未完成考试则恢复）；可选参数 blueprint（考试类型）与 seed（复现同一份试卷）"""
+    data = request.get_json(silent=True) or {}
     user_data, user_id = get_user_data()
     # 若已有进行中的考试，先尝试恢复
+    events = []
     for record in reversed(user_data['exam_records'][user_id]):
         if record.get('status') == 'ongoing':
+            _merge_exam_session(user_id, record)
             # 计算剩余时间，默认60分钟
-            duration = record.get('duration_seconds', 3600)
-            elapsed = (datetime.datetime.now() - _parse_iso(record['start_time'])).total_seconds()
-            time_left = max(0, int(duration - elapsed))
+            time_left = max(0, int(_exam_deadline(record) - time.time()))
             if time_left <= 0:
-                _finalize_exam_from_record(user_data, user_id, record)
+                # 已超时但后台尚未结算：随新考试一起保存
+                events.append(_close_exam_record(user_data, user_id, record)[2])
                 break
             return jsonify({
                 'exam_id': record['exam_id'],
-                'questions': record['questions'],
+                'questions': _exam_questions(record, load_question_bank()),
                 'answers': record.get('answers', {}),
+                'seq': record.get('answers_seq', 0),
                 'time_left': time_left
             })
 
-    # 创建新考试
-    questions = load_questions()
-    single_choice = [q for q in questions if q['type'] == 1]
-    multi_choice = [q for q in questions if q['type'] == 2]
-    true_false = [q for q in questions if q['type'] == 3]
-    exam_questions = (
-        random.sample(single_choice, 50) +
-        random.sample(true_false, 50) +
-        random.sample(multi_choice, 50)
-    )
+    # 按蓝图组卷（默认 standard：单选50 + 判断50 + 多选50）
+    blueprint = EXAM_BLUEPRINTS.get(data.get('blueprint') or DEFAULT_BLUEPRINT)
+    if blueprint is None:
+        if events:
+            save_user_data(user_data, event=events)
+        return jsonify({'error': '考试类型不存在'})
+    seed = data.get('seed')
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    else:
+        try:
+            seed = int(seed)
+        except (TypeError, ValueError):
+            if events:
+                save_user_data(user_data, event=events)
+            return jsonify({'error': 'seed 必须是整数'})
+    exclude_ids = []
+    if blueprint.exclude_recent_exams:
+        for record in user_data['exam_records'][user_id][-blueprint.exclude_recent_exams:]:
+            exclude_ids.extend(record.get('question_ids') or [q['id'] for q in record.get('questions', [])])
+        exclude_ids = list(dict.fromkeys(exclude_ids))
+    bank = load_question_bank()
+    try:
+        exam_questions = blueprint.generate(bank, seed=seed, exclude_ids=exclude_ids)
+    except ValueError as e:
+        if events:
+            save_user_data(user_data, event=events)
+        return jsonify({'error': str(e)})
     exam_id = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
     exam_info = {
         'exam_id': exam_id,
         'start_time': datetime.datetime.now().isoformat(),
-        'questions': exam_questions,
+        'question_ids': [q['id'] for q in exam_questions],
+        'bank_version': bank.version,
+        'blueprint': blueprint.name,
+        'seed': seed,
         'status': 'ongoing',
         'answers': {},
-        'duration_seconds': 3600
+        'duration_seconds': blueprint.duration_seconds
     }
+    if exclude_ids:
+        # 试卷还取决于避开的题目：与 seed、题库版本一起即可复现
+        exam_info['excluded_ids'] = exclude_ids
+    if blueprint.type_scores():
+        exam_info['type_scores'] = blueprint.type_scores()
     user_data['exam_records'][user_id].append(exam_info)
-    save_user_data(user_data)
-    return jsonify({'exam_id': exam_id, 'questions': exam_questions, 'answers': {}, 'time_left': 3600})
+    _index_exam(user_data['users'][user_id], exam_info)
+    events.append(journal_event('exam_start', user_id, record=exam_info))
+    save_user_data(user_data, event=events)
+    if EXAM_EXPIRY_SCHEDULER:
+        schedule_exam_expiry(user_id, exam_info)
+    return jsonify({
+        'exam_id': exam_id,
+        'questions': exam_questions,
+        'answers': {},
+        'seq': 0,
+        'time_left': blueprint.duration_seconds,
+        'blueprint': blueprint.describe(bank)
+    })
+
+@app.route('/get_exam_blueprints', methods=['POST'])
+@require_login
+def get_exam_blueprints():
+    """可选的考试类型（蓝图）列表"""
+    bank = load_question_bank()
+    return jsonify({
+        'success': True,
+        'default': DEFAULT_BLUEPRINT,
+        'blueprints': [blueprint.describe(bank) for blueprint in EXAM_BLUEPRINTS.values()]
+    })
 
 @app.route('/submit_exam', methods=['POST'])
 @require_login
@@ -852,7 +2852,8 @@ def submit_exam():
     if not exam_record:
         return jsonify({'error': '考试记录不存在'})
     
-    # 将答案存入记录并统一评分与结算
+    # 将答案存入记录并统一评分与结算（以本次提交的完整答案为准，丢弃未落盘的增量）
+    _merge_exam_session(user_id, exam_record, close=True)
     exam_record['answers'] = answers
     total_score, wrong_answers = _finalize_exam_from_record(user_data, user_id, exam_record)
     
@@ -861,15 +2862,25 @@ def submit_exam():
     if user_id in _user_stats_cache:
         del _user_stats_cache[user_id]
     
-    return jsonify({'total_score': total_score, 'wrong_answers': wrong_answers})
+    bank = load_question_bank()
+    total_points = sum(_exam_question_score(exam_record, q) for q in _exam_questions(exam_record, bank))
+    return jsonify({'total_score': total_score, 'total_points': total_points, 'wrong_answers': wrong_answers})
 
 @app.route('/save_exam_progress', methods=['POST'])
 @require_login
 def save_exam_progress():
-    """保存考试作答进度（不评分）"""
-    data = request.get_json() or {}
+    """保存考试作答进度（不评分）
+
+    可选参数 seq：客户端下一个未用的保存序号，新序号取 max(当前序号 + 1, seq)，
+    之后才到达的旧增量保存都按重复请求处理。
+    """
+    data = request.get_json(silent=True) or {}
     exam_id = data.get('exam_id')
     answers = data.get('answers', {}) or {}
+    try:
+        requested_seq = int(data.get('seq'))
+    except (TypeError, ValueError):
+        requested_seq = 0
     user_data, user_id = get_user_data()
     if not user_data or not user_id:
         return jsonify({'success': False, 'message': '用户数据不存在'})
@@ -877,12 +2888,77 @@ def save_exam_progress():
         return jsonify({'success': False, 'message': '缺少考试ID'})
     for record in reversed(user_data['exam_records'][user_id]):
         if record.get('exam_id') == exam_id and record.get('status') == 'ongoing':
+            # 整体保存：覆盖会话中的作答，序号加一
+            with _exam_sessions_lock:
+                exam_session = _exam_session(user_id, record)
+                exam_session['answers'] = dict(answers)
+                exam_session['seq'] = max(exam_session['seq'] + 1, requested_seq)
+                exam_session['pending'] = {}
+                exam_session['touched'] = time.time()
+                seq = exam_session['seq']
             record['answers'] = answers
+            record['answers_seq'] = seq
             record['last_saved'] = datetime.datetime.now().isoformat()
-            save_user_data(user_data)
-            return jsonify({'success': True})
+            save_user_data(user_data, event=journal_event(
+                'exam_save', user_id, exam_id=exam_id, answers=answers, answers_seq=seq, ts=record['last_saved']
+            ))
+            return jsonify({'success': True, 'seq': seq})
     return jsonify({'success': False, 'message': '考试不存在或已结束'})
 
+@app.route('/patch_exam_progress', methods=['POST', 'PATCH'])
+@require_login
+def patch_exam_progress():
+    """增量保存考试作答：只提交上次保存以来改动的题目
+
+    请求：{exam_id, seq, changes: {题目ID: 答案}}，seq 为本次保存的序号（上次返回的 seq + 1），
+    答案为 null/空表示清除。改动先合并到内存中的考试会话，由后台线程定期写入考试记录
+    （blob 模式下整体读写全部用户数据的代价高，改动留在会话中，随其他请求的保存一并写入，
+    增量保存本身每隔 EXAM_BLOB_SAVE_INTERVAL 才整体保存一次）。
+    序号重复（重试）时直接返回当前序号；序号跳跃时返回 conflict，客户端应改用 /save_exam_progress 整体保存。
+    """
+    data = request.get_json(silent=True) or {}
+    exam_id = data.get('exam_id')
+    changes = data.get('changes') or {}
+    try:
+        seq = int(data.get('seq'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': '缺少保存序号'})
+    if not exam_id or not isinstance(changes, dict):
+        return jsonify({'success': False, 'message': '缺少考试ID'})
+    user_id = session.get('user_id')
+    key = (user_id, exam_id)
+    record = None
+    with _exam_sessions_lock:
+        exists = key in _exam_sessions
+    if not exists:
+        # 首次增量保存：从考试记录建立会话
+        user_data, user_id = get_user_data()
+        record = _find_exam_record(user_data, user_id, exam_id) if user_data else None
+        if not record or record.get('status') != 'ongoing':
+            return jsonify({'success': False, 'message': '考试不存在或已结束'})
+    with _exam_sessions_lock:
+        exam_session = _exam_sessions.get(key)
+        if exam_session is None:
+            if record is None:
+                # 会话恰好被回收：让客户端整体保存一次
+                return jsonify({'success': False, 'conflict': True, 'seq': -1})
+            exam_session = _exam_session(user_id, record)
+        current = exam_session['seq']
+        if seq <= current:
+            return jsonify({'success': True, 'seq': current})
+        if seq != current + 1:
+            return jsonify({'success': False, 'conflict': True, 'seq': current})
+        _apply_answer_changes(exam_session['answers'], changes)
+        for qid, answer in changes.items():
+            exam_session['pending'][str(qid)] = answer
+        exam_session['seq'] = seq
+        exam_session['touched'] = time.time()
+        save_due = _blob_whole_writes() and exam_session['touched'] - exam_session['saved'] >= EXAM_BLOB_SAVE_INTERVAL
+    if save_due:
+        # 整体保存时并入所有有改动的会话
+        save_user_data(load_user_data())
+    return jsonify({'success': True, 'seq': seq})
+
 @app.route('/wrong_questions')
 @require_login
 def wrong_questions():
@@ -906,64 +2982,100 @@ def important_bank():
 @app.route('/get_wrong_questions', methods=['POST'])
 @require_login
 def get_wrong_questions():
-    """获取错题记录"""
-    data = request.get_json()
+    """获取错题记录（每题一行，按题型独立分页）
+
+    排序与分页只用错题聚合中的次数与最后做错时间，题干、选项、解析只为当前页的题目从题库关联；
+    不修改存储的错题记录。
+    """
+    data = request.get_json(silent=True) or {}
     sort_by = data.get('sort_by', 'timestamp')
+    default_page = data.get('page', 1)
+    try:
+        page_size = max(1, int(data.get('page_size', 50)))
+    except Exception:
+        page_size = 50
+    # 各题型独立的页码，无效时为第一页
+    pages = {}
+    for q_type, field in ((1, 'page_single'), (2, 'page_multi'), (3, 'page_true_false')):
+        try:
+            pages[q_type] = max(1, int(data.get(field, default_page)))
+        except Exception:
+            pages[q_type] = 1
     
     user_data, user_id = get_user_data()
+    if not user_data or not user_id:
+        return jsonify({'error': '用户数据不存在'})
     wrong_records = user_data['wrong_questions'][user_id]
+    important_set = user_data['users'][user_id].get('important_questions', set())
     
-    # 加载题库数据以获取完整题目信息
-    questions = load_questions()
-    questions_dict = {q['id']: q for q in questions}
-    
-    # 为每个错题记录添加做错次数和完整题目信息
-    for record in wrong_records:
-        question_id = record['question_id']
-        # 使用缓存的错题次数统计
-        user_stats = get_user_stats_cached(user_id)
-        if user_stats:
-            record['wrong_count'] = user_stats['wrong_count_map'].get(question_id, 0)
-        else:
-            record['wrong_count'] = 0
-        
-        # 添加完整的题目信息
-        if question_id in questions_dict:
-            question = questions_dict[question_id]
-            record['options'] = question.get('options', [])
-            record['full_content'] = question.get('content', record['question_content'])
-            record['number'] = question.get('number')
-        # 添加是否重点
-        important_set = user_data['users'][user_id].get('important_questions', set())
-        record['is_important'] = question_id in important_set
-    
-    questions_by_type = {
-        1: [],
-        2: [],
-        3: []
-    }
-    
-    for record in wrong_records:
-        questions_by_type[record['type']].append(record)
+    bank = load_question_bank()
+    id_rank = question_table.bank_columns(bank).id_rank
     
-    for q_type in questions_by_type:
-        if sort_by == 'timestamp':
-            questions_by_type[q_type].sort(key=lambda x: x['timestamp'], reverse=True)
-        elif sort_by == 'count':
-            questions_by_type[q_type].sort(key=lambda x: x['wrong_count'], reverse=True)
+    # (排序键, 序号, 错题聚合)
+    rows_by_type = {1: [], 2: [], 3: []}
+    for question_id, entry in wrong_records.items():
+        ordinal = bank.ordinal(question_id)
+        if ordinal is None or not entry['recent']:
+            continue
+        question = bank.questions[ordinal]
+        last_time = entry['recent'][-1][1]
+        if sort_by == 'count':
+            key = (-entry['count'], -last_time)
         elif sort_by == 'id':
-            questions_by_type[q_type].sort(key=lambda x: x['question_id'])
+            key = (int(id_rank[ordinal]),)
+        else:
+            key = (-last_time,)
+        rows_by_type.setdefault(question['type'], []).append((key, ordinal, entry))
+    
+    result = {}
+    for q_type, name in ((1, 'single'), (2, 'multi'), (3, 'true_false')):
+        rows = rows_by_type[q_type]
+        total = len(rows)
+        page_num = pages[q_type]
+        start = (page_num - 1) * page_size
+        end = start + page_size
+        # 只对当前页之前的部分做部分排序
+        if 0 <= start < total:
+            page_rows = heapq.nsmallest(end, rows, key=lambda row: row[0])[start:]
+        else:
+            page_rows = []
+        items = []
+        for _, ordinal, entry in page_rows:
+            question = bank.questions[ordinal]
+            user_answer, last_time = entry['recent'][-1]
+            items.append({
+                'question_id': question['id'],
+                'user_answer': user_answer,
+                'correct_answer': question['correct_answer'],
+                'timestamp': datetime.datetime.fromtimestamp(last_time).isoformat(),
+                'question_content': question['content'],
+                'analysis': question['analysis'],
+                'type': question['type'],
+                'wrong_count': entry['count'],
+                'options': question.get('options', []),
+                'full_content': question.get('content'),
+                'number': question.get('number'),
+                'is_important': question['id'] in important_set,
+                'recent_attempts': [
+                    {'user_answer': answer, 'timestamp': datetime.datetime.fromtimestamp(ts).isoformat()}
+                    for answer, ts in reversed(entry['recent'])
+                ]
+            })
+        result['true_false' if q_type == 3 else f'{name}_choice'] = items
+        result[f'{name}_pagination'] = {
+            'total_count': total,
+            'current_page': page_num,
+            'total_pages': (total + page_size - 1) // page_size,
+            'has_next': end < total,
+            'has_prev': page_num > 1
+        }
     
-    return jsonify({
-        'single_choice': questions_by_type[1],
-        'multi_choice': questions_by_type[2],
-        'true_false': questions_by_type[3]
-    })
+    return jsonify(result)
 
 @app.route('/get_question_bank', methods=['POST'])
 @require_login
 def get_question_bank():
-    """获取全量题库数据"""
+    """获取全量题库数据（可按题型、做题状态与主题筛选）"""
     data = request.get_json()
     type_filter = data.get('type_filter', 'all')
     status_filter = data.get('status_filter', 'all')
@@ -976,7 +3088,7 @@ def get_question_bank():
     page_multi = int(data.get('page_multi', default_page))
     page_true_false = int(data.get('page_true_false', default_page))
     
-    questions = load_questions()
+    bank = load_question_bank()
     user_data, user_id = get_user_data()
     
     if not user_data or not user_id:
@@ -987,112 +3099,24 @@ def get_question_bank():
     if not user_stats:
         return jsonify({'error': '用户数据不存在'})
     
-    answered_questions = user_stats['answered_questions']
-    wrong_questions = user_stats['wrong_questions']
-    important_set = user_stats['important_questions']
-    wrong_count_map = user_stats['wrong_count_map']
-    wrong_times = user_stats['wrong_times']
-    
-    # 按题型预分组题目（避免重复遍历）
-    questions_by_type = {1: [], 2: [], 3: []}
-    for question in questions:
-        questions_by_type[question['type']].append(question)
-    
-    # 处理每个题目，添加用户状态信息
-    processed_questions = []
-    for q_type, type_questions in questions_by_type.items():
-        for question in type_questions:
-            question_id = question['id']
-            is_answered = question_id in answered_questions
-            is_wrong = question_id in wrong_questions
-            
-            # 计算做错次数
-            wrong_count_num = wrong_count_map.get(question_id, 0)
-            
-            # 获取最后做题时间
-            last_answered_time = None
-            if is_answered:
-                if question_id in wrong_times:
-                    last_answered_time = wrong_times[question_id]
-                else:
-                    # 如果没有错题记录，说明是做对的，使用当前时间作为默认值
-                    last_answered_time = datetime.datetime.now().isoformat()
-            
-            # 格式化时间显示
-            if last_answered_time:
-                try:
-                    dt = datetime.datetime.fromisoformat(last_answered_time.replace('Z', '+00:00'))
-                    last_answered_time = dt.strftime('%Y-%m-%d %H:%M')
-                except:
-                    last_answered_time = last_answered_time[:16]  # 简单截取
-            
-            processed_question = {
-                'id': question['id'],
-                'number': question.get('number'),
-                'type': question['type'],
-                'is_answered': is_answered,
-                'is_wrong': is_wrong,
-                'wrong_count': wrong_count_num,
-                'last_answered_time': last_answered_time,
-                'is_important': question_id in important_set
-            }
-            
-            # 应用筛选条件
-            include_question = True
-            
-            # 题型筛选
-            if type_filter != 'all' and str(q_type) != type_filter:
-                include_question = False
-            
-            # 状态筛选
-            if status_filter == 'unanswered' and is_answered:
-                include_question = False
-            elif status_filter == 'correct' and (not is_answered or is_wrong):
-                include_question = False
-            elif status_filter == 'wrong' and not is_wrong:
-                include_question = False
-            elif status_filter == 'frequent_wrong' and (not is_wrong or wrong_count_num < 3):
-                include_question = False
-            elif status_filter == 'important' and (question_id not in important_set):
-                include_question = False
-            
-            if include_question:
-                processed_questions.append(processed_question)
-    
-    # 按题型分组并排序
-    by_type = {1: [], 2: [], 3: []}
-    for q in processed_questions:
-        by_type[q['type']].append(q)
-
-    def sort_list(lst):
-        if sort_by == 'id':
-            lst.sort(key=lambda x: x['id'])
-        elif sort_by == 'wrong_count':
-            lst.sort(key=lambda x: x['wrong_count'], reverse=True)
-        elif sort_by == 'last_answered':
-            lst.sort(key=lambda x: (x['last_answered_time'] is None, x['last_answered_time']), reverse=True)
-        return lst
-
-    by_type[1] = sort_list(by_type[1])
-    by_type[2] = sort_list(by_type[2])
-    by_type[3] = sort_list(by_type[3])
-
-    # 各题型分页
-    def paginate(lst, page_num):
-        total = len(lst)
-        start = (page_num - 1) * page_size
-        end = start + page_size
-        return lst[start:end], {
-            'total_count': total,
-            'current_page': page_num,
-            'total_pages': (total + page_size - 1) // page_size,
-            'has_next': end < total,
-            'has_prev': page_num > 1
-        }
-
-    single_slice, single_meta = paginate(by_type[1], page_single)
-    multi_slice, multi_meta = paginate(by_type[2], page_multi)
-    true_false_slice, true_false_meta = paginate(by_type[3], page_true_false)
+    # 列式筛选/排序/分页，只有当前页的题目才转换为 dict
+    mask = question_table.status_mask(question_table.user_columns(bank, user_stats), status_filter)
+    if type_filter != 'all':
+        type_value = int(type_filter) if str(type_filter).isdigit() else -1
+        mask &= question_table.bank_columns(bank).types == type_value
+    topic, topic_bits, error = _practice_topic(bank, data)
+    if error:
+        return jsonify({'error': error})
+    if topic_bits is not None:
+        mask &= question_table.bits_mask(bank, topic_bits)
+    pages = question_table.query_pages(bank, user_stats, mask, sort_by, {
+        1: page_single,
+        2: page_multi,
+        3: page_true_false
+    }, page_size, get_question_difficulty())
+    single_slice, single_meta = pages[1]
+    multi_slice, multi_meta = pages[2]
+    true_false_slice, true_false_meta = pages[3]
 
     return jsonify({
         'single_choice': single_slice,
@@ -1103,6 +3127,67 @@ def get_question_bank():
         'true_false_pagination': true_false_meta
     })
 
+@app.route('/get_topics', methods=['GET'])
+@require_login
+def get_topics():
+    """题目主题列表（未生成主题索引时为空）"""
+    index = question_topics.topic_index(load_question_bank(), QUESTION_TOPICS_FILE)
+    return jsonify({'topics': index.topics if index is not None else []})
+
+@app.route('/search_questions', methods=['POST'])
+@require_login
+def search_questions():
+    """全文检索题干、选项与解析（BM25 排序），可叠加题型、主题与做题状态筛选"""
+    data = request.get_json() or {}
+    query = (data.get('q') or '').strip()
+    type_filter = data.get('type_filter', 'all')
+    status_filter = data.get('status_filter', 'all')
+    try:
+        page = max(1, int(data.get('page', 1)))
+        page_size = min(max(1, int(data.get('page_size', 20))), 100)
+    except (TypeError, ValueError):
+        page, page_size = 1, 20
+    if not query:
+        return jsonify({'error': '请输入搜索内容'})
+    
+    bank = load_question_bank()
+    user_data, user_id = get_user_data()
+    if not user_data or not user_id:
+        return jsonify({'error': '用户数据不存在'})
+    
+    user_stats = get_user_stats_cached(user_id)
+    if not user_stats:
+        return jsonify({'error': '用户数据不存在'})
+    
+    mask = question_table.status_mask(question_table.user_columns(bank, user_stats), status_filter)
+    if type_filter != 'all':
+        type_value = int(type_filter) if str(type_filter).isdigit() else -1
+        mask &= question_table.bank_columns(bank).types == type_value
+    topic, topic_bits, error = _practice_topic(bank, data)
+    if error:
+        return jsonify({'error': error})
+    if topic_bits is not None:
+        mask &= question_table.bits_mask(bank, topic_bits)
+    ordinals = question_search.search_index(bank).search(query, mask)
+    
+    total = int(ordinals.size)
+    start = (page - 1) * page_size
+    page_ordinals = ordinals[start:start + page_size].tolist()
+    results = question_table.question_rows(bank, user_stats, page_ordinals, difficulty=get_question_difficulty())
+    for row, ordinal in zip(results, page_ordinals):
+        row['snippet'] = question_search.snippet(bank.questions[ordinal], query)
+    
+    return jsonify({
+        'results': results,
+        'pagination': {
+            'total_count': total,
+            'current_page': page,
+            'total_pages': (total + page_size - 1) // page_size,
+            'has_next': start + page_size < total,
+            'has_prev': page > 1
+        }
+    })
+
 @app.route('/get_important_bank', methods=['POST'])
 @require_login
 def get_important_bank():
@@ -1115,7 +3200,7 @@ def get_important_bank():
     page_multi = int(data.get('page_multi', default_page))
     page_true_false = int(data.get('page_true_false', default_page))
 
-    questions = load_questions()
+    bank = load_question_bank()
     user_data, user_id = get_user_data()
     if not user_data or not user_id:
         return jsonify({'error': '用户数据不存在'})
@@ -1125,71 +3210,16 @@ def get_important_bank():
     if not user_stats:
         return jsonify({'error': '用户数据不存在'})
     
-    answered = user_stats['answered_questions']
-    wrong_set = user_stats['wrong_questions']
-    important_set = user_stats['important_questions']
-    wrong_count_map = user_stats['wrong_count_map']
-    wrong_times = user_stats['wrong_times']
-
-    processed = []
-    for q in questions:
-        if q['id'] not in important_set:
-            continue
-        qid = q['id']
-        is_answered = qid in answered
-        is_wrong = qid in wrong_set
-        wrong_cnt = wrong_count_map.get(qid, 0)
-        last_time = None
-        if is_answered:
-            last_time = wrong_times.get(qid, datetime.datetime.now().isoformat())
-            try:
-                dt = datetime.datetime.fromisoformat(last_time.replace('Z', '+00:00'))
-                last_time = dt.strftime('%Y-%m-%d %H:%M')
-            except:
-                last_time = (last_time or '')[:16]
-        processed.append({
-            'id': qid,
-            'number': q.get('number'),
-            'type': q['type'],
-            'is_answered': is_answered,
-            'is_wrong': is_wrong,
-            'wrong_count': wrong_cnt,
-            'last_answered_time': last_time,
-            'is_important': True
-        })
-
-    by_type = {1: [], 2: [], 3: []}
-    for item in processed:
-        by_type[item['type']].append(item)
-
-    def sort_list(lst):
-        if sort_by == 'id':
-            lst.sort(key=lambda x: x['id'])
-        elif sort_by == 'wrong_count':
-            lst.sort(key=lambda x: x['wrong_count'], reverse=True)
-        elif sort_by == 'last_answered':
-            lst.sort(key=lambda x: (x['last_answered_time'] is None, x['last_answered_time']), reverse=True)
-        return lst
-
-    by_type[1] = sort_list(by_type[1])
-    by_type[2] = sort_list(by_type[2])
-    by_type[3] = sort_list(by_type[3])
-
-    def paginate(lst, page_num):
-        total = len(lst)
-        start = (page_num - 1) * page_size
-        end = start + page_size
-        return lst[start:end], {
-            'total_count': total,
-            'current_page': page_num,
-            'total_pages': (total + page_size - 1) // page_size,
-            'has_next': end < total,
-            'has_prev': page_num > 1
-        }
-
-    single_slice, single_meta = paginate(by_type[1], page_single)
-    multi_slice, multi_meta = paginate(by_type[2], page_multi)
-    true_false_slice, true_false_meta = paginate(by_type[3], page_true_false)
+    # 只取重点题（列式筛选/排序/分页）
+    mask = question_table.user_columns(bank, user_stats).important
+    pages = question_table.query_pages(bank, user_stats, mask, sort_by, {
+        1: page_single,
+        2: page_multi,
+        3: page_true_false
+    }, page_size, get_question_difficulty())
+    single_slice, single_meta = pages[1]
+    multi_slice, multi_meta = pages[2]
+    true_false_slice, true_false_meta = pages[3]
 
     return jsonify({
         'single_choice': single_slice,
@@ -1210,33 +3240,26 @@ def get_question_detail():
     if not question_id:
         return jsonify({'error': '题目ID不能为空'})
     
-    questions = load_questions()
+    bank = load_question_bank()
     user_data, user_id = get_user_data()
     
     if not user_data or not user_id:
         return jsonify({'error': '用户数据不存在'})
     
-    # 统一ID类型后查找题目（兼容字符串/数字）
-    question = next((q for q in questions if str(q['id']) == str(question_id)), None)
+    # 题库索引兼容字符串/数字ID
+    question = bank.get(question_id)
     if not question:
         return jsonify({'error': '题目不存在'})
+    question_id = question['id']
     
     # 获取用户答题信息
     answered_questions = user_data['users'][user_id]['answered_questions']
     wrong_questions = user_data['users'][user_id]['wrong_questions']
     
-    # 获取错题记录的时间信息
-    wrong_records = user_data['wrong_questions'][user_id]
-    wrong_times = {}
-    for record in wrong_records:
-        if record['question_id'] == question_id:
-            wrong_times[question_id] = record['timestamp']
-    
-    # 计算做错次数
-    wrong_count_num = 0
-    for record in wrong_records:
-        if record['question_id'] == question_id:
-            wrong_count_num += 1
+    # 做错次数与最后做错时间（聚合统计）
+    user = user_data['users'][user_id]
+    wrong_times = user['aggregates']['wrong_last']
+    wrong_count_num = user['wrong_count'].get(question_id, 0)
     
     # 获取最后做题时间
     last_answered_time = None
@@ -1268,12 +3291,77 @@ def get_question_detail():
         'wrong_count': wrong_count_num,
         'last_answered_time': last_answered_time
     }
+    # 全站作答次数与正确率
+    attempts, correct = get_question_difficulty().get(question_id)
+    question_detail['global_attempts'] = attempts
+    question_detail['global_correct_rate'] = round(correct / attempts, 4) if attempts else None
     # 在非考试场景返回重点题标志
     important_set = user_data['users'][user_id].get('important_questions', set())
     question_detail['is_important'] = question['id'] in important_set
     
     return jsonify({'success': True, 'question': question_detail})
 
+@app.route('/update_cohort', methods=['POST'])
+@require_login
+def update_cohort():
+    """设置（或清除）用户所在的群组，如班级、团队"""
+    data = request.get_json() or {}
+    cohort = (data.get('cohort') or '').strip()
+    if len(cohort) > COHORT_NAME_MAX:
+        return jsonify({'success': False, 'message': f'群组名称最多{COHORT_NAME_MAX}个字符'})
+    
+    user_data, user_id = get_user_data()
+    if not user_data or not user_id:
+        return jsonify({'success': False, 'message': '用户数据不存在'})
+    
+    profile = user_data['user_profiles'][user_id]
+    if cohort:
+        profile['cohort'] = cohort
+    else:
+        profile.pop('cohort', None)
+    save_user_data(user_data, event=journal_event('profile', user_id, profile=profile))
+    update_leaderboard(user_data, user_id, exams=True)
+    return jsonify({'success': True, 'cohort': cohort})
+
+@app.route('/get_leaderboard', methods=['GET'])
+@require_login
+def get_leaderboard_endpoint():
+    """群组排行榜：前 k 名与我的名次（cohort 只能是自己所在的群组）"""
+    cohort = request.args.get('cohort', 'all')
+    metric = request.args.get('metric', 'exam_avg')
+    try:
+        k = min(max(1, int(request.args.get('k', 10))), LEADERBOARD_TOP_MAX)
+    except (TypeError, ValueError):
+        k = 10
+    if metric not in LEADERBOARD_METRICS:
+        return jsonify({'error': '不支持的排行指标'})
+    
+    service = get_leaderboard()
+    if service is None:
+        return jsonify({'error': '排行榜正在加载，请稍后再试'})
+    user_id = session.get('user_id')
+    cohorts = service.cohorts(user_id)
+    if not cohorts:
+        # 排行榜中还没有该用户（如旧数据重建前）：按当前数据补上
+        user_data, user_id = get_user_data()
+        if not user_data or not user_id:
+            return jsonify({'error': '用户数据不存在'})
+        update_leaderboard(user_data, user_id, exams=True)
+        cohorts = service.cohorts(user_id)
+    if cohort not in cohorts:
+        return jsonify({'error': '只能查看自己所在群组的排行'})
+    
+    top, total = service.top(cohort, metric, k)
+    rank, value, _ = service.rank(cohort, metric, user_id)
+    return jsonify({
+        'success': True,
+        'cohort': cohort,
+        'metric': metric,
+        'cohorts': [{'id': c, 'label': _cohort_label(c)} for c in cohorts],
+        'top': [{'rank': r, 'username': uid, 'value': v, 'is_me': uid == user_id} for r, uid, v in top],
+        'me': {'rank': rank, 'value': value, 'total': total}
+    })
+
 @app.route('/toggle_important', methods=['POST'])
 @require_login
 def toggle_important():
@@ -1290,14 +3378,14 @@ def toggle_important():
         return jsonify({'success': False, 'message': '用户数据不存在'})
     
     if 'important_questions' not in user_data['users'][user_id]:
-        user_data['users'][user_id]['important_questions'] = set()
+        user_data['users'][user_id]['important_questions'] = load_question_bank().new_set()
     
     if mark:
         user_data['users'][user_id]['important_questions'].add(question_id)
     else:
         user_data['users'][user_id]['important_questions'].discard(question_id)
     
-    save_user_data(user_data)
+    save_user_data(user_data, event=journal_event('important', user_id, q=question_id, mark=mark))
     return jsonify({'success': True, 'is_important': mark})
 
 def get_user_stats_cached(user_id):
@@ -1310,42 +3398,25 @@ def get_user_stats_cached(user_id):
         current_time - _user_stats_cache_time.get(user_id, 0) < USER_STATS_CACHE_DURATION):
         return _user_stats_cache[user_id]
     
-    # 缓存过期或不存在，重新计算
-    user_data, _ = get_user_data()
+    # 缓存过期或不存在：直接读取增量维护的聚合统计，不再遍历错题历史
+    user_data = load_user_data(user_id)
     if not user_data or user_id not in user_data['users']:
         return None
     
-    # 确保用户数据结构完整
-    if 'answered_questions' not in user_data['users'][user_id]:
-        user_data['users'][user_id]['answered_questions'] = set()
-    if 'wrong_questions' not in user_data['users'][user_id]:
-        user_data['users'][user_id]['wrong_questions'] = set()
-    if 'important_questions' not in user_data['users'][user_id]:
-        user_data['users'][user_id]['important_questions'] = set()
-    if 'wrong_count' not in user_data['users'][user_id]:
-        user_data['users'][user_id]['wrong_count'] = {}
-    
-    answered_questions = set(user_data['users'][user_id]['answered_questions'])
-    wrong_questions_set = set(user_data['users'][user_id]['wrong_questions'])
-    important_set = set(user_data['users'][user_id]['important_questions'])
-    wrong_records = user_data['wrong_questions'].get(user_id, [])
-    exam_records = user_data['exam_records'].get(user_id, [])
-    
-    # 计算错题次数和时间
-    wrong_times = {}
-    wrong_count_map = {}
-    for record in wrong_records:
-        qid = record['question_id']
-        wrong_times.setdefault(qid, record['timestamp'])
-        wrong_count_map[qid] = wrong_count_map.get(qid, 0) + 1
+    # 确保用户数据结构完整（旧数据在这里补建聚合统计）
+    _ensure_user_structure(user_data, user_id)
     
+    user = user_data['users'][user_id]
+    exam_records = user_data['exam_records'].get(user_id, [])
     stats = {
-        'answered_questions': answered_questions,
-        'wrong_questions': wrong_questions_set,
-        'important_questions': important_set,
-        'wrong_count_map': wrong_count_map,
-        'wrong_times': wrong_times,
-        'exam_records': exam_records
+        'answered_questions': user['answered_questions'].copy(),
+        'wrong_questions': user['wrong_questions'].copy(),
+        'important_questions': user['important_questions'].copy(),
+        'wrong_count_map': dict(user['wrong_count']),
+        'wrong_times': dict(user['aggregates']['wrong_last']),
+        'exam_records': exam_records,
+        'exam_count': len(exam_records),
+        'score_sum': user['aggregates']['score_sum']
     }
     
     # 更新缓存
@@ -1364,8 +3435,7 @@ def get_user_stats():
         return jsonify({'success': False, 'message': '用户数据不存在'})
     
     # 加载题库数据
-    questions = load_questions()
-    total_questions = len(questions)
+    total_questions = len(load_question_bank())
     
     # 使用缓存的用户统计
     user_stats = get_user_stats_cached(user_id)
@@ -1376,14 +3446,13 @@ def get_user_stats():
     wrong_count = len(user_stats['wrong_questions'])
     unanswered_count = total_questions - answered_count
     
-    # 获取考试记录数量
-    exam_count = len(user_stats['exam_records'])
+    # 考试次数与总分均为增量维护的聚合值
+    exam_count = user_stats['exam_count']
     
     # 计算平均分数
     avg_score = 0
     if exam_count > 0:
-        total_score = sum(record.get('total_score', 0) for record in user_stats['exam_records'] if record.get('status') == 'completed')
-        avg_score = round(total_score / exam_count, 1)
+        avg_score = round(user_stats['score_sum'] / exam_count, 1)
     
     stats = {
         'total_questions': total_questions,
@@ -1411,64 +3480,63 @@ def get_user_stats_cached_endpoint():
     if stats is None:
         return jsonify({'success': False, 'message': '用户数据不存在或统计信息不可用'})
     
-    return jsonify({'success': True, 'stats': stats})
+    return jsonify({'success': True, 'stats': {
+        'answered_count': len(stats['answered_questions']),
+        'wrong_count': len(stats['wrong_questions']),
+        'important_count': len(stats['important_questions']),
+        'exam_count': stats['exam_count'],
+        'score_sum': stats['score_sum']
+    }})
 
 @app.route('/get_exam_records', methods=['POST'])
 @require_login
 def get_exam_records():
-    """获取考试记录"""
+    """获取考试记录摘要（按开始时间倒序，游标分页）
+
+    参数 cursor 为上一页返回的 next_cursor，不传则从最新一场开始；兼容按 page 页码分页。
+    完整的题目、作答与错题通过 /get_exam_detail 获取。
+    """
     user_data, user_id = get_user_data()
     
     if not user_data or not user_id:
         return jsonify({'success': False, 'message': '用户数据不存在'})
     
-    data = request.get_json() or {}
+    data = request.get_json(silent=True) or {}
     try:
-        page = int(data.get('page', 1))
-    except Exception:
-        page = 1
-    try:
-        page_size = int(data.get('page_size', 10))
+        page_size = max(1, int(data.get('page_size', 10)))
     except Exception:
         page_size = 10
     
-    # 对超时但仍为进行中的考试进行自动结算
-    now = datetime.datetime.now()
-    updated = False
-    for record in user_data['exam_records'][user_id]:
-        if record.get('status') == 'ongoing':
-            duration = record.get('duration_seconds', 3600)
-            elapsed = (now - _parse_iso(record['start_time'])).total_seconds()
-            if elapsed >= duration:
-                _finalize_exam_from_record(user_data, user_id, record)
-                updated = True
-    if updated:
-        # 保存后直接继续使用内存对象的 exam_records 即可
-        pass
-    
-    # 获取最近的考试记录，按开始时间倒序排列
-    exam_records = sorted(
-        user_data['exam_records'][user_id],
-        key=lambda x: x.get('start_time', ''),
-        reverse=True
-    )
-    total = len(exam_records)
-    total_pages = (total + page_size - 1) // page_size if page_size > 0 else 1
-    page = max(1, min(page, max(total_pages, 1)))
-    start = (page - 1) * page_size
-    end = start + page_size
-    records_slice = exam_records[start:end]
+    # 超时考试由后台调度线程结算；blob 模式下排队中的先在这里结算
+    _settle_expired_exams(user_data, user_id)
+    index = user_data['users'][user_id]['exam_index']
+    total = len(index)
+    cursor = data.get('cursor')
+    if isinstance(cursor, str) and '|' in cursor:
+        # 游标为上一页最后一条的 "开始时间|考试ID"，取比它更早的记录
+        start_time, _, exam_id = cursor.rpartition('|')
+        end = _exam_index_position(index, (start_time, exam_id))
+    else:
+        # 未传游标或游标无效：按页码（无效时为第一页）
+        try:
+            page = max(1, int(data.get('page', 1)))
+        except Exception:
+            page = 1
+        end = total - (page - 1) * page_size
+    begin = max(0, end - page_size)
+    records = index[begin:max(end, 0)][::-1]
+    has_next = begin > 0
+    next_cursor = f"{records[-1]['start_time']}|{records[-1]['exam_id']}" if records and has_next else None
 
     return jsonify({
         'success': True,
-        'records': records_slice,
+        'records': records,
         'pagination': {
-            'current_page': page,
             'page_size': page_size,
             'total_count': total,
-            'total_pages': total_pages,
-            'has_prev': page > 1,
-            'has_next': page < total_pages
+            'total_pages': (total + page_size - 1) // page_size,
+            'has_next': has_next,
+            'next_cursor': next_cursor
         }
     })
 
@@ -1486,6 +3554,7 @@ def get_exam_detail():
     
     if not user_data or not user_id:
         return jsonify({'success': False, 'message': '用户数据不存在'})
+    _settle_expired_exams(user_data, user_id)
     
     # 查找指定的考试记录
     exam_record = None
@@ -1497,9 +3566,8 @@ def get_exam_detail():
     if not exam_record:
         return jsonify({'success': False, 'message': '考试记录不存在'})
     
-    # 加载题库数据以获取完整的题目信息
-    questions = load_questions()
-    question_map = {q['id']: q for q in questions}
+    # 通过题库索引获取完整的题目信息
+    bank = load_question_bank()
     
     # 构建考试详情
     exam_detail = {
@@ -1513,27 +3581,27 @@ def get_exam_detail():
     
     # 添加题目详情
     important_set = user_data['users'][user_id].get('important_questions', set())
-    for question in exam_record['questions']:
+    for question in _exam_questions(exam_record, bank):
         question_id = question['id']
-        full_question = question_map.get(question_id, question)
         
         exam_detail['questions'].append({
             'id': question_id,
-            'number': full_question.get('number', question.get('number')),
-            'content': full_question.get('content', question.get('content', '')),
+            'number': question.get('number'),
+            'content': question.get('content', ''),
             'type': question['type'],
-            'options': full_question.get('options', []),
+            'options': question.get('options', []),
             'correct_answer': question['correct_answer'],
-            'score': question['score'],
-            'analysis': full_question.get('analysis', ''),
+            'score': _exam_question_score(exam_record, question),
+            'analysis': question.get('analysis', ''),
             'is_important': question_id in important_set
         })
     
     # 添加错题信息（如果有）
     if exam_record.get('wrong_answers'):
-        exam_detail['wrong_answers'] = exam_record['wrong_answers']
+        exam_detail['wrong_answers'] = _exam_wrong_answers(exam_record, bank)
     # 若进行中的考试带有已保存答案，也返回，便于前端显示“继续作答”
     if exam_record.get('status') == 'ongoing':
+        _merge_exam_session(user_id, exam_record)
         exam_detail['answers'] = exam_record.get('answers', {})
     
     return jsonify({'success': True, 'exam_detail': exam_detail})
@@ -1548,7 +3616,9 @@ def api_backup():
     
     try:
         # 读取用户数据
-        if os.path.exists(USER_DATA_FILE):
+        if USER_STORAGE_MODE != 'blob':
+            user_data = json.loads(json.dumps(load_user_data(), default=_json_default))
+        elif os.path.exists(USER_DATA_FILE):
             with open(USER_DATA_FILE, 'r', encoding='utf-8') as f:
                 user_data = json.load(f)
         else:
@@ -1580,6 +3650,34 @@ def profile():
         return render_template('profile.html', profile=profile_info, user_id=user_id)
     return redirect(url_for('login'))
 
+# 进程池子进程（forkserver/spawn）以 __mp_main__ 重新导入入口模块（python app.py 启动时即本模块），
+# 子进程只需要函数定义，不做下面的启动初始化
+if __name__ != '__mp_main__':
+    # 启动时初始化：建立连接池并建表（只执行一次）
+    if DB_URL:
+        init_db_pool()
+
+    # 启动时初始化：按用户存储模式下执行一次性迁移
+    if USER_STORAGE_MODE == 'per_user':
+        try:
+            migrate_user_data_to_rows()
+        except Exception as e:
+            print(f"Warning: user rows migration failed: {e}")
+
+    # 收到 SIGTERM 或正常退出时：先把考试会话中的作答写入记录，再把延迟写的脏用户全部落盘，
+    # 最后保存全站难度计数与排行榜（未处理过请求的进程中尚未加载，不会保存）
+    # （atexit 后注册的先执行）
+    atexit.register(save_leaderboard)
+    atexit.register(save_question_difficulty)
+    if WRITE_BEHIND:
+        atexit.register(drain_write_behind)
+    atexit.register(flush_exam_sessions)
+    try:
+        _previous_sigterm_handler = signal.signal(signal.SIGTERM, _on_sigterm)
+    except ValueError:
+        # 非主线程导入时无法注册信号处理
+        pass
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8080))
     app.run(debug=False, host='0.0.0.0', port=port) 
\ No newline at end of file
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测试共用的夹具：把用户数据、日志、按用户分区、题库缓存与各类存档都指向临时目录，
+不读写工作目录中的数据文件，也不启动后台服务。
+"""
+
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(REPO_DIR)
+
+import app as app_module
+
+
+def data_paths(data_dir):
+    """app 中所有数据文件路径 -> 临时目录下的路径"""
+    user_file = os.path.join(data_dir, 'user_data.json')
+    journal_file = f"{user_file}.journal"
+    return {
+        'USER_DATA_FILE': user_file,
+        'DATA_DIR': data_dir,
+        'USER_ROWS_DIR': os.path.join(data_dir, 'users'),
+        'JOURNAL_SNAPSHOT_FILE': user_file,
+        'JOURNAL_FILE': journal_file,
+        'JOURNAL_PENDING_FILE': f"{journal_file}.compacting",
+        'QUESTIONS_FILE': os.path.join(REPO_DIR, 'full_questions.json'),
+        'QUESTIONS_CACHE_FILE': os.path.join(data_dir, 'questions_cache.pkl'),
+        'QUESTION_LAYOUTS_FILE': os.path.join(data_dir, 'question_layouts.json'),
+        'QUESTION_ARCHIVE_FILE': os.path.join(data_dir, 'question_archive.json'),
+        'QUESTION_DIFFICULTY_FILE': os.path.join(data_dir, 'question_difficulty.json'),
+        'LEADERBOARD_FILE': os.path.join(data_dir, 'leaderboard.json'),
+    }
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """返回 use(mode)：切换到指定存储模式并把所有数据文件指向临时目录，返回测试客户端"""
+
+    def use(mode, write_behind=False):
+        settings = dict(data_paths(str(tmp_path)), **{
+            'USER_STORAGE_MODE': mode,
+            'WRITE_BEHIND': write_behind,
+            # 内存状态从空开始
+            '_journal_state': None,
+            '_journal_seq': 0,
+            '_journal_fp': None,
+            '_user_row_digests': {},
+            '_user_stats_cache': {},
+            '_user_stats_cache_time': {},
+            '_question_layouts': None,
+            '_question_archive': None,
+            '_wrong_samplers': OrderedDict(),
+            '_exam_sessions': {},
+            '_expired_exam_queue': set(),
+            '_resident_data': None,
+            '_resident_users': set(),
+            '_dirty_users': set(),
+            # 不启动后台线程：计时器、自动保存与加载线程由测试直接调用
+            '_background_started': True,
+            '_exam_flush_worker': threading.main_thread(),
+            '_journal_compactor': threading.main_thread(),
+            '_write_behind_worker': threading.main_thread(),
+            '_difficulty_flush_worker': threading.main_thread(),
+            # 难度计数尚未加载：作答先记在待补记列表中
+            '_question_difficulty': None,
+            '_difficulty_pending': [],
+            '_leaderboard_flush_worker': threading.main_thread(),
+            '_leaderboard': None,
+            '_leaderboard_pending': [],
+        })
+        for name, value in settings.items():
+            monkeypatch.setattr(app_module, name, value)
+        monkeypatch.setattr(app_module, 'db_available', lambda: False)
+        return app_module.app.test_client()
+
+    yield use
+    if app_module._journal_fp is not None:
+        app_module._journal_fp.close()
+
+
+@pytest.fixture
+def login():
+    """返回 login(client, username)：注册并登录，返回用户ID"""
+
+    def use(client, username='alice'):
+        client.post('/register', json={'username': username, 'password': 'secret1', 'confirm_password': 'secret1'})
+        client.post('/login', json={'username': username, 'password': 'secret1'})
+        with client.session_transaction() as flask_session:
+            return flask_session['user_id']
+
+    return use
+
+
+@pytest.fixture
+def restart_journal():
+    """返回 restart()：模拟进程重启，丢弃内存中的数据，下次加载时从快照回放日志"""
+
+    def restart():
+        app_module._journal_fp.close()
+        app_module._journal_fp = None
+        app_module._journal_state = None
+        app_module._journal_seq = 0
+
+    return restart
+
+
+@pytest.fixture
+def user_snapshot():
+    """返回 snapshot(data, user_id)：一个用户的全部分区，转成 JSON 再比较（集合等类型统一为列表）"""
+
+    def snapshot(data, user_id):
+        return json.loads(json.dumps(
+            {key: data[key].get(user_id) for key in app_module.USER_ROW_SECTIONS.values()},
+            default=app_module._json_default, sort_keys=True
+        ))
+
+    return snapshot
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+线程安全的 PostgreSQL 连接池
+
+- 连接数有上限，借出时池满则等待，超过超时时间抛出 PoolTimeout
+- 借出前检查连接是否已关闭；空闲超过一定时间的连接先执行 SELECT 1 探活
+- 提供 in_use / idle / waiting / created 等统计，便于按高峰并发调整池大小
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """在超时时间内没有可用连接"""
+
+
+class DBConnectionPool:
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=5.0, healthcheck_idle=30.0, connect=None):
+        if connect is None:
+            import psycopg2
+            connect = psycopg2.connect
+        self._dsn = dsn
+        self._connect = connect
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn)
+        self.timeout = timeout
+        self.healthcheck_idle = healthcheck_idle
+        self._cond = threading.Condition()
+        self._idle = []  # [(conn, 归还时间)]，后进先出，空闲最久的连接自然沉底
+        self._in_use = 0
+        self._waiting = 0
+        self._stats = {
+            'created': 0,
+            'discarded': 0,
+            'checkouts': 0,
+            'timeouts': 0,
+            'max_wait_ms': 0.0,
+            'total_wait_ms': 0.0
+        }
+        try:
+            for _ in range(self.minconn):
+                conn = self._new_connection()
+                self._idle.append((conn, time.time()))
+        except Exception:
+            # 预建连接中途失败：关闭已建立的连接再抛出
+            self.closeall()
+            raise
+
+    def _new_connection(self):
+        conn = self._connect(self._dsn)
+        with self._cond:
+            self._stats['created'] += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.time() - idle_since < self.healthcheck_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['discarded'] += 1
+
+    def getconn(self, timeout=None):
+        """借出一个连接；池满时最多等待 timeout 秒"""
+        timeout = self.timeout if timeout is None else timeout
+        start = time.time()
+        deadline = start + timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._in_use + len(self._idle) < self.maxconn:
+                    conn, idle_since = None, None
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"no database connection available within {timeout}s")
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            # 先占住名额，建立/探活连接在锁外进行
+            self._in_use += 1
+            waited_ms = (time.time() - start) * 1000
+            self._stats['checkouts'] += 1
+            self._stats['total_wait_ms'] += waited_ms
+            self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], waited_ms)
+
+        try:
+            if conn is not None and not self._is_healthy(conn, idle_since):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._new_connection()
+            return conn
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def putconn(self, conn, broken=False):
+        """归还连接；出错或已关闭的连接直接丢弃"""
+        if not broken and not conn.closed:
+            try:
+                # 未提交的事务（如查询后未 commit）一律回滚，避免把状态带给下一个借用者
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken or conn.closed:
+            self._discard(conn)
+            conn = None
+        with self._cond:
+            self._in_use -= 1
+            if conn is not None:
+                self._idle.append((conn, time.time()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """with pool.connection() as conn: ... 用完自动归还"""
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = bool(getattr(conn, 'closed', False))
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'size': self._in_use + len(self._idle),
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'timeout_seconds': self.timeout
+            })
+        total_wait = stats.pop('total_wait_ms')
+        stats['avg_wait_ms'] = round(total_wait / stats['checkouts'], 2) if stats['checkouts'] else 0.0
+        stats['max_wait_ms'] = round(stats['max_wait_ms'], 2)
+        return stats
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+考试蓝图
+
+蓝图描述一种试卷格式：各题型的题数与每题分值、考试时长、是否避开最近考过的题。
+组卷直接从 QuestionBank 按题型分好的题目列表中抽样，耗时只与抽取的题数有关，与题库大小无关；
+传入相同的 seed 与 exclude_ids（且题库未变）可以复现同一份试卷。
+
+内置 standard（单选50 + 判断50 + 多选50，60分钟）；EXAM_BLUEPRINTS_FILE 指向的 JSON 文件可追加或覆盖蓝图：
+{"quick": {"title": "快速练习", "sections": [{"type": 1, "count": 20, "score": 5}], "duration_seconds": 900, "exclude_recent_exams": 2}}
+"""
+
+import json
+import os
+import random
+
+# 组卷时一次抽样的最大重试倍数：避开的题目过多时退化为从剩余题目中抽取
+_REJECTION_FACTOR = 4
+
+
+class ExamBlueprint:
+    def __init__(self, name, sections, duration_seconds=3600, title=None, exclude_recent_exams=0):
+        self.name = name
+        self.title = title or name
+        # [(题型, 题数, 每题分值或 None)]；分值为 None 时使用题目自带的 score
+        self.sections = [(int(t), int(count), score) for t, count, score in sections]
+        self.duration_seconds = int(duration_seconds)
+        self.exclude_recent_exams = int(exclude_recent_exams)
+
+    @classmethod
+    def from_dict(cls, name, config):
+        sections = [(s['type'], s['count'], s.get('score')) for s in config['sections']]
+        return cls(
+            name,
+            sections,
+            duration_seconds=config.get('duration_seconds', 3600),
+            title=config.get('title'),
+            exclude_recent_exams=config.get('exclude_recent_exams', 0)
+        )
+
+    def type_scores(self):
+        """蓝图指定的题型分值（字符串键，便于直接存入考试记录）"""
+        return {str(t): score for t, _, score in self.sections if score is not None}
+
+    def total_points(self, bank):
+        total = 0
+        for t, count, score in self.sections:
+            if score is None:
+                pool = bank.by_type.get(t, [])
+                score = pool[0]['score'] if pool else 0
+            total += count * score
+        return total
+
+    def describe(self, bank):
+        return {
+            'name': self.name,
+            'title': self.title,
+            'sections': [
+                {'type': t, 'count': count, 'score': score if score is not None else (
+                    bank.by_type[t][0]['score'] if bank.by_type.get(t) else None)}
+                for t, count, score in self.sections
+            ],
+            'question_count': sum(count for _, count, _ in self.sections),
+            'total_points': self.total_points(bank),
+            'duration_seconds': self.duration_seconds,
+            'exclude_recent_exams': self.exclude_recent_exams
+        }
+
+    def generate(self, bank, seed=None, exclude_ids=()):
+        """按蓝图组卷，返回题目列表（按蓝图中题型的顺序）"""
+        rng = random.Random(seed)
+        excluded = set()
+        for qid in exclude_ids:
+            ordinal = bank.ordinal(qid)
+            if ordinal is not None:
+                excluded.add(ordinal)
+        questions = []
+        for t, count, _ in self.sections:
+            pool = bank.by_type.get(t, [])
+            if count > len(pool):
+                raise ValueError(f"题型 {t} 只有 {len(pool)} 道题，不足 {count} 道")
+            questions.extend(_sample_pool(pool, count, rng, excluded, bank))
+        return questions
+
+
+def _sample_pool(pool, count, rng, excluded, bank):
+    """从 pool 中抽取 count 道题，尽量避开 excluded 中的序号
+
+    拒绝采样：期望耗时 O(count)；避开的题目占比过高导致重试过多时，
+    先取全部未避开的题目，不足部分再从避开的题目中补齐。
+    """
+    if not excluded:
+        return rng.sample(pool, count)
+    chosen = []
+    seen = set()
+    attempts = 0
+    size = len(pool)
+    while len(chosen) < count and attempts < count * _REJECTION_FACTOR:
+        attempts += 1
+        index = rng.randrange(size)
+        if index in seen:
+            continue
+        seen.add(index)
+        if bank.ordinal(pool[index]['id']) in excluded:
+            continue
+        chosen.append(pool[index])
+    if len(chosen) < count:
+        chosen_ids = {id(q) for q in chosen}
+        allowed = [q for q in pool if id(q) not in chosen_ids and bank.ordinal(q['id']) not in excluded]
+        rest = [q for q in pool if id(q) not in chosen_ids and bank.ordinal(q['id']) in excluded]
+        need = count - len(chosen)
+        if len(allowed) >= need:
+            chosen.extend(rng.sample(allowed, need))
+        else:
+            chosen.extend(allowed)
+            chosen.extend(rng.sample(rest, need - len(allowed)))
+    return chosen
+
+
+DEFAULT_BLUEPRINT = 'standard'
+BUILTIN_BLUEPRINTS = {
+    'standard': ExamBlueprint(
+        'standard',
+        [(1, 50, None), (3, 50, None), (2, 50, None)],
+        duration_seconds=3600,
+        title='标准模拟考试'
+    )
+}
+
+
+def load_blueprints(path=None):
+    """内置蓝图 + 配置文件中的蓝图（配置有误时忽略并打印警告）"""
+    blueprints = dict(BUILTIN_BLUEPRINTS)
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+            for name, item in config.items():
+                blueprints[name] = ExamBlueprint.from_dict(name, item)
+        except Exception as e:
+            print(f"Warning: Failed to load exam blueprints from {path}: {e}")
+    return blueprints
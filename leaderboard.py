@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+群组排行榜：考试平均分、最高分、已做题数
+
+- 每个（群组, 指标）一个可按名次定位的跳表，键为 (-分数, 用户ID)：分数高者在前，同分按用户ID
+- 考试结算或练习作答后只更新该用户所在群组的几个跳表，更新、前 K 名定位、“我的名次”均为 O(log n)
+- 名次按竞赛排名：同分同名次（1, 2, 2, 4）
+- 持久化只保存每个用户的群组与指标值，可直接 JSON 序列化；加载时重新插入跳表：
+{"version": 1, "users": {"用户ID": {"cohorts": ["all", "month:2025-01"], "metrics": {"answered": 120, "best_score": 86}}}}
+"""
+
+import random
+import threading
+
+FORMAT_VERSION = 1
+METRICS = ('exam_avg', 'best_score', 'answered')
+_MAX_LEVEL = 32
+_P = 0.25
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'span')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        # span[i]：沿第 i 层指针前进一次跨过的底层节点数
+        self.span = [0] * level
+
+
+class SkipList:
+    """可按名次定位的跳表：有序、不重复的键集合，插入/删除/求名次的期望耗时为 O(log n)"""
+
+    def __init__(self, rng=None):
+        self._rng = rng or random.Random()
+        self._head = _Node(None, _MAX_LEVEL)
+        self._level = 1
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _random_level(self):
+        level = 1
+        while level < _MAX_LEVEL and self._rng.random() < _P:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [None] * _MAX_LEVEL
+        rank = [0] * _MAX_LEVEL
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while node.next[i] is not None and node.next[i].key < key:
+                rank[i] += node.span[i]
+                node = node.next[i]
+            update[i] = node
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._head
+                self._head.span[i] = self._size
+            self._level = level
+        node = _Node(key, level)
+        for i in range(level):
+            node.next[i] = update[i].next[i]
+            update[i].next[i] = node
+            node.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+        self._size += 1
+
+    def remove(self, key):
+        """删除键，返回是否存在"""
+        update = [None] * _MAX_LEVEL
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+        node = node.next[0]
+        if node is None or node.key != key:
+            return False
+        for i in range(self._level):
+            if update[i].next[i] is node:
+                update[i].span[i] += node.span[i] - 1
+                update[i].next[i] = node.next[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.next[self._level - 1] is None:
+            self._level -= 1
+        self._size -= 1
+        return True
+
+    def count_less(self, key):
+        """小于 key 的键的个数（即 key 的插入位置）"""
+        rank = 0
+        node = self._head
+        for i in range(self._level - 1, -1, -1):
+            while node.next[i] is not None and node.next[i].key < key:
+                rank += node.span[i]
+                node = node.next[i]
+        return rank
+
+    def slice(self, start, count):
+        """从第 start 个（从 0 开始）起依次取最多 count 个键"""
+        if start >= self._size or count <= 0:
+            return []
+        traversed = 0
+        node = self._head
+        # 按 span 跳到第 start 个节点之前
+        for i in range(self._level - 1, -1, -1):
+            while node.next[i] is not None and traversed + node.span[i] <= start:
+                traversed += node.span[i]
+                node = node.next[i]
+        keys = []
+        node = node.next[0]
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Leaderboard:
+    """一个群组一项指标的排行"""
+
+    def __init__(self):
+        self._list = SkipList()
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def update(self, user_id, value):
+        """设置用户的分数；value 为 None 时移出排行"""
+        old = self._values.get(user_id)
+        if old == value:
+            return
+        if old is not None:
+            self._list.remove((-old, user_id))
+            del self._values[user_id]
+        if value is not None:
+            self._values[user_id] = value
+            self._list.insert((-value, user_id))
+
+    def _rank_of(self, value):
+        # (-value,) 小于所有 (-value, 用户ID)：分数严格更高的人数 + 1
+        return self._list.count_less((-value,)) + 1
+
+    def top(self, k, offset=0):
+        """第 offset 名之后的 k 个 [(名次, 用户ID, 分数)]"""
+        entries = []
+        for negative, user_id in self._list.slice(offset, k):
+            value = -negative
+            entries.append((self._rank_of(value), user_id, value))
+        return entries
+
+    def rank(self, user_id):
+        """(名次, 分数)；不在排行中时为 (None, None)"""
+        value = self._values.get(user_id)
+        if value is None:
+            return None, None
+        return self._rank_of(value), value
+
+
+class LeaderboardService:
+    """全部群组的排行榜：用户 -> 所在群组与指标值，（群组, 指标） -> Leaderboard"""
+
+    def __init__(self):
+        self._users = {}
+        self._boards = {}
+        self._lock = threading.Lock()
+        self.revision = 0
+        self._saved_revision = 0
+
+    @classmethod
+    def from_json(cls, data):
+        service = cls()
+        for user_id, entry in (data.get('users') or {}).items():
+            service.update(user_id, entry.get('cohorts') or [], entry.get('metrics') or {})
+        service._saved_revision = service.revision
+        return service
+
+    def __len__(self):
+        return len(self._users)
+
+    def _board(self, cohort, metric):
+        board = self._boards.get((cohort, metric))
+        if board is None:
+            board = self._boards[(cohort, metric)] = Leaderboard()
+        return board
+
+    def update(self, user_id, cohorts=None, metrics=None):
+        """更新用户的群组（None 表示不变）与指标值（只更新给出的指标，值为 None 表示移出该指标排行）"""
+        with self._lock:
+            entry = self._users.get(user_id) or {'cohorts': [], 'metrics': {}}
+            new_cohorts = list(cohorts) if cohorts is not None else entry['cohorts']
+            new_metrics = dict(entry['metrics'])
+            for metric, value in (metrics or {}).items():
+                if value is None:
+                    new_metrics.pop(metric, None)
+                else:
+                    new_metrics[metric] = value
+            for cohort in entry['cohorts']:
+                if cohort not in new_cohorts:
+                    for metric in METRICS:
+                        self._board(cohort, metric).update(user_id, None)
+            for cohort in new_cohorts:
+                for metric in METRICS:
+                    self._board(cohort, metric).update(user_id, new_metrics.get(metric))
+            self._users[user_id] = {'cohorts': new_cohorts, 'metrics': new_metrics}
+            self.revision += 1
+
+    def cohorts(self, user_id):
+        entry = self._users.get(user_id)
+        return list(entry['cohorts']) if entry else []
+
+    def top(self, cohort, metric, k=10, offset=0):
+        with self._lock:
+            board = self._boards.get((cohort, metric))
+            return (board.top(k, offset), len(board)) if board is not None else ([], 0)
+
+    def rank(self, cohort, metric, user_id):
+        """(名次, 分数, 该排行总人数)"""
+        with self._lock:
+            board = self._boards.get((cohort, metric))
+            if board is None:
+                return None, None, 0
+            rank, value = board.rank(user_id)
+            return rank, value, len(board)
+
+    @property
+    def dirty(self):
+        return self.revision != self._saved_revision
+
+    def snapshot(self):
+        """返回 (revision, 可 JSON 序列化的数据)；保存成功后调用 mark_saved(revision)"""
+        with self._lock:
+            return self.revision, {
+                'version': FORMAT_VERSION,
+                'users': {
+                    user_id: {'cohorts': list(entry['cohorts']), 'metrics': dict(entry['metrics'])}
+                    for user_id, entry in self._users.items()
+                }
+            }
+
+    def mark_saved(self, revision):
+        self._saved_revision = max(self._saved_revision, revision)
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+题库索引
+
+题目列表每加载一次就构建一个 QuestionBank，预先计算：
+- 题目ID -> 题目（兼容字符串/数字ID）
+- 按题型分组的题目列表
+- 题目在题库中的序号（ordinal）
+- 解析后的标准答案（多选题拆分为 frozenset）
+各接口据此做 O(1) 查询，不再逐题扫描或每次请求重建字典。
+
+pickle 缓存记录源文件的 sha256 与 mtime/大小，源文件被修改后自动从 JSON 重建并原子写回缓存。
+
+用户的已做/错题/重点题集合用 QuestionSet 表示：以题目序号为位的位图，
+持久化为 "布局ID:base64" 字符串，集合运算即整数按位运算。
+"""
+
+import base64
+import hashlib
+import json
+import os
+import pickle
+
+QUESTION_TYPES = (1, 2, 3)  # 1=单选，2=多选，3=判断
+CACHE_FORMAT = 2
+
+
+def normalize_question_id(question_id):
+    """统一题目ID类型：纯数字字符串转为 int"""
+    if isinstance(question_id, str):
+        stripped = question_id.strip()
+        if stripped.isdigit():
+            return int(stripped)
+    return question_id
+
+
+def parse_answer_key(question):
+    """解析标准答案：多选题为选项集合，其余为原字符串"""
+    if question['type'] == 2:
+        return frozenset(question['correct_answer'].split(','))
+    return question['correct_answer']
+
+
+def normalize_user_answer(question, user_answer):
+    """多选题答案统一为列表，其余题型原样返回"""
+    if question['type'] == 2:
+        if isinstance(user_answer, str):
+            return [user_answer] if user_answer else []
+        if user_answer is None:
+            return []
+    return user_answer
+
+
+def _iter_bits(bits):
+    """按从低到高的顺序产出置位的位置"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class QuestionLayout:
+    """题目ID与序号的对应关系；ID 顺序相同的题库共用同一个布局ID"""
+
+    def __init__(self, ids):
+        self.ids = tuple(ids)
+        self.ordinals = {qid: i for i, qid in enumerate(self.ids)}
+        self.layout_id = hashlib.sha1(json.dumps(self.ids).encode('utf-8')).hexdigest()[:12]
+        self.full_mask = (1 << len(self.ids)) - 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def mask_of(self, question_ids):
+        bits = 0
+        for qid in question_ids:
+            ordinal = self.ordinals.get(normalize_question_id(qid))
+            if ordinal is not None:
+                bits |= 1 << ordinal
+        return bits
+
+
+class QuestionSet:
+    """题目ID集合的位图实现
+
+    - 位置为题目在布局中的序号，集合运算是整数按位运算
+    - 不在布局中的ID（已从题库删除的题目等）保存在 extras 中，不会丢失
+    - 题库布局变化后，旧位图可通过 rebased() 映射到新布局
+    """
+    __slots__ = ('layout', 'bits', 'extras')
+
+    def __init__(self, layout, bits=0, extras=None):
+        self.layout = layout
+        self.bits = bits
+        self.extras = set(extras) if extras else set()
+
+    @classmethod
+    def from_ids(cls, layout, question_ids):
+        result = cls(layout)
+        for qid in question_ids:
+            result.add(qid)
+        return result
+
+    def add(self, question_id):
+        qid = normalize_question_id(question_id)
+        ordinal = self.layout.ordinals.get(qid)
+        if ordinal is None:
+            self.extras.add(qid)
+        else:
+            self.bits |= 1 << ordinal
+
+    def discard(self, question_id):
+        qid = normalize_question_id(question_id)
+        ordinal = self.layout.ordinals.get(qid)
+        if ordinal is None:
+            self.extras.discard(qid)
+        else:
+            self.bits &= ~(1 << ordinal)
+
+    def __contains__(self, question_id):
+        qid = normalize_question_id(question_id)
+        ordinal = self.layout.ordinals.get(qid)
+        if ordinal is None:
+            return qid in self.extras
+        return (self.bits >> ordinal) & 1 == 1
+
+    def __len__(self):
+        return self.bits.bit_count() + len(self.extras)
+
+    def __bool__(self):
+        return bool(self.bits or self.extras)
+
+    def __iter__(self):
+        ids = self.layout.ids
+        for ordinal in _iter_bits(self.bits):
+            yield ids[ordinal]
+        yield from list(self.extras)
+
+    def ordinals(self):
+        return _iter_bits(self.bits)
+
+    def copy(self):
+        return QuestionSet(self.layout, self.bits, self.extras)
+
+    def rebased(self, layout):
+        """映射到另一个布局（布局ID相同则直接返回自身）"""
+        if layout.layout_id == self.layout.layout_id:
+            return self
+        return QuestionSet.from_ids(layout, self)
+
+    def _coerce(self, other):
+        if isinstance(other, QuestionSet):
+            return other.rebased(self.layout)
+        return QuestionSet.from_ids(self.layout, other)
+
+    def __or__(self, other):
+        other = self._coerce(other)
+        return QuestionSet(self.layout, self.bits | other.bits, self.extras | other.extras)
+
+    def __and__(self, other):
+        other = self._coerce(other)
+        return QuestionSet(self.layout, self.bits & other.bits, self.extras & other.extras)
+
+    def __sub__(self, other):
+        other = self._coerce(other)
+        return QuestionSet(self.layout, self.bits & ~other.bits, self.extras - other.extras)
+
+    def __eq__(self, other):
+        if not isinstance(other, (QuestionSet, set, frozenset)):
+            return NotImplemented
+        other = self._coerce(other)
+        return self.bits == other.bits and self.extras == other.extras
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"QuestionSet({sorted(self, key=str)!r})"
+
+    def encode(self):
+        """持久化格式："布局ID:base64"；有布局外的ID时附带 extra 列表"""
+        # 小端序，末尾的全零字节省略：只做了前面几题的用户只占几个字节
+        payload = base64.b64encode(self.bits.to_bytes((self.bits.bit_length() + 7) // 8, 'little')).decode('ascii')
+        encoded = f"{self.layout.layout_id}:{payload}"
+        if self.extras:
+            return {'bitmap': encoded, 'extra': sorted(self.extras, key=str)}
+        return encoded
+
+    @classmethod
+    def decode(cls, value, layout, lookup_layout=None):
+        """解析持久化值（兼容旧版的ID列表）；位图来自旧布局时通过 lookup_layout 映射到当前布局"""
+        if isinstance(value, QuestionSet):
+            return value
+        if value is None:
+            return cls(layout)
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return cls.from_ids(layout, value)
+        extras = ()
+        if isinstance(value, dict):
+            extras = value.get('extra') or ()
+            value = value.get('bitmap') or ''
+        layout_id, _, payload = value.partition(':')
+        bits = int.from_bytes(base64.b64decode(payload), 'little') if payload else 0
+        if layout_id == layout.layout_id:
+            result = cls(layout, bits)
+        else:
+            old_layout = lookup_layout(layout_id) if lookup_layout else None
+            if old_layout is None:
+                raise ValueError(f"unknown question layout: {layout_id}")
+            result = cls(old_layout, bits).rebased(layout)
+        for qid in extras:
+            result.add(qid)
+        return result
+
+
+class QuestionBank:
+    def __init__(self, questions, version=None, source_stat=None):
+        self.questions = questions
+        self.version = version  # 源文件内容的 sha256
+        self.source_stat = source_stat  # 构建时源文件的 (mtime_ns, size)
+        self._by_id = {}
+        self._ordinals = {}
+        self._answer_keys = {}
+        self.by_type = {t: [] for t in QUESTION_TYPES}
+        self.type_masks = {t: 0 for t in QUESTION_TYPES}
+        for ordinal, question in enumerate(questions):
+            qid = question['id']
+            self._by_id[qid] = question
+            self._ordinals[qid] = ordinal
+            self._answer_keys[qid] = parse_answer_key(question)
+            self.by_type.setdefault(question['type'], []).append(question)
+            self.type_masks[question['type']] = self.type_masks.get(question['type'], 0) | (1 << ordinal)
+        self.layout = QuestionLayout(q['id'] for q in questions)
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __iter__(self):
+        return iter(self.questions)
+
+    def __contains__(self, question_id):
+        return normalize_question_id(question_id) in self._by_id
+
+    def get(self, question_id, default=None):
+        """按ID取题目，字符串与数字ID均可"""
+        return self._by_id.get(normalize_question_id(question_id), default)
+
+    def ordinal(self, question_id):
+        """题目在题库中的序号（不存在时返回 None）"""
+        return self._ordinals.get(normalize_question_id(question_id))
+
+    def answer_key(self, question_id):
+        return self._answer_keys.get(normalize_question_id(question_id))
+
+    def grade(self, question, user_answer):
+        """评判作答，返回 (规范化后的答案, 是否正确)"""
+        user_answer = normalize_user_answer(question, user_answer)
+        qid = question['id']
+        if self._by_id.get(qid) is question:
+            key = self._answer_keys[qid]
+        else:
+            # 考试记录中保存的题目副本，按副本自身的答案评判
+            key = parse_answer_key(question)
+        if question['type'] == 2:
+            # 多选题答案应为选项字母列表，其他类型（数字、对象、嵌套列表等）一律判错
+            if not isinstance(user_answer, list) or not all(isinstance(a, str) for a in user_answer):
+                return user_answer, False
+            return user_answer, frozenset(user_answer) == key
+        return user_answer, user_answer == key
+
+    def questions_of_type(self, question_type):
+        """按题型取题目列表；0/None 表示全部题型"""
+        if question_type in self.by_type:
+            return self.by_type[question_type]
+        return self.questions
+
+    def new_set(self, question_ids=()):
+        """创建基于当前布局的空集合（或由ID序列初始化）"""
+        return QuestionSet.from_ids(self.layout, question_ids)
+
+    def type_mask(self, question_type):
+        """题型对应的位掩码；0/None 表示全部题型"""
+        if question_type in self.type_masks:
+            return self.type_masks[question_type]
+        return self.layout.full_mask
+
+    def questions_from_bits(self, bits):
+        """位图 -> 题目列表（按题库顺序）"""
+        questions = self.questions
+        return [questions[ordinal] for ordinal in _iter_bits(bits)]
+
+    def resolve(self, question_ids):
+        """把题目ID序列映射为题目（忽略题库中已不存在的ID）"""
+        if isinstance(question_ids, QuestionSet) and question_ids.layout.layout_id == self.layout.layout_id:
+            return self.questions_from_bits(question_ids.bits)
+        result = []
+        for qid in question_ids:
+            question = self.get(qid)
+            if question is not None:
+                result.append(question)
+        return result
+
+    def sort_by_ordinal(self, questions):
+        """按题库原顺序排列"""
+        return sorted(questions, key=lambda q: self._ordinals.get(q['id'], len(self.questions)))
+
+
+def source_stat(path):
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _read_cache(cache_file):
+    try:
+        with open(cache_file, 'rb') as f:
+            cache = pickle.load(f)
+        if isinstance(cache, dict) and isinstance(cache.get('questions'), list):
+            return cache
+    except Exception:
+        pass
+    return None
+
+
+def _write_cache(cache_file, bank):
+    """原子写入缓存：先写临时文件再 rename，读者不会看到写了一半的 pickle"""
+    temp_file = f"{cache_file}.tmp.{os.getpid()}"
+    try:
+        with open(temp_file, 'wb') as f:
+            pickle.dump({
+                'format': CACHE_FORMAT,
+                'source_sha256': bank.version,
+                'source_stat': bank.source_stat,
+                'questions': bank.questions
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, cache_file)
+    except Exception as e:
+        print(f"Warning: Failed to write questions cache: {e}")
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+
+
+def load_bank(questions_file, cache_file, current=None):
+    """加载题库，返回 (QuestionBank, 来源)
+
+    - 源文件 mtime/大小与当前题库或缓存记录一致：直接复用
+    - 否则计算 sha256：内容未变（仅 touch）时复用，内容变化则从 JSON 重建并写回缓存
+    """
+    stat = source_stat(questions_file)
+    if current is not None and current.source_stat == stat:
+        return current, 'current'
+
+    cache = _read_cache(cache_file)
+    if cache is not None and cache.get('format') == CACHE_FORMAT and tuple(cache.get('source_stat') or ()) == stat:
+        return QuestionBank(cache['questions'], version=cache['source_sha256'], source_stat=stat), 'cache'
+
+    with open(questions_file, 'rb') as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    if current is not None and current.version == digest:
+        current.source_stat = stat
+        return current, 'current'
+
+    if cache is not None and cache.get('source_sha256') == digest:
+        bank, origin = QuestionBank(cache['questions'], version=digest, source_stat=stat), 'cache'
+    else:
+        questions = json.loads(raw.decode('utf-8'))['questions']
+        bank, origin = QuestionBank(questions, version=digest, source_stat=stat), 'JSON'
+    _write_cache(cache_file, bank)
+    return bank, origin
+
+
+def load_cached_bank(cache_file):
+    """源文件不可用时的兜底：不做校验直接使用缓存"""
+    cache = _read_cache(cache_file)
+    if cache is None:
+        return None
+    return QuestionBank(cache['questions'], version=cache.get('source_sha256'))
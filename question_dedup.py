@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+题库近似重复检测与版本对比（MinHash + LSH）
+
+- 题目文本（题干 + 选项）去掉空白与标点后切成 3 字片段，用 MinHash 生成 128 维签名
+- LSH 分 32 段、每段 4 行：签名任一段完全相同的题目才成为候选对，避免两两比较
+- 候选对再用片段集合的 Jaccard 相似度精确校验（默认阈值 0.8）
+
+用法：
+    python question_dedup.py full_questions.json                        # 新题库内部的近似重复
+    python question_dedup.py full_questions.json full_questions.json.bak # 另与旧版本对比
+    python question_dedup.py full_questions.json *.bak* --threshold 0.7 --json report.json
+"""
+
+import argparse
+import json
+import re
+import sys
+import zlib
+
+import numpy as np
+
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+BANDS = 32
+DEFAULT_THRESHOLD = 0.8
+# 梅森素数 2^31-1：系数与片段哈希都小于它，乘积不会超出 uint64
+_PRIME = (1 << 31) - 1
+_STRIP_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def question_text(question):
+    """参与比较的文本：题干 + 各选项内容（去空白、标点，小写）"""
+    parts = [question.get('content') or '']
+    parts.extend(option.get('content') or '' for option in question.get('options') or [])
+    return _STRIP_RE.sub('', ''.join(parts).lower())
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, _PRIME, size=num_perm).astype(np.uint64)
+
+    def signature(self, shingle_set):
+        if not shingle_set:
+            return np.full(len(self.a), _PRIME, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) % _PRIME for s in shingle_set),
+                             dtype=np.uint64, count=len(shingle_set))
+        return ((self.a[:, None] * hashes[None, :] + self.b[:, None]) % _PRIME).min(axis=1)
+
+
+class LSHIndex:
+    """签名按段分桶；同一桶内的键互为候选"""
+
+    def __init__(self, bands=BANDS, num_perm=NUM_PERM):
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets = {}
+
+    def _keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key, signature):
+        for bucket in self._keys(signature):
+            self.buckets.setdefault(bucket, []).append(key)
+
+    def query(self, signature):
+        found = set()
+        for bucket in self._keys(signature):
+            found.update(self.buckets.get(bucket, ()))
+        return found
+
+    def candidate_pairs(self):
+        pairs = set()
+        for keys in self.buckets.values():
+            if len(keys) < 2:
+                continue
+            for i in range(len(keys)):
+                for j in range(i + 1, len(keys)):
+                    pairs.add((keys[i], keys[j]) if keys[i] < keys[j] else (keys[j], keys[i]))
+        return pairs
+
+
+class _Prepared:
+    """一份题库的片段集合、签名与 LSH 索引（按题目列表下标）"""
+
+    def __init__(self, questions, hasher):
+        self.questions = questions
+        self.shingles = [shingles(question_text(q)) for q in questions]
+        self.signatures = [hasher.signature(s) for s in self.shingles]
+        self.lsh = LSHIndex()
+        for index, signature in enumerate(self.signatures):
+            self.lsh.add(index, signature)
+
+
+def _summary(question):
+    return {
+        'id': question.get('id'),
+        'number': question.get('number'),
+        'type': question.get('type'),
+        'content': (question.get('content') or '')[:60]
+    }
+
+
+def find_duplicates(questions, threshold=DEFAULT_THRESHOLD, prepared=None):
+    """同一题库内的近似重复，返回簇列表（每簇至少两题，按簇大小降序）"""
+    prepared = prepared or _Prepared(questions, MinHasher())
+    parent = list(range(len(questions)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    lowest = {}
+    for i, j in prepared.lsh.candidate_pairs():
+        similarity = jaccard(prepared.shingles[i], prepared.shingles[j])
+        if similarity < threshold:
+            continue
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[root_j] = root_i
+            lowest[root_i] = min(similarity, lowest.get(root_i, 1.0), lowest.get(root_j, 1.0))
+        else:
+            lowest[root_i] = min(similarity, lowest.get(root_i, 1.0))
+
+    groups = {}
+    for i in range(len(questions)):
+        groups.setdefault(find(i), []).append(i)
+    clusters = [
+        {
+            'min_similarity': round(lowest.get(root, 1.0), 3),
+            'questions': [_summary(questions[i]) for i in members]
+        }
+        for root, members in groups.items() if len(members) > 1
+    ]
+    clusters.sort(key=lambda c: -len(c['questions']))
+    return clusters
+
+
+def diff_banks(old_questions, new_questions, threshold=DEFAULT_THRESHOLD):
+    """对比两个版本的题库
+
+    - changed：同一ID但题干/选项变化（附相似度），answer_changed：同一ID标准答案或题型变化
+    - replaced：旧ID不在新题库中、但新题库里有近似的题（多为换了ID）
+    - removed / added：找不到近似题的删除、新增
+    """
+    hasher = MinHasher()
+    new = _Prepared(new_questions, hasher)
+    new_by_id = {q.get('id'): i for i, q in enumerate(new_questions)}
+    old_ids = {q.get('id') for q in old_questions}
+
+    changed, answer_changed, replaced, removed = [], [], [], []
+    matched_new = set()
+    for old_question in old_questions:
+        old_shingles = shingles(question_text(old_question))
+        index = new_by_id.get(old_question.get('id'))
+        if index is not None:
+            new_question = new_questions[index]
+            similarity = jaccard(old_shingles, new.shingles[index])
+            if question_text(old_question) != question_text(new_question):
+                changed.append({'old': _summary(old_question), 'new': _summary(new_question),
+                                'similarity': round(similarity, 3)})
+            if (old_question.get('correct_answer') != new_question.get('correct_answer')
+                    or old_question.get('type') != new_question.get('type')):
+                answer_changed.append({
+                    'id': old_question.get('id'),
+                    'old_answer': old_question.get('correct_answer'),
+                    'new_answer': new_question.get('correct_answer'),
+                    'old_type': old_question.get('type'),
+                    'new_type': new_question.get('type')
+                })
+            continue
+        best, best_similarity = None, 0.0
+        for candidate in new.lsh.query(hasher.signature(old_shingles)):
+            if new_questions[candidate].get('id') in old_ids:
+                continue
+            similarity = jaccard(old_shingles, new.shingles[candidate])
+            if similarity > best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is not None and best_similarity >= threshold:
+            matched_new.add(best)
+            replaced.append({'old': _summary(old_question), 'new': _summary(new_questions[best]),
+                             'similarity': round(best_similarity, 3)})
+        else:
+            removed.append(_summary(old_question))
+
+    added = [_summary(q) for i, q in enumerate(new_questions)
+             if q.get('id') not in old_ids and i not in matched_new]
+    return {
+        'changed': changed,
+        'answer_changed': answer_changed,
+        'replaced': replaced,
+        'removed': removed,
+        'added': added
+    }
+
+
+def bank_report(questions, previous=None, threshold=DEFAULT_THRESHOLD):
+    """题库报告：内部近似重复 + （可选）与上一版本的差异"""
+    report = {
+        'question_count': len(questions),
+        'threshold': threshold,
+        'duplicates': find_duplicates(questions, threshold)
+    }
+    if previous is not None:
+        report['diff'] = diff_banks(previous, questions, threshold)
+    return report
+
+
+def summarize(report):
+    """一行摘要，用于加载日志"""
+    text = f"{report['question_count']} questions, {len(report['duplicates'])} near-duplicate clusters"
+    diff = report.get('diff')
+    if diff:
+        text += ', ' + ', '.join(f"{len(diff[key])} {key}" for key in
+                                 ('changed', 'answer_changed', 'replaced', 'removed', 'added'))
+    return text
+
+
+def _load_questions(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data['questions'] if isinstance(data, dict) else data
+
+
+def _print_report(name, report):
+    print(f"=== {name} ===")
+    print(summarize(report))
+    for cluster in report['duplicates']:
+        print(f"\n[近似重复] {len(cluster['questions'])} 题，最低相似度 {cluster['min_similarity']}")
+        for q in cluster['questions']:
+            print(f"  id={q['id']} 编号={q['number']} 题型={q['type']} {q['content']}")
+    diff = report.get('diff')
+    if not diff:
+        return
+    for item in diff['answer_changed']:
+        print(f"[答案变化] id={item['id']} {item['old_answer']} -> {item['new_answer']}"
+              f"（题型 {item['old_type']} -> {item['new_type']}）")
+    for item in diff['changed']:
+        print(f"[内容修改] id={item['new']['id']} 相似度 {item['similarity']}: {item['new']['content']}")
+    for item in diff['replaced']:
+        print(f"[换ID] {item['old']['id']} -> {item['new']['id']} 相似度 {item['similarity']}: {item['new']['content']}")
+    for q in diff['removed']:
+        print(f"[删除] id={q['id']} {q['content']}")
+    for q in diff['added']:
+        print(f"[新增] id={q['id']} {q['content']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='题库近似重复检测与版本对比')
+    parser.add_argument('bank', help='新题库 JSON（如 full_questions.json）')
+    parser.add_argument('previous', nargs='*', help='用于对比的旧版本（如 full_questions.json.bak）')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Jaccard 相似度阈值')
+    parser.add_argument('--json', dest='json_path', help='把完整报告写入 JSON 文件')
+    args = parser.parse_args(argv)
+
+    questions = _load_questions(args.bank)
+    reports = {args.bank: bank_report(questions, threshold=args.threshold)}
+    for path in args.previous:
+        reports[f"{path} -> {args.bank}"] = {
+            'question_count': len(questions),
+            'threshold': args.threshold,
+            'duplicates': [],
+            'diff': diff_banks(_load_questions(path), questions, args.threshold)
+        }
+    for name, report in reports.items():
+        _print_report(name, report)
+        print()
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入 {args.json_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+全站题目难度统计：每道题被作答的次数与答对次数（所有用户合计）
+
+- 计数器常驻内存（题目ID -> [作答次数, 答对次数]），练习提交与考试结算时在锁内增量更新，按题读取为 O(1)
+- 持久化为紧凑 JSON：{"version": 1, "counts": {"题目ID": [作答次数, 答对次数]}}
+- rebuild() 从全部用户的历史记录重新统计：按用户分块交给进程池并行计数，再合并各块结果；
+  调用方是多线程的 Web 进程，进程池用 forkserver（不可用时用 spawn）启动子进程，不直接 fork
+
+考试的每道作答都保存在考试记录中，可以精确还原；练习只保存了做错次数与已做题集合，
+答对次数按下限还原（做过、从未做错、也没有在考试中答对过的题记 1 次答对）。
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+FORMAT_VERSION = 1
+# 重建时每个进程任务处理的用户数
+REBUILD_CHUNK_USERS = 200
+
+
+def exam_outcomes(record):
+    """已完成考试中每道作答过的题的结果 [(题目ID字符串, 是否答对)]；未作答的题不计"""
+    if record.get('status') != 'completed':
+        return []
+    wrong = {str(item.get('question_id')) for item in record.get('wrong_answers') or []}
+    return [
+        (str(qid), str(qid) not in wrong)
+        for qid, answer in (record.get('answers') or {}).items()
+        if answer not in (None, '', [])
+    ]
+
+
+def user_history(answered, wrong_counts, exam_records):
+    """重建所需的单个用户历史（只含题目ID与计数，可直接传给子进程）"""
+    return {
+        'answered': [str(qid) for qid in answered],
+        'wrong': {str(qid): count for qid, count in wrong_counts.items()},
+        'exams': [outcomes for outcomes in (exam_outcomes(r) for r in exam_records) if outcomes]
+    }
+
+
+def _count_histories(histories):
+    """统计一批用户的 {题目ID: [作答次数, 答对次数]}（在子进程中运行）"""
+    counts = {}
+    for history in histories:
+        exam_correct = {}
+        exam_wrong = {}
+        for outcomes in history['exams']:
+            for qid, is_correct in outcomes:
+                entry = counts.setdefault(qid, [0, 0])
+                entry[0] += 1
+                if is_correct:
+                    entry[1] += 1
+                    exam_correct[qid] = exam_correct.get(qid, 0) + 1
+                else:
+                    exam_wrong[qid] = exam_wrong.get(qid, 0) + 1
+        # 做错次数包含考试中的做错，扣除后即练习中的做错
+        for qid, count in history['wrong'].items():
+            practice_wrong = count - exam_wrong.get(qid, 0)
+            if practice_wrong > 0:
+                counts.setdefault(qid, [0, 0])[0] += practice_wrong
+        for qid in history['answered']:
+            if not history['wrong'].get(qid) and not exam_correct.get(qid):
+                entry = counts.setdefault(qid, [0, 0])
+                entry[0] += 1
+                entry[1] += 1
+    return counts
+
+
+def _chunks(items, size):
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _pool_context():
+    """多线程进程中 fork 可能复制其他线程持有的锁，子进程改由 forkserver/spawn 启动"""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def rebuild(histories, workers=None, chunk_size=REBUILD_CHUNK_USERS):
+    """从用户历史（可迭代对象）重新统计，返回新的 DifficultyStats
+
+    workers=1 或只有一块时在当前进程计算；进程池不可用时退化为当前进程计算。
+    """
+    chunks = list(_chunks(histories, chunk_size))
+    if workers == 1 or len(chunks) <= 1:
+        parts = [_count_histories(chunk) for chunk in chunks]
+    else:
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+                parts = list(pool.map(_count_histories, chunks))
+        except Exception as e:
+            print(f"Warning: Process pool unavailable for difficulty rebuild, counting in-process: {e}")
+            parts = [_count_histories(chunk) for chunk in chunks]
+    merged = {}
+    for part in parts:
+        for qid, (attempts, correct) in part.items():
+            entry = merged.setdefault(qid, [0, 0])
+            entry[0] += attempts
+            entry[1] += correct
+    return DifficultyStats(merged)
+
+
+class DifficultyStats:
+    def __init__(self, counts=None):
+        self._counts = {str(qid): [int(entry[0]), int(entry[1])] for qid, entry in (counts or {}).items()}
+        self._lock = threading.Lock()
+        # 每次变化加一：判断是否需要保存、题库列是否需要重建
+        self.revision = 0
+        self._saved_revision = 0
+        self._columns = None
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data.get('counts') or {})
+
+    def __len__(self):
+        return len(self._counts)
+
+    def record(self, outcomes):
+        """记录一批作答 [(题目ID, 是否答对)]"""
+        with self._lock:
+            for qid, is_correct in outcomes:
+                entry = self._counts.get(str(qid))
+                if entry is None:
+                    entry = self._counts[str(qid)] = [0, 0]
+                entry[0] += 1
+                if is_correct:
+                    entry[1] += 1
+                self.revision += 1
+
+    def get(self, qid):
+        """(作答次数, 答对次数)"""
+        entry = self._counts.get(str(qid))
+        return (entry[0], entry[1]) if entry is not None else (0, 0)
+
+    def correct_rate(self, qid):
+        """全站正确率；无人作答时为 None"""
+        attempts, correct = self.get(qid)
+        return round(correct / attempts, 4) if attempts else None
+
+    @property
+    def dirty(self):
+        return self.revision != self._saved_revision
+
+    def snapshot(self):
+        """返回 (revision, 可 JSON 序列化的数据)；保存成功后调用 mark_saved(revision)"""
+        with self._lock:
+            return self.revision, {
+                'version': FORMAT_VERSION,
+                'counts': {qid: list(entry) for qid, entry in self._counts.items()}
+            }
+
+    def mark_saved(self, revision):
+        self._saved_revision = max(self._saved_revision, revision)
+
+    def columns(self, bank):
+        """按题库序号排列的 (作答次数数组, 正确率数组)；无人作答的题正确率为 NaN"""
+        cached = self._columns
+        if cached is not None and cached[0] is bank and cached[1] == self.revision:
+            return cached[2], cached[3]
+        revision = self.revision
+        size = len(bank.questions)
+        attempts = np.zeros(size, dtype=np.int64)
+        correct = np.zeros(size, dtype=np.int64)
+        with self._lock:
+            for ordinal, question in enumerate(bank.questions):
+                entry = self._counts.get(str(question['id']))
+                if entry is not None:
+                    attempts[ordinal], correct[ordinal] = entry
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rate = np.where(attempts > 0, correct / np.maximum(attempts, 1), np.nan)
+        self._columns = (bank, revision, attempts, rate)
+        return attempts, rate
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+题库全文检索（/search_questions）
+
+- 索引对象：题干、各选项内容、解析；中文按相邻两字切分（二元组），另收单字以支持一个字的查询，
+  连续的字母/数字作为一个词
+- 倒排表按词连续存放在两个 NumPy 数组中（题库序号、BM25 词权重），查询时对命中的题逐词累加得分
+- 每个题库构建一次，与 QuestionBank 一起整体替换；题库加载后在后台线程预先构建
+"""
+
+import math
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+K1 = 1.2
+B = 0.75
+# 查询词中至少有这么大比例出现在题目里才算命中（容忍个别错字、多字）
+MIN_MATCH_RATIO = 0.75
+SNIPPET_LENGTH = 80
+
+_TOKEN_RE = re.compile(r'[0-9a-z]+|[\u3400-\u4dbf\u4e00-\u9fff]+')
+
+
+def tokenize(text, unigrams=True):
+    """切词：中文二元组（unigrams=True 时加上单字），字母数字按整词"""
+    tokens = []
+    for run in _TOKEN_RE.findall((text or '').lower()):
+        if run.isascii():
+            tokens.append(run)
+            continue
+        if unigrams or len(run) == 1:
+            tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def question_text(question):
+    parts = [question.get('content') or '']
+    parts.extend(option.get('content') or '' for option in question.get('options') or [])
+    parts.append(question.get('analysis') or '')
+    return '\n'.join(parts)
+
+
+class SearchIndex:
+    def __init__(self, bank):
+        self.bank = bank
+        questions = bank.questions
+        size = len(questions)
+        self.size = size
+        postings = {}
+        lengths = np.zeros(size, dtype=np.float64)
+        for ordinal, question in enumerate(questions):
+            counts = Counter(tokenize(question_text(question)))
+            lengths[ordinal] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((ordinal, tf))
+
+        avgdl = float(lengths.mean()) if size else 0.0
+        self._term_ids = {}
+        offsets = [0]
+        docs = []
+        tfs = []
+        for term, items in postings.items():
+            self._term_ids[term] = len(offsets) - 1
+            docs.extend(ordinal for ordinal, _ in items)
+            tfs.extend(tf for _, tf in items)
+            offsets.append(len(docs))
+        self._offsets = np.asarray(offsets, dtype=np.int64)
+        self._docs = np.asarray(docs, dtype=np.int32)
+        tf = np.asarray(tfs, dtype=np.float64)
+        # 预先算好每条倒排记录的 BM25 得分（含 idf），查询只需累加
+        df = np.diff(self._offsets).astype(np.float64)
+        idf = np.log(1 + (size - df + 0.5) / (df + 0.5))
+        norm = K1 * (1 - B + B * lengths[self._docs] / avgdl) if avgdl else np.full(tf.shape, K1)
+        self._weights = (np.repeat(idf, np.diff(self._offsets)) * tf * (K1 + 1) / (tf + norm)).astype(np.float32)
+
+        # 按编号或ID直接查找
+        self._exact = {}
+        for ordinal, question in enumerate(questions):
+            for key in (question.get('number'), question['id']):
+                if key is not None:
+                    self._exact.setdefault(str(key).lower(), ordinal)
+
+    def search(self, query, mask=None):
+        """返回按相关度排序的题库序号数组；mask 为可选的布尔数组（状态/题型筛选）"""
+        query = (query or '').strip().lower()
+        terms = list(dict.fromkeys(tokenize(query, unigrams=False)))
+        scores = np.zeros(self.size, dtype=np.float32)
+        matched = np.zeros(self.size, dtype=np.int32)
+        for term in terms:
+            term_id = self._term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            docs = self._docs[start:end]
+            scores[docs] += self._weights[start:end]
+            matched[docs] += 1
+        hits = matched >= max(1, math.ceil(len(terms) * MIN_MATCH_RATIO)) if terms else np.zeros(self.size, dtype=bool)
+        exact = self._exact.get(query)
+        if exact is not None:
+            hits[exact] = True
+            scores[exact] = np.inf
+        if mask is not None:
+            hits &= mask
+        rows = np.flatnonzero(hits)
+        return rows[np.argsort(-scores[rows], kind='stable')]
+
+
+def snippet(question, query, length=SNIPPET_LENGTH):
+    """题干摘要：从第一个命中的查询词附近截取"""
+    content = question.get('content') or ''
+    if len(content) <= length:
+        return content
+    lowered = content.lower()
+    positions = [lowered.find(term) for term in tokenize(query, unigrams=False)]
+    positions = [pos for pos in positions if pos >= 0]
+    start = max(0, min(positions) - length // 4) if positions else 0
+    text = content[start:start + length]
+    return ('…' if start > 0 else '') + text + ('…' if start + length < len(content) else '')
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def search_index(bank):
+    """当前题库的检索索引；题库替换后自动重建"""
+    global _index
+    index = _index
+    if index is not None and index.bank is bank:
+        return index
+    with _index_lock:
+        index = _index
+        if index is None or index.bank is not bank:
+            index = SearchIndex(bank)
+            _index = index
+    return index
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+题库列表的列式查询（/get_question_bank、/get_important_bank）
+
+- BankColumns：每个题库构建一次的列（题型、ID 排序名次），与 QuestionBank 一起整体替换
+- UserColumns：用户的已做/错题/重点/做错次数/最后做题时间列，随用户统计缓存一起失效
+- 筛选是布尔掩码，排序是稳定 argsort，只有当前页的行才转换为 dict
+"""
+
+import datetime
+
+import numpy as np
+
+from question_bank import QuestionSet
+
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+
+def _bits_to_mask(bits, size):
+    """位图整数 -> 长度为 size 的布尔数组（第 i 位对应序号 i）"""
+    if not bits or not size:
+        return np.zeros(size, dtype=bool)
+    raw = np.frombuffer(bits.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder='little')[:size].astype(bool)
+
+
+def bits_mask(bank, bits):
+    """当前题库布局下的序号位图（如主题位图） -> 布尔数组，可与其他列式筛选按位与"""
+    return _bits_to_mask(bits, len(bank.questions))
+
+
+def _id_sort_key(qid):
+    # 数字ID按数值、其余按字符串排序，数字在前
+    return (0, qid, '') if isinstance(qid, int) else (1, 0, str(qid))
+
+
+def _parse_time(value):
+    try:
+        return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except Exception:
+        return None
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MINUTE = datetime.timedelta(minutes=1)
+
+
+def display_minutes(dt):
+    """按显示的时间（墙上时间，忽略时区）换算的分钟数：排序与原实现按显示文本比较一致"""
+    return (dt.replace(tzinfo=None) - _EPOCH) // _MINUTE
+
+
+def format_time(value):
+    """与原逐题实现一致：能解析则格式化到分钟，否则简单截取"""
+    dt = _parse_time(value)
+    if dt is not None:
+        return dt.strftime(TIME_FORMAT)
+    return (value or '')[:16]
+
+
+class BankColumns:
+    def __init__(self, bank):
+        self.bank = bank
+        questions = bank.questions
+        self.size = len(questions)
+        self.types = np.fromiter((q['type'] for q in questions), dtype=np.int16, count=self.size)
+        order = sorted(range(self.size), key=lambda i: _id_sort_key(questions[i]['id']))
+        self.id_rank = np.empty(self.size, dtype=np.int64)
+        self.id_rank[order] = np.arange(self.size)
+
+
+class UserColumns:
+    def __init__(self, columns, stats):
+        bank = columns.bank
+        size = columns.size
+        self.bank = bank
+        self.answered = self._mask(stats['answered_questions'], bank, size)
+        self.wrong = self._mask(stats['wrong_questions'], bank, size)
+        self.important = self._mask(stats['important_questions'], bank, size)
+        self.wrong_count = np.zeros(size, dtype=np.int64)
+        for qid, count in stats['wrong_count_map'].items():
+            ordinal = bank.ordinal(qid)
+            if ordinal is not None:
+                self.wrong_count[ordinal] += count
+        # 最后做题时间（分钟）：只有错题有记录；-inf 表示没有时间
+        self.last_epoch = np.full(size, -np.inf)
+        self.last_text = {}
+        for qid, timestamp in stats['wrong_times'].items():
+            ordinal = bank.ordinal(qid)
+            if ordinal is None or ordinal in self.last_text:
+                continue
+            self.last_text[ordinal] = timestamp
+            dt = _parse_time(timestamp)
+            if dt is not None:
+                # 显示精度为分钟，排序也按显示的分钟比较，同一分钟内保持题库顺序
+                self.last_epoch[ordinal] = display_minutes(dt)
+
+    @staticmethod
+    def _mask(question_set, bank, size):
+        if isinstance(question_set, QuestionSet):
+            return _bits_to_mask(question_set.rebased(bank.layout).bits, size)
+        mask = np.zeros(size, dtype=bool)
+        for qid in question_set:
+            ordinal = bank.ordinal(qid)
+            if ordinal is not None:
+                mask[ordinal] = True
+        return mask
+
+
+_bank_columns = None
+
+
+def bank_columns(bank):
+    """当前题库的列；题库替换后自动重建"""
+    global _bank_columns
+    columns = _bank_columns
+    if columns is None or columns.bank is not bank:
+        columns = BankColumns(bank)
+        _bank_columns = columns
+    return columns
+
+
+def user_columns(bank, stats):
+    """用户列缓存在用户统计中，用户数据变化时随统计缓存一起失效"""
+    columns = stats.get('_columns')
+    if columns is None or columns.bank is not bank:
+        columns = UserColumns(bank_columns(bank), stats)
+        stats['_columns'] = columns
+    return columns
+
+
+def status_mask(user, status_filter):
+    if status_filter == 'unanswered':
+        return ~user.answered
+    if status_filter == 'correct':
+        return user.answered & ~user.wrong
+    if status_filter == 'wrong':
+        return user.wrong.copy()
+    if status_filter == 'frequent_wrong':
+        return user.wrong & (user.wrong_count >= 3)
+    if status_filter == 'important':
+        return user.important.copy()
+    return np.ones(user.answered.shape, dtype=bool)
+
+
+def question_rows(bank, stats, ordinals, now_text=None, difficulty=None):
+    """把题库序号转换为列表行（题目ID、编号、题型与用户状态；传入 difficulty 时附带全站作答次数与正确率）"""
+    user = user_columns(bank, stats)
+    attempts, rate = difficulty.columns(bank) if difficulty is not None else (None, None)
+    if now_text is None:
+        now_text = datetime.datetime.now().strftime(TIME_FORMAT)
+    rows = []
+    for ordinal in ordinals:
+        question = bank.questions[ordinal]
+        is_answered = bool(user.answered[ordinal])
+        last_time = None
+        if is_answered:
+            text = user.last_text.get(ordinal)
+            last_time = format_time(text) if text is not None else now_text
+        rows.append({
+            'id': question['id'],
+            'number': question.get('number'),
+            'type': question['type'],
+            'is_answered': is_answered,
+            'is_wrong': bool(user.wrong[ordinal]),
+            'wrong_count': int(user.wrong_count[ordinal]),
+            'last_answered_time': last_time,
+            'is_important': bool(user.important[ordinal])
+        })
+        if attempts is not None:
+            rows[-1]['global_attempts'] = int(attempts[ordinal])
+            rows[-1]['global_correct_rate'] = None if np.isnan(rate[ordinal]) else round(float(rate[ordinal]), 4)
+    return rows
+
+
+def query_pages(bank, stats, mask, sort_by, pages, page_size, difficulty=None):
+    """按题型筛选、排序、分页
+
+    mask 为题库序号上的布尔数组；pages 为 {题型: 页码}；difficulty 为全站难度统计（可选，支持按正确率排序）。
+    返回 {题型: (当前页 dict 列表, 分页信息)}
+    """
+    columns = bank_columns(bank)
+    user = user_columns(bank, stats)
+    now = datetime.datetime.now()
+    # 做对的题没有时间记录，按当前时间处理；未做的题（没有时间）排在最前，与原实现一致
+    last_epoch = np.where(user.answered, user.last_epoch, np.inf)
+    last_epoch[user.answered & np.isneginf(last_epoch)] = display_minutes(now)
+    now_text = now.strftime(TIME_FORMAT)
+    if sort_by == 'correct_rate' and difficulty is not None:
+        # 正确率从低到高（难题在前），无人作答的题排在最后
+        _, rate = difficulty.columns(bank)
+        rate = np.where(np.isnan(rate), np.inf, rate)
+
+    result = {}
+    for q_type, page_num in pages.items():
+        rows = np.flatnonzero(mask & (columns.types == q_type))
+        if sort_by == 'id':
+            rows = rows[np.argsort(columns.id_rank[rows], kind='stable')]
+        elif sort_by == 'wrong_count':
+            rows = rows[np.argsort(-user.wrong_count[rows], kind='stable')]
+        elif sort_by == 'last_answered':
+            rows = rows[np.argsort(-last_epoch[rows], kind='stable')]
+        elif sort_by == 'correct_rate' and difficulty is not None:
+            rows = rows[np.argsort(rate[rows], kind='stable')]
+
+        total = int(rows.size)
+        start = (page_num - 1) * page_size
+        end = start + page_size
+        page = question_rows(bank, stats, rows[max(start, 0):max(end, 0)].tolist(), now_text, difficulty)
+        result[q_type] = (page, {
+            'total_count': total,
+            'current_page': page_num,
+            'total_pages': (total + page_size - 1) // page_size,
+            'has_next': end < total,
+            'has_prev': page_num > 1
+        })
+    return result
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+题目主题：离线聚类生成主题索引，应用加载后按主题筛选
+
+离线：TF-IDF（与检索相同的二元组切词）+ 球面 K-means，把题目分成若干主题，
+每个主题取中心向量中最有区分度的几个词作为名称，写入 question_topics.json：
+{"bank_version": "...", "topics": [{"id": "t01", "label": "聚类、样本、距离", "terms": [...], "ids": [题目ID...]}]}
+
+在线：TopicIndex 把每个主题的题目ID转换为当前题库的序号位图，筛选只做按位与；
+题库更新后文件中已不存在的题目被忽略，新增的题目在重新生成之前不属于任何主题。
+
+用法：
+    python question_topics.py                      # 读取 full_questions.json，写入 question_topics.json
+    python question_topics.py --k 24 --output question_topics.json full_questions.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+from collections import Counter
+
+import numpy as np
+
+from question_search import question_text, tokenize
+
+DEFAULT_TOPICS = 20
+MAX_FEATURES = 2000
+MAX_DF_RATIO = 0.3
+LABEL_TERMS = 3
+KMEANS_ITERATIONS = 30
+
+
+def _tfidf(questions):
+    """返回 (L2 归一化的 TF-IDF 矩阵, 词表)"""
+    docs = [Counter(tokenize(question_text(q), unigrams=False)) for q in questions]
+    df = Counter()
+    for counts in docs:
+        df.update(counts.keys())
+    size = len(questions)
+    candidates = [(count, term) for term, count in df.items() if 2 <= count <= max(2, MAX_DF_RATIO * size)]
+    candidates.sort(key=lambda item: (-item[0], item[1]))
+    vocab = [term for _, term in candidates[:MAX_FEATURES]]
+    term_index = {term: i for i, term in enumerate(vocab)}
+    matrix = np.zeros((size, len(vocab)), dtype=np.float32)
+    for row, counts in enumerate(docs):
+        for term, tf in counts.items():
+            column = term_index.get(term)
+            if column is not None:
+                matrix[row, column] = 1 + np.log(tf)
+    idf = np.log((1 + size) / (1 + np.array([df[t] for t in vocab], dtype=np.float32))) + 1
+    matrix *= idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms > 0, norms, 1)
+    return matrix, vocab
+
+
+def _kmeans(matrix, k, seed=0, iterations=KMEANS_ITERATIONS):
+    """球面 K-means（余弦相似度），k-means++ 初始化；返回 (每题所属簇, 簇中心)"""
+    rng = np.random.RandomState(seed)
+    size = matrix.shape[0]
+    k = max(1, min(k, size))
+    centers = [matrix[rng.randint(size)]]
+    distance = 1 - matrix @ centers[0]
+    for _ in range(1, k):
+        weights = np.clip(distance, 0, None) ** 2
+        total = weights.sum()
+        index = rng.choice(size, p=weights / total) if total > 0 else rng.randint(size)
+        centers.append(matrix[index])
+        distance = np.minimum(distance, 1 - matrix @ matrix[index])
+    centers = np.array(centers)
+    labels = np.zeros(size, dtype=np.int64)
+    for _ in range(iterations):
+        similarity = matrix @ centers.T
+        new_labels = similarity.argmax(axis=1)
+        for cluster in range(k):
+            members = matrix[new_labels == cluster]
+            if len(members) == 0:
+                # 空簇：用离所属中心最远的题目重新开始
+                farthest = similarity.max(axis=1).argmin()
+                new_labels[farthest] = cluster
+                members = matrix[farthest:farthest + 1]
+            center = members.sum(axis=0)
+            norm = np.linalg.norm(center)
+            centers[cluster] = center / norm if norm > 0 else center
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+    return labels, centers
+
+
+def _phrases(terms):
+    """把首尾相接的二元组拼成短语（如 流动 + 动性 -> 流动性），保持原有的先后顺序"""
+    phrases = []
+    used = set()
+    for term in terms:
+        if term in used:
+            continue
+        phrase = term
+        used.add(term)
+        extended = True
+        while extended:
+            extended = False
+            for other in terms:
+                if other in used or other.isascii() or phrase.isascii():
+                    continue
+                if phrase[-1] == other[0]:
+                    phrase += other[1:]
+                elif other[-1] == phrase[0]:
+                    phrase = other[:-1] + phrase
+                else:
+                    continue
+                used.add(other)
+                extended = True
+        if not any(phrase in existing for existing in phrases):
+            phrases.append(phrase)
+    return phrases
+
+
+def build_topics(questions, k=DEFAULT_TOPICS, seed=0):
+    """聚类生成主题列表（按题目数降序编号）"""
+    if not questions:
+        return []
+    matrix, vocab = _tfidf(questions)
+    labels, centers = _kmeans(matrix, k, seed)
+    # 名称取各簇中心相对全局平均最突出的词
+    distinct = centers - matrix.mean(axis=0)
+    clusters = []
+    for cluster in range(len(centers)):
+        ids = [questions[i]['id'] for i in np.flatnonzero(labels == cluster)]
+        if not ids:
+            continue
+        terms = [vocab[i] for i in np.argsort(-distinct[cluster])[:LABEL_TERMS * 3]]
+        clusters.append((ids, _phrases(terms)))
+    clusters.sort(key=lambda item: -len(item[0]))
+    return [
+        {'id': f't{n:02d}', 'label': '、'.join(terms[:LABEL_TERMS]), 'terms': terms, 'ids': ids}
+        for n, (ids, terms) in enumerate(clusters, 1)
+    ]
+
+
+class TopicIndex:
+    """主题 -> 当前题库序号位图"""
+
+    def __init__(self, bank, config):
+        self.bank = bank
+        self.bank_version = config.get('bank_version')
+        self.topics = []
+        self.bits = {}
+        for topic in config.get('topics', []):
+            question_set = bank.new_set(qid for qid in topic.get('ids', []) if bank.get(qid) is not None)
+            self.bits[topic['id']] = question_set.bits
+            self.topics.append({'id': topic['id'], 'label': topic.get('label') or topic['id'],
+                                'count': len(question_set)})
+
+    def mask(self, topic_id):
+        """主题对应的位掩码；未知主题返回 None"""
+        return self.bits.get(topic_id)
+
+
+_index = None
+_index_key = None
+_index_lock = threading.Lock()
+
+
+def topic_index(bank, path):
+    """当前题库 + 主题文件对应的索引；题库替换或文件更新后重新加载，文件不存在时返回 None"""
+    global _index, _index_key
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (id(bank), stat.st_mtime_ns, stat.st_size)
+    index = _index
+    if index is not None and index.bank is bank and _index_key == key:
+        return index
+    with _index_lock:
+        if _index is None or _index.bank is not bank or _index_key != key:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                _index = TopicIndex(bank, config)
+            except Exception as e:
+                print(f"Warning: Failed to load question topics from {path}: {e}")
+                _index = None
+                return None
+            _index_key = key
+            if _index.bank_version and bank.version and _index.bank_version != bank.version:
+                print(f"Warning: {path} was generated for another bank version; re-run question_topics.py")
+        return _index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='题目主题聚类，生成主题索引')
+    parser.add_argument('bank', nargs='?', default='full_questions.json', help='题库 JSON')
+    parser.add_argument('--k', type=int, default=DEFAULT_TOPICS, help='主题数')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子（相同题库与种子结果相同）')
+    parser.add_argument('--output', default='question_topics.json', help='输出文件')
+    args = parser.parse_args(argv)
+
+    import hashlib
+    with open(args.bank, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw.decode('utf-8'))
+    questions = data['questions'] if isinstance(data, dict) else data
+    topics = build_topics(questions, args.k, args.seed)
+    output = {'bank_version': hashlib.sha256(raw).hexdigest(), 'topics': topics}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(output, f, ensure_ascii=False, separators=(',', ':'))
+    for topic in topics:
+        print(f"{topic['id']} {len(topic['ids']):4d} 题  {topic['label']}")
+    print(f"已写入 {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+复习模式的间隔重复调度（SM-2）
+
+每个用户的复习状态保存在 user['review']，只保存卡片，可直接 JSON 序列化：
+{"cards": {"题目ID": [到期时间(秒), 间隔(天), 难度系数, 连续答对次数]}}
+
+另外每个题型一个按到期时间排列的最小堆 {"题型": [[到期时间, "题目ID"], ...]}，
+只在内存中（ReviewState.heaps），加载后首次取题时由卡片重建，保存的数据大小只与卡片数成正比。
+重新调度时只压入新条目，旧条目在取题时发现到期时间与卡片不一致再弹出（延迟删除），
+取下一道到期题为 O(log n)，没有到期题时只看堆顶即可返回。
+"""
+
+import heapq
+
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+DAY_SECONDS = 86400
+# 练习只有对/错两种结果：答对按 SM-2 的质量 4，答错按 1
+QUALITY_CORRECT = 4
+QUALITY_WRONG = 1
+
+
+class ReviewState(dict):
+    """复习状态：字典内容（cards）随用户数据保存；heaps 为实例属性，不参与序列化，None 表示尚未建立"""
+    heaps = None
+
+
+def new_state():
+    state = ReviewState(cards={})
+    state.heaps = {}
+    return state
+
+
+def load_state(value):
+    """由保存的数据建立复习状态：只取卡片（旧版本保存的 heaps 丢弃），堆在首次取题时重建"""
+    if isinstance(value, ReviewState):
+        return value
+    cards = (value or {}).get('cards') or {}
+    return ReviewState(cards={str(key): list(card) for key, card in cards.items()})
+
+
+def _heaps(state, type_of):
+    """按题型的堆；尚未建立时由卡片重建（type_of：题目ID字符串 -> 题型，返回 None 的题不入堆）"""
+    heaps = getattr(state, 'heaps', None)
+    if heaps is None:
+        heaps = {}
+        for key, card in state['cards'].items():
+            q_type = type_of(key)
+            if q_type is not None:
+                heaps.setdefault(str(q_type), []).append([card[0], key])
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        if isinstance(state, ReviewState):
+            state.heaps = heaps
+    return heaps
+
+
+def _next_card(card, is_correct, now):
+    """按 SM-2 计算新的 [到期时间, 间隔, 难度系数, 连续答对次数]"""
+    if card is None:
+        interval, ease, reps = 0, DEFAULT_EASE, 0
+    else:
+        _, interval, ease, reps = card
+    quality = QUALITY_CORRECT if is_correct else QUALITY_WRONG
+    if quality >= 3:
+        reps += 1
+        if reps == 1:
+            interval = 1
+        elif reps == 2:
+            interval = 6
+        else:
+            interval = max(1, round(interval * ease))
+    else:
+        reps = 0
+        interval = 1
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    return [int(now) + interval * DAY_SECONDS, interval, round(ease, 2), reps]
+
+
+def record_review(state, question_id, question_type, is_correct, now):
+    """记录一次作答并重新调度该题"""
+    key = str(question_id)
+    cards = state['cards']
+    card = _next_card(cards.get(key), is_correct, now)
+    cards[key] = card
+    if getattr(state, 'heaps', None) is None:
+        # 堆尚未建立：首次取题时由卡片重建，已包含这次调度
+        return card
+    heap = state.heaps.setdefault(str(question_type), [])
+    heapq.heappush(heap, [card[0], key])
+    # 过期条目过多时按卡片重建堆，堆的大小保持在卡片数的常数倍以内
+    if len(heap) > 2 * len(cards) + 16:
+        _rebuild(state)
+    return card
+
+
+def _rebuild(state):
+    cards = state['cards']
+    for q_type, heap in state.heaps.items():
+        live = {}
+        for due, key in heap:
+            if key in cards and cards[key][0] == due:
+                live[key] = due
+        rebuilt = [[due, key] for key, due in live.items()]
+        heapq.heapify(rebuilt)
+        state.heaps[q_type] = rebuilt
+
+
+def _head(state, heap):
+    """弹出堆顶的过期条目，返回有效的堆顶（或 None）"""
+    cards = state['cards']
+    while heap:
+        due, key = heap[0]
+        card = cards.get(key)
+        if card is not None and card[0] == due:
+            return heap[0]
+        heapq.heappop(heap)
+    return None
+
+
+def due_questions(state, now, question_type=0, count=1, accept=None, type_of=None):
+    """取最多 count 道已到期的题（按到期时间先后），不改变调度
+
+    accept 为可选的筛选函数（题目ID字符串 -> bool，如跳过已删除的题），不符合的条目弹出后跳过；
+    只占一小部分题目的筛选（如主题）请用 due_among，不必逐个弹出不相关的条目。
+    type_of（题目ID字符串 -> 题型或 None）用于由卡片重建堆，加载的状态首次取题时必须提供。
+    返回 (题目ID字符串列表, 最近一道未到期题的到期时间或 None)。
+    """
+    all_heaps = _heaps(state, type_of)
+    if question_type:
+        heaps = [all_heaps.get(str(question_type), [])]
+    else:
+        heaps = list(all_heaps.values())
+    taken = []
+    seen = set()
+    result = []
+    next_due = None
+    try:
+        while len(result) < count:
+            best = None
+            for heap in heaps:
+                head = _head(state, heap)
+                if head is not None and (best is None or head[0] < best[1][0]):
+                    best = (heap, head)
+            if best is None:
+                break
+            heap, (due, key) = best
+            accepted = accept is None or accept(key)
+            if due > now and accepted:
+                next_due = due
+                break
+            heapq.heappop(heap)
+            taken.append((heap, [due, key]))
+            if due <= now and accepted and key not in seen:
+                seen.add(key)
+                result.append(key)
+    finally:
+        # 只是查看：取出的条目放回堆中，等作答后再重新调度
+        for heap, entry in taken:
+            heapq.heappush(heap, entry)
+    return result, next_due
+
+
+def due_among(state, keys, now, count=1):
+    """在给定题目（题目ID字符串，如某主题内有卡片的题）中取最多 count 道已到期的题
+
+    只查看这些题的卡片，耗时与 keys 的个数成正比。返回值与 due_questions 相同。
+    """
+    cards = state['cards']
+    due = []
+    next_due = None
+    for key in keys:
+        card = cards.get(key)
+        if card is None:
+            continue
+        if card[0] <= now:
+            due.append((card[0], key))
+        elif next_due is None or card[0] < next_due:
+            next_due = card[0]
+    return [key for _, key in heapq.nsmallest(count, due)], next_due
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+连接池的测试：用 connect= 注入假连接，不需要数据库
+"""
+
+import threading
+import time
+
+import pytest
+
+import app as app_module
+import db_pool
+from db_pool import DBConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append(sql)
+        if self.conn.fail_execute:
+            raise RuntimeError('server closed the connection unexpectedly')
+
+
+class FakeConnection:
+    def __init__(self, dsn):
+        self.dsn = dsn
+        self.closed = 0
+        self.executed = []
+        self.rollbacks = 0
+        self.fail_execute = False
+        self.fail_rollback = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        if self.fail_rollback:
+            raise RuntimeError('connection lost')
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeConnect:
+    """记录所有建立过的连接；fail_after 之后的连接建立失败"""
+
+    def __init__(self, fail_after=None):
+        self.connections = []
+        self.fail_after = fail_after
+
+    def __call__(self, dsn):
+        if self.fail_after is not None and len(self.connections) >= self.fail_after:
+            raise RuntimeError('could not connect to server')
+        conn = FakeConnection(dsn)
+        self.connections.append(conn)
+        return conn
+
+
+def test_checkout_waits_then_times_out():
+    connect = FakeConnect()
+    pool = DBConnectionPool('dsn', minconn=1, maxconn=1, timeout=0.05, connect=connect)
+    conn = pool.getconn()
+    started = time.time()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert time.time() - started >= 0.04
+    assert pool.stats()['timeouts'] == 1
+
+    # 另一个线程稍后归还：等待中的借用者拿到同一个连接
+    threading.Timer(0.05, pool.putconn, args=(conn,)).start()
+    assert pool.getconn(timeout=2) is conn
+    stats = pool.stats()
+    assert stats['in_use'] == 1 and stats['created'] == 1 and stats['max_wait_ms'] >= 40
+
+
+def test_idle_connections_are_health_checked():
+    connect = FakeConnect()
+    pool = DBConnectionPool('dsn', minconn=1, maxconn=2, healthcheck_idle=0, connect=connect)
+    first = connect.connections[0]
+    conn = pool.getconn()
+    assert conn is first and first.executed == ['SELECT 1']
+    pool.putconn(conn)
+
+    # 探活失败：丢弃后新建
+    first.fail_execute = True
+    conn = pool.getconn()
+    assert conn is not first and first.closed
+    assert pool.stats()['discarded'] == 1 and pool.stats()['created'] == 2
+    pool.putconn(conn)
+
+    # 已关闭的连接不经探活直接丢弃
+    conn.closed = 1
+    replacement = pool.getconn()
+    assert replacement is not conn and len(connect.connections) == 3
+
+
+def test_putconn_rolls_back_and_drops_broken_connections():
+    connect = FakeConnect()
+    pool = DBConnectionPool('dsn', minconn=0, maxconn=2, connect=connect)
+    with pool.connection() as conn:
+        pass
+    assert conn.rollbacks == 1 and pool.stats()['idle'] == 1
+
+    with pool.connection() as conn:
+        conn.fail_rollback = True
+    assert conn.closed and pool.stats()['idle'] == 0
+
+    # 使用中连接断开并抛出异常：归还时丢弃，名额释放
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.closed = 1
+            raise RuntimeError('query failed')
+    stats = pool.stats()
+    assert stats['in_use'] == 0 and stats['idle'] == 0 and stats['discarded'] == 2
+
+
+def test_failed_connect_releases_the_slot():
+    connect = FakeConnect(fail_after=0)
+    pool = DBConnectionPool('dsn', minconn=0, maxconn=1, timeout=0.01, connect=connect)
+    with pytest.raises(RuntimeError):
+        pool.getconn()
+    connect.fail_after = None
+    assert pool.getconn() is connect.connections[0]
+
+
+def test_partial_warmup_closes_created_connections():
+    connect = FakeConnect(fail_after=2)
+    with pytest.raises(RuntimeError):
+        DBConnectionPool('dsn', minconn=3, maxconn=5, connect=connect)
+    assert len(connect.connections) == 2 and all(conn.closed for conn in connect.connections)
+
+
+def test_init_db_pool_closes_pool_when_schema_setup_fails(monkeypatch):
+    connect = FakeConnect()
+
+    class Pool(DBConnectionPool):
+        def __init__(self, dsn, **kwargs):
+            super().__init__(dsn, connect=connect, **kwargs)
+
+    monkeypatch.setattr(db_pool, 'DBConnectionPool', Pool)
+    monkeypatch.setattr(app_module, 'DB_URL', 'postgresql://example/db')
+    monkeypatch.setattr(app_module, 'DB_POOL_MIN', 2)
+    monkeypatch.setattr(app_module, '_db_pool', None)
+    monkeypatch.setattr(app_module, '_db_retry_at', 0)
+    real_connect = FakeConnect.__call__
+
+    def failing(self, dsn):
+        conn = real_connect(self, dsn)
+        conn.fail_execute = True
+        return conn
+
+    monkeypatch.setattr(FakeConnect, '__call__', failing)
+    assert app_module.init_db_pool() is None
+    assert len(connect.connections) == 2 and all(conn.closed for conn in connect.connections)
+    # 重试间隔内不再建池
+    assert app_module.init_db_pool() is None and len(connect.connections) == 2
+
+    monkeypatch.setattr(FakeConnect, '__call__', real_connect)
+    monkeypatch.setattr(app_module, '_db_retry_at', 0)
+    pool = app_module.init_db_pool()
+    assert pool is not None and app_module.db_available()
+    assert connect.connections[-1].executed[0].startswith('CREATE TABLE IF NOT EXISTS kv_store')
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+考试的测试：试卷按题目ID引用保存、按开始时的题库版本评分，蓝图组卷可复现，增量自动保存，超时结算，考试记录分页
+"""
+
+import datetime
+import json
+
+import pytest
+
+import app as app_module
+from exam_blueprint import ExamBlueprint
+from question_bank import QuestionBank
+
+
+def _question(qid, content, answer):
+    return {'id': qid, 'number': qid, 'type': 1, 'content': content,
+            'options': [{'tag': tag, 'content': tag, 'is_correct': tag == answer} for tag in 'ABCD'],
+            'correct_answer': answer, 'analysis': '', 'score': 1}
+
+
+def _saved_records(user_id):
+    with open(app_module.USER_DATA_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)['exam_records'][user_id]
+
+
+def test_exam_record_stores_question_ids(storage, login):
+    client = storage('blob')
+    user_id = login(client)
+    bank = app_module.load_question_bank()
+    exam = client.post('/start_exam', json={}).get_json()
+    record, = _saved_records(user_id)
+    assert 'questions' not in record
+    assert record['question_ids'] == [q['id'] for q in exam['questions']]
+    assert record['bank_version'] == bank.version
+    # 恢复未完成的考试时得到同一份试卷
+    assert client.post('/start_exam', json={}).get_json()['questions'] == exam['questions']
+
+
+def test_exam_questions_follow_their_bank_version(storage):
+    """考试按开始时的题库版本取题：之后修改或删除的题目从存档中取"""
+    storage('blob')
+    v1 = QuestionBank([_question(1, '一', 'A'), _question(2, '二', 'B'), _question(3, '三', 'C')], version='v1')
+    v2 = QuestionBank([_question(1, '一', 'D'), _question(3, '三', 'C')], version='v2')
+    v3 = QuestionBank([_question(1, '一改', 'D'), _question(3, '三', 'C'), _question(4, '四', 'A')], version='v3')
+    app_module.archive_question_bank(v1, v2)
+    app_module.archive_question_bank(v2, v3)
+
+    def answers(record):
+        return [q['correct_answer'] for q in app_module._exam_questions(record, v3)]
+
+    assert answers({'question_ids': [1, 2, 3], 'bank_version': 'v1'}) == ['A', 'B', 'C']
+    assert answers({'question_ids': [1, 3], 'bank_version': 'v2'}) == ['D', 'C']
+    assert app_module._exam_question({'bank_version': 'v2'}, 1, v3)['content'] == '一'
+    assert answers({'question_ids': [1, 4], 'bank_version': 'v3'}) == ['D', 'A']
+    # 记录自带的副本优先；未知版本按当前题库
+    assert answers({'question_ids': [1], 'bank_version': 'v1',
+                    'question_overrides': {'1': _question(1, '一', 'B')}}) == ['B']
+    assert answers({'question_ids': [1, 2], 'bank_version': 'v0'}) == ['D']
+
+    # 存档持久化：重新加载后结果相同
+    app_module._question_archive = None
+    assert answers({'question_ids': [1, 2, 3], 'bank_version': 'v1'}) == ['A', 'B', 'C']
+
+
+def test_legacy_exam_copies_become_overrides():
+    """旧记录嵌入的题目副本：与题库一致的只留ID，已修改或删除的保留副本"""
+    bank = QuestionBank([_question(1, '一', 'A'), _question(2, '二', 'B')], version='v1')
+    record = {'exam_id': 'e1', 'questions': [_question(1, '一', 'A'), _question(2, '二', 'C'), _question(5, '五', 'D')],
+              'wrong_answers': [{'question_id': 2, 'user_answer': 'B', 'question_content': '二', 'analysis': ''}]}
+    app_module._compact_exam_record(record, bank)
+    assert record['question_ids'] == [1, 2, 5] and 'questions' not in record
+    assert set(record['question_overrides']) == {'2', '5'}
+    assert record['wrong_answers'] == [{'question_id': 2, 'user_answer': 'B'}]
+    assert [q['correct_answer'] for q in app_module._exam_questions(record, bank)] == ['A', 'C', 'D']
+
+
+def _bank(count):
+    return QuestionBank([_question(qid, str(qid), 'A') for qid in range(1, count + 1)], version='v1')
+
+
+def test_blueprint_is_reproducible_with_seed():
+    bank = _bank(30)
+    blueprint = ExamBlueprint('quick', [(1, 10, 2)])
+    paper = [q['id'] for q in blueprint.generate(bank, seed=7, exclude_ids=[1, 2, 3])]
+    assert paper == [q['id'] for q in blueprint.generate(bank, seed=7, exclude_ids=[1, 2, 3])]
+    assert len(set(paper)) == 10 and not set(paper) & {1, 2, 3}
+    assert paper != [q['id'] for q in blueprint.generate(bank, seed=8, exclude_ids=[1, 2, 3])]
+    with pytest.raises(ValueError):
+        ExamBlueprint('big', [(1, 31, 2)]).generate(bank, seed=7)
+
+
+def test_blueprint_falls_back_to_excluded_questions():
+    """避开的题目太多：先取全部未避开的题，不足部分再从避开的题中补齐"""
+    bank = _bank(12)
+    blueprint = ExamBlueprint('quick', [(1, 8, 2)])
+    excluded = list(range(1, 9))
+    for seed in range(20):
+        paper = [q['id'] for q in blueprint.generate(bank, seed=seed, exclude_ids=excluded)]
+        assert len(set(paper)) == 8
+        assert {9, 10, 11, 12} <= set(paper)
+    # 题库中不存在的ID不影响组卷
+    paper = [q['id'] for q in blueprint.generate(bank, seed=1, exclude_ids=[99])]
+    assert paper == [q['id'] for q in blueprint.generate(bank, seed=1)]
+
+
+def test_start_exam_with_seed_and_recent_exclusion(storage, login, monkeypatch):
+    client = storage('blob')
+    blueprint = ExamBlueprint('quick', [(1, 5, 2)], duration_seconds=600, exclude_recent_exams=1)
+    monkeypatch.setattr(app_module, 'EXAM_BLUEPRINTS', dict(app_module.EXAM_BLUEPRINTS, quick=blueprint))
+    alice = login(client, 'alice')
+    assert client.post('/start_exam', json={'blueprint': 'quick', 'seed': 'abc'}).get_json() == {'error': 'seed 必须是整数'}
+    assert client.post('/start_exam', json={'blueprint': 'missing'}).get_json() == {'error': '考试类型不存在'}
+    first = client.post('/start_exam', json={'blueprint': 'quick', 'seed': '42'}).get_json()
+    first_ids = [q['id'] for q in first['questions']]
+    assert first['blueprint']['total_points'] == 10 and first['time_left'] == 600
+
+    # 同一 seed、同一题库：另一个用户得到同一份试卷
+    other = app_module.app.test_client()
+    login(other, 'bob')
+    assert [q['id'] for q in other.post('/start_exam', json={'blueprint': 'quick', 'seed': 42}).get_json()['questions']] == first_ids
+
+    client.post('/submit_exam', json={'exam_id': first['exam_id'], 'answers': {}})
+    second = client.post('/start_exam', json={'blueprint': 'quick', 'seed': 42}).get_json()
+    assert not set(first_ids) & {q['id'] for q in second['questions']}
+    records = _saved_records(alice)
+    assert records[0]['seed'] == 42 and 'excluded_ids' not in records[0]
+    assert records[1]['excluded_ids'] == first_ids and records[1]['type_scores'] == {'1': 2}
+
+
+def _ongoing_record(user_id, exam_id):
+    return app_module._find_exam_record(app_module.load_user_data(), user_id, exam_id)
+
+
+@pytest.mark.parametrize('mode', ['blob', 'journal'])
+def test_autosave_seq_protocol(storage, login, restart_journal, mode):
+    """增量保存的序号：重复请求返回当前序号，跳号返回 conflict，整体保存后旧增量被忽略"""
+    client = storage(mode)
+    user_id = login(client)
+    exam = client.post('/start_exam', json={}).get_json()
+    exam_id = exam['exam_id']
+    first, second = (str(q['id']) for q in exam['questions'][:2])
+
+    def patch(seq, changes):
+        return client.post('/patch_exam_progress', json={'exam_id': exam_id, 'seq': seq, 'changes': changes}).get_json()
+
+    assert patch(1, {first: 'A'}) == {'success': True, 'seq': 1}
+    # 重试：不再合并
+    assert patch(1, {first: 'B'}) == {'success': True, 'seq': 1}
+    conflict = patch(3, {second: 'C'})
+    assert conflict['conflict'] and conflict['seq'] == 1
+    assert patch(2, {second: 'C'}) == {'success': True, 'seq': 2}
+
+    # 卸载页面时的整体保存带客户端下一个未用的序号
+    saved = client.post('/save_exam_progress', json={'exam_id': exam_id, 'answers': {first: 'D'}, 'seq': 5}).get_json()
+    assert saved == {'success': True, 'seq': 5}
+    assert patch(4, {second: 'E'}) == {'success': True, 'seq': 5}
+    record = _ongoing_record(user_id, exam_id)
+    assert record['answers'] == {first: 'D'} and record['answers_seq'] == 5
+
+    assert patch(6, {second: 'F'}) == {'success': True, 'seq': 6}
+    if mode == 'blob':
+        # 后台线程不整体改写 blob，只有请求侧或退出时才保存
+        assert app_module.flush_exam_sessions(background=True) == 0
+        assert _ongoing_record(user_id, exam_id)['answers_seq'] == 5
+        assert app_module.flush_exam_sessions() == 1
+    else:
+        assert app_module.flush_exam_sessions(background=True) == 1
+        restart_journal()
+    record = _ongoing_record(user_id, exam_id)
+    assert record['answers'] == {first: 'D', second: 'F'} and record['answers_seq'] == 6
+
+
+def test_blob_autosave_does_not_rewrite_blob_on_every_patch(storage, login, monkeypatch):
+    """blob 模式：增量保存留在会话中，每隔 EXAM_BLOB_SAVE_INTERVAL 才整体保存一次"""
+    client = storage('blob')
+    user_id = login(client)
+    exam = client.post('/start_exam', json={}).get_json()
+    exam_id = exam['exam_id']
+    qids = [str(q['id']) for q in exam['questions']]
+    writes = []
+    save_blob = app_module._save_blob_user_data
+    monkeypatch.setattr(app_module, '_save_blob_user_data', lambda data: writes.append(1) or save_blob(data))
+    monkeypatch.setattr(app_module, 'EXAM_AUTOSAVE_FLUSH_INTERVAL', 0)
+
+    for seq, qid in enumerate(qids[:5], 1):
+        client.post('/patch_exam_progress', json={'exam_id': exam_id, 'seq': seq, 'changes': {qid: 'A'}})
+    assert writes == [] and 'answers_seq' not in _ongoing_record(user_id, exam_id)
+
+    # 间隔已到：下一次增量保存整体保存一次，并入全部改动
+    app_module._exam_sessions[(user_id, exam_id)]['saved'] -= app_module.EXAM_BLOB_SAVE_INTERVAL
+    client.post('/patch_exam_progress', json={'exam_id': exam_id, 'seq': 6, 'changes': {qids[5]: 'B'}})
+    assert len(writes) == 1
+    record = _ongoing_record(user_id, exam_id)
+    assert record['answers_seq'] == 6 and len(record['answers']) == 6
+    client.post('/patch_exam_progress', json={'exam_id': exam_id, 'seq': 7, 'changes': {qids[6]: 'C'}})
+    assert len(writes) == 1
+
+    # 其他请求的整体保存顺带并入会话中尚未保存的作答
+    app_module.save_user_data(app_module.load_user_data())
+    record, = _saved_records(user_id)
+    assert record['answers_seq'] == 7 and record['answers'][qids[6]] == 'C'
+
+    # 交卷：以提交的完整作答为准并移除会话
+    client.post('/submit_exam', json={'exam_id': exam_id, 'answers': {qids[0]: 'A'}})
+    record, = _saved_records(user_id)
+    assert record['status'] == 'completed' and record['answers'] == {qids[0]: 'A'}
+    assert (user_id, exam_id) not in app_module._exam_sessions
+
+
+def test_queued_expiry_is_settled_when_records_are_read(storage, login):
+    """blob 模式：到期的考试只进入队列，读取考试记录时先结算，不会一直显示为进行中"""
+    client = storage('blob')
+    user_id = login(client)
+    other = app_module.app.test_client()
+    bob = login(other, 'bob')
+    exam_id = client.post('/start_exam', json={}).get_json()['exam_id']
+    bob_exam_id = other.post('/start_exam', json={}).get_json()['exam_id']
+    assert app_module._finalize_expired_exams([(user_id, exam_id)]) == 0
+    assert _saved_records(user_id)[0]['status'] == 'ongoing'
+
+    # 没有排队考试的用户读取时不保存
+    assert other.post('/get_exam_records', json={}).get_json()['records'][0]['status'] == 'ongoing'
+    assert _saved_records(user_id)[0]['status'] == 'ongoing'
+
+    records = client.post('/get_exam_records', json={}).get_json()['records']
+    assert [(r['exam_id'], r['status']) for r in records] == [(exam_id, 'completed')]
+    assert _saved_records(user_id)[0]['status'] == 'completed' and not app_module._expired_exam_queue
+
+    app_module._finalize_expired_exams([(bob, bob_exam_id)])
+    detail = other.post('/get_exam_detail', json={'exam_id': bob_exam_id}).get_json()['exam_detail']
+    assert detail['status'] == 'completed' and 'answers' not in detail
+    assert _saved_records(bob)[0]['status'] == 'completed' and not app_module._expired_exam_queue
+
+
+def test_exam_records_cursor_pagination(storage, login):
+    client = storage('blob')
+    user_id = login(client)
+    start = datetime.datetime(2024, 1, 1, 8, 0)
+    records = [{'exam_id': f'e{i:02d}', 'start_time': (start + datetime.timedelta(hours=i % 7, minutes=i)).isoformat(),
+                'status': 'completed', 'total_score': i, 'question_ids': [], 'answers': {}} for i in range(23)]
+    # 两场考试开始时间相同：按考试ID区分先后
+    records[5]['start_time'] = records[4]['start_time']
+    with open(app_module.USER_DATA_FILE, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    data['exam_records'][user_id] = records
+    data['users'][user_id].pop('exam_index', None)
+    with open(app_module.USER_DATA_FILE, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    expected = [r['exam_id'] for r in sorted(records, key=lambda r: (r['start_time'], r['exam_id']), reverse=True)]
+
+    def fetch(**params):
+        return client.post('/get_exam_records', json=dict(page_size=5, **params)).get_json()
+
+    seen = []
+    cursor = None
+    while True:
+        result = fetch(cursor=cursor)
+        seen.extend(r['exam_id'] for r in result['records'])
+        cursor = result['pagination']['next_cursor']
+        if not cursor:
+            break
+    assert seen == expected
+    assert result['pagination']['total_count'] == 23 and result['pagination']['total_pages'] == 5
+
+    # 页码分页与游标分页结果一致
+    assert [r['exam_id'] for r in fetch(page=2)['records']] == expected[5:10]
+    assert [r['exam_id'] for r in fetch(page=5)['records']] == expected[20:]
+    assert fetch(page=6)['records'] == [] and not fetch(page=6)['pagination']['has_next']
+    # 无效的页码与游标按第一页处理
+    for params in ({'page': 'abc'}, {'page': 0}, {'page': -3}, {'page': None}, {'cursor': 'abc'}, {'cursor': 12}):
+        assert [r['exam_id'] for r in fetch(**params)['records']] == expected[:5]
+    assert [r['exam_id'] for r in fetch(cursor='abc', page=2)['records']] == expected[5:10]
+    assert len(client.post('/get_exam_records', json={'page_size': 'x'}).get_json()['records']) == 10
+    assert client.post('/get_exam_records', data='page=abc').get_json()['success']
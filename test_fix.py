@@ -7,9 +7,21 @@
 
 import sys
 import os
+import tempfile
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+import pytest
+
+import app as app_module
 from app import app, load_user_data, normalize_user_data, get_user_stats_cached
+from conftest import data_paths
+
+
+@pytest.fixture(autouse=True)
+def temp_data_dir(storage):
+    """数据文件（题库缓存、布局登记、用户数据等）写到临时目录，不改动工作目录"""
+    storage('blob')
+
 
 def test_basic_functions():
     """测试基本功能"""
@@ -75,7 +87,9 @@ def test_basic_functions():
     return True
 
 if __name__ == '__main__':
-    with app.app_context():
+    with tempfile.TemporaryDirectory() as data_dir, app.app_context():
+        for name, value in data_paths(data_dir).items():
+            setattr(app_module, name, value)
         success = test_basic_functions()
         if success:
             print("\n🎉 修复验证成功！系统应该可以正常工作了。")
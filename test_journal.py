@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+追加式日志（journal 模式）的回放与快照压缩测试
+"""
+
+import json
+import os
+
+import app as app_module
+
+
+def test_journal_replay_and_compaction(storage, login, restart_journal, user_snapshot):
+    """日志回放与压缩后的数据都与重启前内存中的数据一致"""
+    client = storage('journal')
+    user_id = login(client)
+    questions = app_module.load_question_bank().questions
+    for question in questions[:3]:
+        client.post('/submit_answer', json={'question_id': question['id'], 'answer': 'Z'})
+    client.post('/get_random_question', json={})
+    expected = user_snapshot(app_module.load_user_data(), user_id)
+    assert expected['wrong_questions']
+
+    restart_journal()
+    assert user_snapshot(app_module.load_user_data(), user_id) == expected
+
+    seq = app_module._journal_seq
+    assert app_module.compact_journal()
+    with open(app_module.JOURNAL_SNAPSHOT_FILE, 'r', encoding='utf-8') as f:
+        assert json.load(f)['journal_seq'] == seq
+    assert not os.path.exists(app_module.JOURNAL_PENDING_FILE)
+    assert os.path.getsize(app_module.JOURNAL_FILE) == 0
+
+    # 压缩后的新事件写入新日志，重启时只回放快照之后的部分
+    client.post('/submit_answer', json={'question_id': questions[3]['id'], 'answer': 'Z'})
+    expected = user_snapshot(app_module.load_user_data(), user_id)
+    restart_journal()
+    assert user_snapshot(app_module.load_user_data(), user_id) == expected
+    assert app_module._journal_seq == seq + 1
+
+
+def test_half_written_line_is_skipped(storage, login, restart_journal, user_snapshot):
+    """崩溃时写了一半的最后一行在回放时跳过，之前的事件照常恢复"""
+    client = storage('journal')
+    user_id = login(client)
+    question = app_module.load_question_bank().questions[0]
+    client.post('/submit_answer', json={'question_id': question['id'], 'answer': 'Z'})
+    expected = user_snapshot(app_module.load_user_data(), user_id)
+    with open(app_module.JOURNAL_FILE, 'a', encoding='utf-8') as f:
+        f.write('{"t": "answer", "u": "')
+    restart_journal()
+    assert user_snapshot(app_module.load_user_data(), user_id) == expected
+
+    # 之后追加的事件另起一行，不会与写了一半的记录连在一起
+    client.post('/submit_answer', json={'question_id': app_module.load_question_bank().questions[1]['id'], 'answer': 'Z'})
+    expected = user_snapshot(app_module.load_user_data(), user_id)
+    restart_journal()
+    assert user_snapshot(app_module.load_user_data(), user_id) == expected
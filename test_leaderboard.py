@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+排行榜跳表与竞赛排名的测试
+"""
+
+import bisect
+import random
+
+import app as app_module
+from leaderboard import Leaderboard, LeaderboardService, SkipList
+
+
+def test_skiplist_matches_sorted_list():
+    """随机插入、删除后，名次与区间查询都与有序列表一致"""
+    rng = random.Random(7)
+    skiplist = SkipList(rng=random.Random(1))
+    expected = []
+    for _ in range(3000):
+        key = (-rng.randint(0, 50), f'u{rng.randint(0, 300)}')
+        index = bisect.bisect_left(expected, key)
+        present = index < len(expected) and expected[index] == key
+        if present and rng.random() < 0.5:
+            assert skiplist.remove(key)
+            expected.pop(index)
+        elif not present:
+            skiplist.insert(key)
+            expected.insert(index, key)
+        assert len(skiplist) == len(expected)
+    assert not skiplist.remove((1, 'missing'))
+    for probe in [(-60,), (-25,), (-25, 'u150'), (0, 'u999'), (1,)]:
+        assert skiplist.count_less(probe) == bisect.bisect_left(expected, probe)
+    for start in (0, 1, len(expected) // 2, len(expected) - 1, len(expected)):
+        assert skiplist.slice(start, 17) == expected[start:start + 17]
+    assert skiplist.slice(0, 0) == []
+
+
+def test_competition_ranks():
+    """同分同名次（1, 2, 2, 4），移出排行后名次随之变化"""
+    board = Leaderboard()
+    for user_id, value in [('a', 90), ('b', 80), ('c', 80), ('d', 70)]:
+        board.update(user_id, value)
+    assert board.top(10) == [(1, 'a', 90), (2, 'b', 80), (2, 'c', 80), (4, 'd', 70)]
+    assert board.top(2, offset=2) == [(2, 'c', 80), (4, 'd', 70)]
+    assert board.rank('d') == (4, 70)
+    board.update('b', None)
+    board.update('d', 95)
+    assert board.top(10) == [(1, 'd', 95), (2, 'a', 90), (3, 'c', 80)]
+    assert board.rank('b') == (None, None)
+
+
+def test_service_moves_users_between_cohorts():
+    """换群组时从旧群组的排行中移出；快照可还原"""
+    service = LeaderboardService()
+    service.update('a', ['all', 'class:1'], {'answered': 10, 'best_score': 60})
+    service.update('b', ['all', 'class:1'], {'answered': 20})
+    service.update('a', ['all', 'class:2'], {'answered': 30})
+    assert service.top('class:1', 'answered') == ([(1, 'b', 20)], 1)
+    assert service.rank('all', 'answered', 'a') == (1, 30, 2)
+    assert service.rank('class:2', 'best_score', 'a') == (1, 60, 1)
+
+    revision, data = service.snapshot()
+    assert service.dirty
+    service.mark_saved(revision)
+    assert not service.dirty
+    restored = LeaderboardService.from_json(data)
+    assert not restored.dirty
+    assert restored.top('all', 'answered') == service.top('all', 'answered')
+
+
+def test_live_leaderboard_matches_rebuild(storage, login, monkeypatch):
+    """作答、考试与换群组后的增量排行与扫描全部用户重建的结果一致；只能查看自己所在群组"""
+    storage('blob')
+    monkeypatch.setattr(app_module, '_leaderboard', LeaderboardService())
+    bank = app_module.load_question_bank()
+    clients = {}
+    for index, name in enumerate(('alice', 'bob', 'carol')):
+        client = clients[name] = app_module.app.test_client()
+        login(client, name)
+        client.post('/update_cohort', json={'cohort': 'class-1' if name != 'carol' else 'class-2'})
+        client.post('/submit_answers', json={'answers': [
+            {'question_id': q['id'], 'answer': 'Z'} for q in bank.questions[:10 * (index + 1)]
+        ]})
+        exam = client.post('/start_exam', json={}).get_json()
+        answers = {str(q['id']): q['correct_answer'] for q in exam['questions'][:10 * (index + 1)]}
+        client.post('/submit_exam', json={'exam_id': exam['exam_id'], 'answers': answers})
+    clients['bob'].post('/update_cohort', json={'cohort': 'class-2'})
+
+    live = app_module.get_leaderboard()
+    rebuilt = app_module.rebuild_leaderboard(swap=False)
+    for cohort in ('all', 'group:class-1', 'group:class-2'):
+        for metric in ('answered', 'exam_avg', 'best_score'):
+            assert live.top(cohort, metric, 10) == rebuilt.top(cohort, metric, 10)
+    # 换群组后 bob 从 class-1 的排行中移出
+    assert [uid for _, uid, _ in live.top('group:class-1', 'answered')[0]] == ['alice']
+
+    result = clients['bob'].get('/get_leaderboard?cohort=group:class-2&metric=answered').get_json()
+    assert [row['username'] for row in result['top']] == ['carol', 'bob']
+    assert result['me']['rank'] == 2 and result['me']['total'] == 2
+    assert 'error' in clients['bob'].get('/get_leaderboard?cohort=group:class-1').get_json()
+    assert 'error' in clients['bob'].get('/get_leaderboard?metric=unknown').get_json()
+
+    # 落盘后重新加载：与内存中的排行相同
+    assert app_module.save_leaderboard()
+    monkeypatch.setattr(app_module, '_leaderboard', None)
+    app_module._load_leaderboard()
+    assert app_module.get_leaderboard().top('all', 'exam_avg') == live.top('all', 'exam_avg')
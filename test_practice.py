@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+批量练习的测试：取题不含答案，答案与解析只随 /submit_answers 的判题结果返回；
+未做题模式的游标不重复出题，走完后重新打乱
+"""
+
+import app as app_module
+from question_bank import QuestionBank, QuestionSet
+
+
+def test_practice_batch_reveals_answers_only_after_submit(storage, login):
+    client = storage('blob')
+    login(client)
+    questions = client.post('/get_practice_batch', json={'mode': 'all', 'count': 8}).get_json()['questions']
+    assert len(questions) == 8
+    for question in questions:
+        assert 'correct_answer' not in question and 'analysis' not in question
+        assert question['options'] and question['content']
+
+    bank = app_module.load_question_bank()
+    answers = []
+    for i, question in enumerate(questions):
+        correct = bank.get(question['id'])['correct_answer']
+        if question['type'] == 2:
+            answer = correct.split(',') if i % 2 else ['Z']
+        else:
+            answer = correct if i % 2 else 'Z'
+        answers.append({'question_id': question['id'], 'answer': answer})
+    answers.append({'question_id': 999999, 'answer': 'A'})
+    results = client.post('/submit_answers', json={'answers': answers}).get_json()['results']
+    assert [result['question_id'] for result in results] == [item['question_id'] for item in answers]
+    assert results[-1] == {'question_id': 999999, 'error': '题目不存在'}
+    for i, (question, result) in enumerate(zip(questions, results)):
+        full = bank.get(question['id'])
+        assert result['is_correct'] == bool(i % 2)
+        assert result['correct_answer'] == full['correct_answer'] and result['analysis'] == full['analysis']
+        assert result['user_answer'] == bank.grade(full, answers[i]['answer'])[0]
+
+
+def _question(qid, q_type=1):
+    return {'id': qid, 'number': qid, 'type': q_type, 'content': f'题目{qid}',
+            'options': [{'tag': tag, 'content': tag, 'is_correct': tag == 'A'} for tag in 'ABCD'],
+            'correct_answer': 'A', 'analysis': '', 'score': 1}
+
+
+def _draw(bank, user, count, type_filter=1):
+    questions, _, _ = app_module._next_unanswered(bank, user, type_filter, count)
+    return [q['id'] for q in questions]
+
+
+def test_unanswered_cursor_never_repeats_before_reshuffle():
+    bank = QuestionBank([_question(qid) for qid in range(1, 21)] + [_question(qid, 3) for qid in range(21, 26)], version='v1')
+    user = {'answered_questions': QuestionSet.from_ids(bank.layout, [1, 2])}
+    drawn = []
+    for _ in range(6):
+        batch = _draw(bank, user, 3)
+        assert batch and len(set(batch)) == len(batch)
+        drawn.extend(batch)
+    # 一轮取完全部未做的单选题，且不出已做过或其他题型的题
+    assert sorted(drawn) == list(range(3, 21))
+    first_round = list(drawn)
+    first_seed = user['practice_cursors']['1']['seed']
+
+    # 游标走完：按当前未做的题重新建立（新的种子与排列）
+    second = _draw(bank, user, 18)
+    assert sorted(second) == list(range(3, 21)) and user['practice_cursors']['1']['seed'] != first_seed
+    assert second != first_round
+
+    # 之后在其他模式中做过的题被跳过；跨过重新打乱时同一批内也不重复
+    user['practice_cursors']['1']['pos'] = 0
+    user['answered_questions'].add(second[1])
+    user['answered_questions'].add(second[2])
+    batch = _draw(bank, user, 16)
+    assert batch[:1] == second[:1] and not {second[1], second[2]} & set(batch)
+    assert len(set(batch)) == len(batch) == 16
+    batch = _draw(bank, user, 10)
+    assert len(set(batch)) == len(batch) == 10
+
+    # 全部做完：不返回题目，游标不变
+    for qid in range(3, 21):
+        user['answered_questions'].add(qid)
+    cursor = dict(user['practice_cursors']['1'])
+    assert _draw(bank, user, 4) == [] and user['practice_cursors']['1'] == cursor
+    assert sorted(_draw(bank, user, 10, type_filter=3)) == list(range(21, 26))
+
+
+def test_unanswered_cursor_survives_restart(storage, login, restart_journal):
+    """游标推进随日志保存：重启后从原位置继续，不重复出题"""
+    client = storage('journal')
+    login(client)
+
+    def fetch():
+        response = client.post('/get_practice_batch', json={'mode': 'unanswered', 'type_filter': 1, 'count': 10})
+        return [q['id'] for q in response.get_json()['questions']]
+
+    drawn = fetch() + fetch()
+    restart_journal()
+    drawn += fetch() + fetch()
+    assert len(set(drawn)) == len(drawn) == 40
+    bank = app_module.load_question_bank()
+    assert all(bank.get(qid)['type'] == 1 for qid in drawn)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+题库索引（QuestionBank）的测试
+"""
+
+import json
+import os
+import pickle
+import random
+
+import pytest
+
+import app as app_module
+from question_bank import (CACHE_FORMAT, QuestionBank, QuestionLayout, QuestionSet, load_bank, load_cached_bank,
+                           source_stat)
+
+
+def make_question(qid, q_type=1, answer='A', content=None):
+    return {'id': qid, 'number': qid, 'type': q_type, 'content': content or f'题目{qid}',
+            'options': [{'tag': tag, 'content': tag, 'is_correct': tag in answer} for tag in 'ABCD'],
+            'correct_answer': answer, 'analysis': '', 'score': 1}
+
+
+def sample_bank():
+    return QuestionBank([
+        make_question(10, 1, 'B'),
+        make_question(11, 2, 'A,C'),
+        make_question(12, 3, '正确'),
+        make_question(13, 2, 'B,D'),
+    ], version='v1')
+
+
+def test_lookups_accept_string_and_int_ids():
+    bank = sample_bank()
+    assert bank.get('11') is bank.get(11) is bank.questions[1]
+    assert bank.get(' 13 ')['correct_answer'] == 'B,D'
+    assert bank.get(99) is None and 99 not in bank and '12' in bank
+    assert bank.ordinal('12') == 2 and bank.ordinal(99) is None
+    assert [q['id'] for q in bank.questions_of_type(2)] == [11, 13]
+    assert len(bank.questions_of_type(0)) == 4
+    assert bank.type_mask(2) == 0b1010 and bank.type_mask(0) == 0b1111
+    assert bank.answer_key(11) == frozenset({'A', 'C'})
+
+
+@pytest.mark.parametrize('answer, expected', [
+    (['C', 'A'], True),
+    (['A'], False),
+    ('A', False),
+    ([], False),
+    (None, False),
+    (3, False),
+    ({'A': True}, False),
+    ([['A', 'C']], False),
+])
+def test_grade_multiple_choice(answer, expected):
+    """多选题按选项集合比较；不是字母列表的答案判错而不是抛出异常"""
+    bank = sample_bank()
+    assert bank.grade(bank.get(11), answer)[1] is expected
+
+
+def test_grade_single_choice_and_copies():
+    bank = sample_bank()
+    assert bank.grade(bank.get(10), 'B') == ('B', True)
+    assert bank.grade(bank.get(10), 2) == (2, False)
+    assert bank.grade(bank.get(12), None) == (None, False)
+    # 考试记录中的题目副本按副本自身的答案评判
+    copy = dict(bank.get(11), correct_answer='B')
+    assert bank.grade(copy, ['B']) == (['B'], True)
+
+
+def test_submit_endpoints_reject_malformed_answers(storage, login):
+    """非法答案在接口中判错，不返回 500"""
+    client = storage('blob')
+    login(client)
+    bank = app_module.load_question_bank()
+    multi = bank.questions_of_type(2)[0]
+    for answer in (5, None, {'A': 1}, [['A']]):
+        response = client.post('/submit_answer', json={'question_id': multi['id'], 'answer': answer})
+        assert response.status_code == 200 and response.get_json()['is_correct'] is False
+    response = client.post('/submit_answers', json={'answers': [{'question_id': multi['id'], 'answer': 7}]})
+    assert response.status_code == 200 and response.get_json()['results'][0]['is_correct'] is False
+
+
+def _write_source(path, questions):
+    path.write_text(json.dumps({'questions': questions}, ensure_ascii=False), encoding='utf-8')
+
+
+def _read_cache(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def test_cache_is_validated_by_stat_then_sha256(tmp_path):
+    """mtime/大小一致时直接用缓存；只 touch 时按 sha256 复用；内容变化时从 JSON 重建"""
+    source, cache = tmp_path / 'questions.json', tmp_path / 'cache.pkl'
+    _write_source(source, [make_question(1), make_question(2)])
+    bank, origin = load_bank(str(source), str(cache))
+    assert origin == 'JSON' and len(bank) == 2
+    written = _read_cache(cache)
+    assert written['format'] == CACHE_FORMAT and written['source_sha256'] == bank.version
+    assert tuple(written['source_stat']) == source_stat(str(source))
+
+    assert load_bank(str(source), str(cache), current=bank) == (bank, 'current')
+    cached, origin = load_bank(str(source), str(cache))
+    assert origin == 'cache' and cached.version == bank.version and cached.get(2) == bank.get(2)
+
+    # 只改 mtime：内容哈希相同，沿用当前题库并更新记录的 stat
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert load_bank(str(source), str(cache), current=bank) == (bank, 'current')
+    assert bank.source_stat == source_stat(str(source))
+    reloaded, origin = load_bank(str(source), str(cache))
+    assert origin == 'cache' and tuple(_read_cache(cache)['source_stat']) == source_stat(str(source))
+
+    # 内容变化：从 JSON 重建，版本随之变化
+    _write_source(source, [make_question(1), make_question(2, answer='D'), make_question(3)])
+    rebuilt, origin = load_bank(str(source), str(cache), current=bank)
+    assert origin == 'JSON' and len(rebuilt) == 3 and rebuilt.version != bank.version
+    assert rebuilt.get(2)['correct_answer'] == 'D'
+    assert _read_cache(cache)['source_sha256'] == rebuilt.version
+
+
+def test_old_or_corrupt_cache_is_rebuilt(tmp_path):
+    source, cache = tmp_path / 'questions.json', tmp_path / 'cache.pkl'
+    _write_source(source, [make_question(1)])
+    # 旧格式缓存（无 format/sha256）：即使题目不同也不会被采用
+    with open(cache, 'wb') as f:
+        pickle.dump({'questions': [make_question(9)]}, f)
+    bank, origin = load_bank(str(source), str(cache))
+    assert origin == 'JSON' and [q['id'] for q in bank] == [1]
+    assert _read_cache(cache)['format'] == CACHE_FORMAT
+
+    cache.write_bytes(b'not a pickle')
+    assert load_bank(str(source), str(cache))[1] == 'JSON'
+    # 源文件不可用时的兜底直接使用缓存
+    assert [q['id'] for q in load_cached_bank(str(cache))] == [1]
+
+
+def test_reload_swaps_the_bank_when_the_source_changes(storage, tmp_path, monkeypatch):
+    """运行中修改题库文件：重新加载得到新版本，旧版本被存档"""
+    storage('blob')
+    source = tmp_path / 'questions.json'
+    _write_source(source, [make_question(1, answer='A'), make_question(2)])
+    monkeypatch.setattr(app_module, 'QUESTIONS_FILE', str(source))
+    monkeypatch.setattr(app_module, '_question_bank', None)
+    first = app_module.reload_question_bank()
+    assert app_module.reload_question_bank() is first
+
+    _write_source(source, [make_question(1, answer='B'), make_question(2)])
+    second = app_module.reload_question_bank()
+    assert second is not first and app_module.load_question_bank() is second
+    assert second.get(1)['correct_answer'] == 'B'
+    assert app_module.archived_question(first.version, 1, second)['correct_answer'] == 'A'
+
+
+def test_question_set_round_trip_with_extras():
+    """位图编码往返不变；布局外的ID保存在 extra 中"""
+    layout = QuestionLayout([10, 11, 12, 13, 'x-1'])
+    empty = QuestionSet(layout)
+    assert QuestionSet.decode(empty.encode(), layout) == set() and empty.encode() == f'{layout.layout_id}:'
+
+    question_set = QuestionSet.from_ids(layout, ['11', 13, 'x-1'])
+    encoded = question_set.encode()
+    assert isinstance(encoded, str) and encoded.startswith(layout.layout_id + ':')
+    assert QuestionSet.decode(encoded, layout) == {11, 13, 'x-1'}
+
+    question_set.add(99)
+    question_set.add('deleted')
+    encoded = question_set.encode()
+    assert encoded['extra'] == [99, 'deleted']
+    decoded = QuestionSet.decode(json.loads(json.dumps(encoded)), layout)
+    assert decoded == question_set and 99 in decoded and '99' in decoded and len(decoded) == 5
+    decoded.discard('99')
+    assert 99 not in decoded and decoded.encode()['extra'] == ['deleted']
+
+    # 旧版的ID列表格式
+    assert QuestionSet.decode([10, '12', 77], layout) == {10, 12, 77}
+    assert QuestionSet.decode(None, layout) == set()
+
+
+def test_question_set_rebases_old_layouts():
+    """旧布局下保存的位图按登记的布局映射到新布局；新布局中没有的题进入 extra"""
+    old = QuestionLayout([1, 2, 3, 4])
+    new = QuestionLayout([4, 2, 5])
+    encoded = QuestionSet.from_ids(old, [1, 2, 4]).encode()
+    with pytest.raises(ValueError):
+        QuestionSet.decode(encoded, new)
+    layouts = {old.layout_id: old}
+    decoded = QuestionSet.decode(encoded, new, layouts.get)
+    assert decoded.layout is new and decoded.bits == 0b011 and decoded.extras == {1}
+    assert decoded == {1, 2, 4}
+
+
+def test_question_set_operations_match_python_sets():
+    rng = random.Random(2)
+    layout = QuestionLayout(range(200))
+    for _ in range(50):
+        a = {rng.choice([rng.randrange(250), str(rng.randrange(250))]) for _ in range(40)}
+        b = {rng.randrange(250) for _ in range(40)}
+        plain_a = {int(x) for x in a}
+        set_a, set_b = QuestionSet.from_ids(layout, a), QuestionSet.from_ids(layout, b)
+        assert set(set_a) == plain_a and len(set_a) == len(plain_a)
+        assert set(set_a | set_b) == plain_a | b
+        assert set(set_a & set_b) == plain_a & b
+        assert set(set_a - set_b) == plain_a - b
+        assert set(set_a - b) == plain_a - b
+
+
+def test_user_sets_survive_a_bank_change(storage, login, tmp_path, monkeypatch):
+    """题库增删题后，用户已保存的位图按登记的旧布局解析"""
+    client = storage('blob')
+    source = tmp_path / 'questions.json'
+    _write_source(source, [make_question(qid) for qid in (1, 2, 3)])
+    monkeypatch.setattr(app_module, 'QUESTIONS_FILE', str(source))
+    monkeypatch.setattr(app_module, '_question_bank', None)
+    app_module.reload_question_bank()
+    user_id = login(client)
+    for qid in (1, 3):
+        client.post('/submit_answer', json={'question_id': qid, 'answer': 'B'})
+    client.post('/toggle_important', json={'question_id': 2})
+
+    _write_source(source, [make_question(qid) for qid in (3, 4, 2)])
+    app_module.reload_question_bank()
+    with open(app_module.USER_DATA_FILE, 'r', encoding='utf-8') as f:
+        saved = json.load(f)['users'][user_id]
+    user = app_module.normalize_user_data({'users': {user_id: saved}})['users'][user_id]
+    assert user['answered_questions'] == {1, 3} and user['wrong_questions'] == {1, 3}
+    assert user['important_questions'] == {2}
+    assert user['answered_questions'].extras == {1}
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+题库近似重复检测与版本对比的测试
+"""
+
+import itertools
+import random
+
+from question_dedup import (DEFAULT_THRESHOLD, bank_report, diff_banks, find_duplicates, jaccard, question_text,
+                            shingles, summarize)
+
+
+def _question(qid, content, options, answer='A', q_type=1):
+    return {'id': qid, 'number': qid, 'type': q_type, 'content': content,
+            'options': [{'tag': tag, 'content': text, 'is_correct': tag == answer}
+                        for tag, text in zip('ABCD', options)],
+            'correct_answer': answer, 'analysis': '', 'score': 1}
+
+
+OPTIONS = ['继续运行并记录日志', '立即停机检查', '通知调度员', '降低负荷运行']
+
+
+def test_question_text_ignores_whitespace_and_punctuation():
+    a = _question(1, '变压器 油温过高时，应当：', OPTIONS)
+    b = _question(1, '变压器油温过高时应当', OPTIONS)
+    assert question_text(a) == question_text(b)
+
+
+def test_diff_banks_classifies_changes():
+    """题干修改、答案修改、换ID、删除与新增分别归类"""
+    old = [
+        _question(1, '变压器油温过高时应当采取哪种处理措施', OPTIONS),
+        _question(2, '断路器拒动时值班人员首先应该做什么', OPTIONS),
+        _question(3, '电缆沟内发现积水时巡视人员应该如何处理', OPTIONS),
+        _question(4, '继电保护装置误动作后应当如何分析原因', OPTIONS),
+    ]
+    new = [
+        _question(1, '变压器油温异常升高时应当采取哪种处理措施', OPTIONS),
+        _question(2, '断路器拒动时值班人员首先应该做什么', OPTIONS, answer='B'),
+        _question(30, '电缆沟内发现积水时巡视人员应该如何处理', OPTIONS),
+        _question(5, '隔离开关可以用来拉合哪些电流回路', ['负荷电流', '空载母线', '短路电流', '故障电流']),
+    ]
+    report = diff_banks(old, new)
+    assert [item['old']['id'] for item in report['changed']] == [1]
+    assert report['changed'][0]['similarity'] < 1
+    assert report['answer_changed'] == [{'id': 2, 'old_answer': 'A', 'new_answer': 'B',
+                                         'old_type': 1, 'new_type': 1}]
+    assert [(item['old']['id'], item['new']['id'], item['similarity']) for item in report['replaced']] == [(3, 30, 1.0)]
+    assert [item['id'] for item in report['removed']] == [4]
+    assert [item['id'] for item in report['added']] == [5]
+    assert diff_banks(new, new) == {'changed': [], 'answer_changed': [], 'replaced': [], 'removed': [], 'added': []}
+
+
+def _brute_force_clusters(questions, threshold):
+    """两两比较的近似重复簇（题目ID集合）"""
+    sets = [shingles(question_text(q)) for q in questions]
+    parent = list(range(len(questions)))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for i, j in itertools.combinations(range(len(questions)), 2):
+        if jaccard(sets[i], sets[j]) >= threshold:
+            parent[find(j)] = find(i)
+    groups = {}
+    for i, question in enumerate(questions):
+        groups.setdefault(find(i), set()).add(question['id'])
+    return {frozenset(group) for group in groups.values() if len(group) > 1}
+
+
+def test_find_duplicates_matches_brute_force():
+    """LSH 只是缩小候选范围：结果与两两比较相同"""
+    rng = random.Random(7)
+    chars = '数据安全银行支付风险管理系统客户信息技术服务平台交易监测模型业务流程合规审计网络'
+    questions = []
+    for base in range(40):
+        text = ''.join(rng.choice(chars) for _ in range(50))
+        questions.append(_question(len(questions) + 1, text, OPTIONS))
+        # 部分题目带一两处改字的变体
+        for _ in range(base % 3):
+            variant = list(text)
+            for pos in rng.sample(range(len(variant)), rng.randint(1, 2)):
+                variant[pos] = rng.choice(chars)
+            questions.append(_question(len(questions) + 1, ''.join(variant), OPTIONS))
+    clusters = find_duplicates(questions)
+    expected = _brute_force_clusters(questions, DEFAULT_THRESHOLD)
+    assert len(expected) >= 20
+    assert {frozenset(q['id'] for q in cluster['questions']) for cluster in clusters} == expected
+    assert all(cluster['min_similarity'] >= DEFAULT_THRESHOLD for cluster in clusters)
+    sizes = [len(cluster['questions']) for cluster in clusters]
+    assert sizes == sorted(sizes, reverse=True)
+
+
+def test_bank_report_summary():
+    old = [_question(1, '变压器油温过高时应当采取哪种处理措施', OPTIONS),
+           _question(2, '变压器油温过高时应当采取哪种处理措施', OPTIONS)]
+    new = old[:1] + [_question(3, '隔离开关可以用来拉合哪些电流回路', OPTIONS)]
+    report = bank_report(old)
+    assert report['question_count'] == 2 and 'diff' not in report
+    assert [[q['id'] for q in cluster['questions']] for cluster in report['duplicates']] == [[1, 2]]
+    assert summarize(report) == '2 questions, 1 near-duplicate clusters'
+    report = bank_report(new, previous=old)
+    assert summarize(report) == ('2 questions, 0 near-duplicate clusters, 0 changed, 0 answer_changed, '
+                                 '0 replaced, 1 removed, 1 added')
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+全站题目难度统计的测试：进程池重建与当前进程计数一致，增量计数与由历史重建一致
+"""
+
+import random
+
+import app as app_module
+import question_difficulty
+from question_difficulty import DifficultyStats, exam_outcomes, rebuild, user_history
+
+
+def _counts(stats):
+    return stats.snapshot()[1]['counts']
+
+
+def _random_histories(users, rng):
+    histories = []
+    for _ in range(users):
+        answered = rng.sample(range(1, 200), 30)
+        wrong = {qid: rng.randint(1, 3) for qid in rng.sample(answered, 8)}
+        exams = [{'status': 'completed',
+                  'answers': {str(qid): 'A' for qid in rng.sample(range(1, 200), 10)},
+                  'wrong_answers': []} for _ in range(rng.randint(0, 2))]
+        for record in exams:
+            record['wrong_answers'] = [{'question_id': int(qid)} for qid in list(record['answers'])[:3]]
+        histories.append(user_history(answered, wrong, exams))
+    return histories
+
+
+def test_exam_outcomes_and_lower_bound_counts():
+    record = {'status': 'completed', 'answers': {'1': 'A', '2': 'B', '3': '', '4': []},
+              'wrong_answers': [{'question_id': 2}, {'question_id': 3}]}
+    assert exam_outcomes(record) == [('1', True), ('2', False)]
+    assert exam_outcomes(dict(record, status='ongoing')) == []
+    history = user_history([1, 2, 5, 6], {2: 3, 6: 1}, [record])
+    # 题 2：考试做错 1 次 + 练习做错 2 次；题 5：做过且从未做错，按答对 1 次
+    assert question_difficulty._count_histories([history]) == {
+        '1': [1, 1], '2': [3, 0], '5': [1, 1], '6': [1, 0]
+    }
+
+
+def test_pool_rebuild_matches_in_process(capsys):
+    histories = _random_histories(60, random.Random(9))
+    expected = _counts(rebuild(histories, workers=1))
+    assert len(expected) > 150
+    assert _counts(rebuild(histories, workers=2, chunk_size=7)) == expected
+    # 子进程确实计数了，而不是退化为当前进程
+    assert 'Process pool unavailable' not in capsys.readouterr().out
+    assert _counts(rebuild(iter(histories), workers=2, chunk_size=1000)) == expected
+    assert _counts(rebuild([], workers=2)) == {}
+
+
+def test_live_counts_match_rebuild(storage, login, monkeypatch):
+    """练习与考试的增量计数，与由全部用户历史重建的结果相同"""
+    storage('blob')
+    monkeypatch.setattr(app_module, '_question_difficulty', DifficultyStats())
+    bank = app_module.load_question_bank()
+    rng = random.Random(5)
+    for name in ('alice', 'bob'):
+        client = app_module.app.test_client()
+        login(client, name)
+        exam = client.post('/start_exam', json={}).get_json()
+        in_exam = {q['id'] for q in exam['questions']}
+        # 练习中每道题只作答一次（练习的答对次数按下限还原），且不与试卷重复
+        practice = rng.sample([q for q in bank.questions if q['id'] not in in_exam], 40)
+        client.post('/submit_answers', json={'answers': [
+            {'question_id': q['id'], 'answer': q['correct_answer'].split(',') if q['type'] == 2 else q['correct_answer']}
+            if rng.random() < 0.5 else {'question_id': q['id'], 'answer': 'Z'}
+            for q in practice
+        ]})
+        answers = {}
+        for question in exam['questions'][::3]:
+            answers[str(question['id'])] = question['correct_answer'] if rng.random() < 0.5 else 'Z'
+        client.post('/submit_exam', json={'exam_id': exam['exam_id'], 'answers': answers})
+
+    live = _counts(app_module.get_question_difficulty())
+    assert sum(attempts for attempts, _ in live.values()) == 2 * 40 + 2 * 50
+    monkeypatch.setattr(app_module, 'DIFFICULTY_REBUILD_WORKERS', 2)
+    assert _counts(app_module.rebuild_question_difficulty(swap=False)) == live
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+题库全文检索的测试：BM25 排序与逐题计算的结果一致，按编号或ID精确命中
+"""
+
+import math
+from collections import Counter
+
+import numpy as np
+
+import app as app_module
+import question_search
+from question_bank import QuestionBank
+from question_search import SearchIndex, tokenize
+
+TEXTS = [
+    ('数字化转型的核心是数据驱动', '数据治理是基础'),
+    ('银行数据中台建设', '数据中台统一管理数据资产，数据质量是关键'),
+    ('区块链在跨境支付中的应用', ''),
+    ('云计算的服务模式包括 IaaS、PaaS 和 SaaS', 'SaaS 为软件即服务'),
+    ('人工智能在风控中的应用', '机器学习模型识别欺诈交易'),
+    ('开放银行通过 API 共享数据', '需要保护客户数据隐私'),
+    ('分布式数据库的数据一致性', ''),
+    ('移动支付的安全措施', '多因素认证'),
+]
+
+
+def _bank():
+    questions = []
+    for qid, (content, analysis) in enumerate(TEXTS, 1):
+        questions.append({'id': qid, 'number': f'FD-{qid:03d}', 'type': 1 + qid % 3, 'content': content,
+                          'options': [{'tag': 'A', 'content': '正确'}, {'tag': 'B', 'content': '错误'}],
+                          'correct_answer': 'A', 'analysis': analysis, 'score': 1})
+    return QuestionBank(questions, version='v1')
+
+
+def _reference_scores(bank, query):
+    """逐题计算 BM25（只对命中足够查询词的题）"""
+    docs = [Counter(tokenize(question_search.question_text(q))) for q in bank.questions]
+    lengths = [sum(doc.values()) for doc in docs]
+    avgdl = sum(lengths) / len(docs)
+    terms = list(dict.fromkeys(tokenize(query.lower(), unigrams=False)))
+    scores = {}
+    for ordinal, doc in enumerate(docs):
+        present = [term for term in terms if doc[term]]
+        if not terms or len(present) < math.ceil(len(terms) * question_search.MIN_MATCH_RATIO):
+            continue
+        score = 0.0
+        for term in present:
+            df = sum(1 for other in docs if other[term])
+            idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            tf = doc[term]
+            score += idf * tf * (question_search.K1 + 1) / (
+                tf + question_search.K1 * (1 - question_search.B + question_search.B * lengths[ordinal] / avgdl))
+        scores[ordinal] = score
+    return scores
+
+
+def test_tokenize():
+    assert tokenize('数据中台') == ['数', '据', '中', '台', '数据', '据中', '中台']
+    assert tokenize('数据中台', unigrams=False) == ['数据', '据中', '中台']
+    assert tokenize('API 与 SaaS2.0') == ['api', '与', 'saas2', '0']
+    assert tokenize('') == [] and tokenize(None) == []
+
+
+def test_ranking_matches_reference_bm25():
+    bank = _bank()
+    index = SearchIndex(bank)
+    for query in ('数据', '数据中台', '支付', '银行数据', 'saas', '数据一致性', '风控模型', '不存在的词语'):
+        expected = _reference_scores(bank, query)
+        ordinals = index.search(query).tolist()
+        assert sorted(ordinals) == sorted(expected), query
+        scores = [expected[ordinal] for ordinal in ordinals]
+        assert all(a >= b - 1e-5 for a, b in zip(scores, scores[1:])), query
+    # 词频更高的题排在前面
+    assert index.search('数据中台').tolist()[0] == 1
+    # 个别错字：命中 3/4 以上的查询词仍算命中
+    assert 1 in index.search('数据中台建没').tolist()
+
+
+def test_exact_number_and_id_hits_come_first():
+    bank = _bank()
+    index = SearchIndex(bank)
+    assert index.search('FD-003').tolist() == [2]
+    assert index.search('fd-003').tolist() == [2]
+    assert index.search('7').tolist() == [6]
+    # 精确命中排在全文命中之前
+    assert index.search('2')[0] == 1
+    mask = np.ones(len(bank.questions), dtype=bool)
+    mask[2] = False
+    assert index.search('FD-003', mask).tolist() == []
+    assert index.search('   ').tolist() == []
+
+
+def test_search_endpoint(storage, login):
+    client = storage('blob')
+    login(client)
+    bank = app_module.load_question_bank()
+    question = bank.questions_of_type(2)[3]
+
+    def search(**params):
+        return client.post('/search_questions', json=params).get_json()
+
+    assert search(q='  ') == {'error': '请输入搜索内容'}
+    result = search(q=str(question['number']))
+    assert result['results'][0]['id'] == question['id']
+    assert question['id'] not in [row['id'] for row in search(q=str(question['number']), type_filter='1')['results']]
+
+    term = question['content'][:6]
+    result = search(q=term, page_size=5)
+    ordinals = question_search.search_index(bank).search(term)
+    assert result['pagination']['total_count'] == ordinals.size > 0
+    assert [row['id'] for row in result['results']] == [bank.questions[o]['id'] for o in ordinals[:5]]
+    assert all('snippet' in row for row in result['results'])
+    assert search(q=term, page='abc')['pagination']['current_page'] == 1
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+题库列表列式查询的测试：随机数据下与原逐题循环的输出逐项一致
+"""
+
+import datetime
+import random
+import types
+
+import pytest
+
+import question_table
+from question_bank import QuestionBank
+
+FROZEN_NOW = datetime.datetime(2024, 5, 1, 12, 30, 15)
+
+
+class FrozenDatetime(datetime.datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls.fromtimestamp(FROZEN_NOW.timestamp(), tz)
+
+
+def baseline_pages(questions, stats, type_filter, status_filter, sort_by, pages, page_size):
+    """原 /get_question_bank 的逐题实现（筛选、排序、分页部分）"""
+    answered_questions = stats['answered_questions']
+    wrong_questions = stats['wrong_questions']
+    important_set = stats['important_questions']
+    wrong_count_map = stats['wrong_count_map']
+    wrong_times = stats['wrong_times']
+
+    questions_by_type = {1: [], 2: [], 3: []}
+    for question in questions:
+        questions_by_type[question['type']].append(question)
+
+    processed_questions = []
+    for q_type, type_questions in questions_by_type.items():
+        for question in type_questions:
+            question_id = question['id']
+            is_answered = question_id in answered_questions
+            is_wrong = question_id in wrong_questions
+            wrong_count_num = wrong_count_map.get(question_id, 0)
+            last_answered_time = None
+            if is_answered:
+                if question_id in wrong_times:
+                    last_answered_time = wrong_times[question_id]
+                else:
+                    last_answered_time = FrozenDatetime.now().isoformat()
+            if last_answered_time:
+                try:
+                    dt = datetime.datetime.fromisoformat(last_answered_time.replace('Z', '+00:00'))
+                    last_answered_time = dt.strftime('%Y-%m-%d %H:%M')
+                except Exception:
+                    last_answered_time = last_answered_time[:16]
+            processed_question = {
+                'id': question['id'],
+                'number': question.get('number'),
+                'type': question['type'],
+                'is_answered': is_answered,
+                'is_wrong': is_wrong,
+                'wrong_count': wrong_count_num,
+                'last_answered_time': last_answered_time,
+                'is_important': question_id in important_set
+            }
+            include_question = True
+            if type_filter != 'all' and str(q_type) != type_filter:
+                include_question = False
+            if status_filter == 'unanswered' and is_answered:
+                include_question = False
+            elif status_filter == 'correct' and (not is_answered or is_wrong):
+                include_question = False
+            elif status_filter == 'wrong' and not is_wrong:
+                include_question = False
+            elif status_filter == 'frequent_wrong' and (not is_wrong or wrong_count_num < 3):
+                include_question = False
+            elif status_filter == 'important' and (question_id not in important_set):
+                include_question = False
+            if include_question:
+                processed_questions.append(processed_question)
+
+    by_type = {1: [], 2: [], 3: []}
+    for q in processed_questions:
+        by_type[q['type']].append(q)
+    for lst in by_type.values():
+        if sort_by == 'id':
+            lst.sort(key=lambda x: x['id'])
+        elif sort_by == 'wrong_count':
+            lst.sort(key=lambda x: x['wrong_count'], reverse=True)
+        elif sort_by == 'last_answered':
+            lst.sort(key=lambda x: (x['last_answered_time'] is None, x['last_answered_time']), reverse=True)
+
+    result = {}
+    for q_type, page_num in pages.items():
+        lst = by_type[q_type]
+        total = len(lst)
+        start = (page_num - 1) * page_size
+        end = start + page_size
+        result[q_type] = (lst[start:end], {
+            'total_count': total,
+            'current_page': page_num,
+            'total_pages': (total + page_size - 1) // page_size,
+            'has_next': end < total,
+            'has_prev': page_num > 1
+        })
+    return result
+
+
+def random_case(rng):
+    ids = rng.sample(range(1, 5000), rng.randint(1, 300))
+    questions = [{'id': qid, 'number': rng.choice([qid, None]), 'type': rng.choice((1, 1, 2, 3)),
+                  'content': '', 'options': [], 'correct_answer': 'A', 'analysis': '', 'score': 1}
+                 for qid in ids]
+    bank = QuestionBank(questions, version='v')
+    answered = {qid for qid in ids if rng.random() < 0.6}
+    wrong = {qid for qid in answered if rng.random() < 0.4}
+    # 少量已删除题目的ID也会出现在用户数据中
+    answered |= {9001, 9002}
+    wrong.add(9001)
+    minutes = [FROZEN_NOW - datetime.timedelta(minutes=rng.randint(0, 200)) for _ in range(20)]
+    wrong_times = {}
+    for qid in wrong:
+        moment = rng.choice(minutes) + datetime.timedelta(seconds=rng.randint(0, 59))
+        wrong_times[qid] = rng.choice([moment.isoformat(), moment.isoformat() + 'Z', moment.strftime('%Y-%m-%dT%H:%M')])
+    stats = {
+        'answered_questions': bank.new_set(answered),
+        'wrong_questions': bank.new_set(wrong),
+        'important_questions': bank.new_set(qid for qid in ids if rng.random() < 0.2),
+        'wrong_count_map': {qid: rng.randint(1, 5) for qid in wrong},
+        'wrong_times': wrong_times
+    }
+    return bank, stats
+
+
+@pytest.mark.parametrize('seed', range(40))
+def test_query_pages_matches_baseline_loop(seed, monkeypatch):
+    monkeypatch.setattr(question_table, 'datetime', types.SimpleNamespace(datetime=FrozenDatetime))
+    rng = random.Random(seed)
+    bank, stats = random_case(rng)
+    for _ in range(10):
+        type_filter = rng.choice(['all', '1', '2', '3'])
+        status_filter = rng.choice(['all', 'unanswered', 'correct', 'wrong', 'frequent_wrong', 'important'])
+        sort_by = rng.choice(['id', 'wrong_count', 'last_answered'])
+        page_size = rng.randint(1, 120)
+        pages = {q_type: rng.randint(1, 4) for q_type in (1, 2, 3)}
+
+        mask = question_table.status_mask(question_table.user_columns(bank, stats), status_filter)
+        if type_filter != 'all':
+            mask &= question_table.bank_columns(bank).types == int(type_filter)
+        actual = question_table.query_pages(bank, stats, mask, sort_by, pages, page_size)
+        expected = baseline_pages(bank.questions, stats, type_filter, status_filter, sort_by, pages, page_size)
+        assert actual == expected, (type_filter, status_filter, sort_by, page_size, pages)
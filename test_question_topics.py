@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+题目主题的测试：离线聚类、主题索引（ID -> 序号位图）与练习、题库中的主题筛选
+"""
+
+import json
+import random
+
+import pytest
+
+import app as app_module
+from question_bank import QuestionBank
+from question_topics import TopicIndex, build_topics
+
+THEMES = {
+    'cluster': ['聚类', '样本', '距离', '簇中心', '相似度'],
+    'gan': ['生成器', '判别器', '对抗', '生成网络', '图像'],
+    'pay': ['支付', '清算', '结算', '跨境', '汇款'],
+}
+
+
+def _question(qid, content, q_type=1):
+    return {'id': qid, 'number': qid, 'type': q_type, 'content': content,
+            'options': [{'tag': 'A', 'content': '是'}, {'tag': 'B', 'content': '否'}],
+            'correct_answer': 'A', 'analysis': '', 'score': 1}
+
+
+def _themed_questions(per_theme=12):
+    rng = random.Random(3)
+    questions, members = [], {}
+    for theme, words in THEMES.items():
+        for _ in range(per_theme):
+            qid = len(questions) + 1
+            text = '关于' + '和'.join(rng.sample(words, 3)) + '的说法'
+            questions.append(_question(qid, text, 1 + qid % 3))
+            members.setdefault(theme, set()).add(qid)
+    return questions, members
+
+
+def test_build_topics_recovers_themes():
+    questions, members = _themed_questions()
+    topics = build_topics(questions, k=3, seed=0)
+    assert {frozenset(topic['ids']) for topic in topics} == {frozenset(ids) for ids in members.values()}
+    assert [topic['id'] for topic in topics] == ['t01', 't02', 't03']
+    for topic in topics:
+        theme = next(name for name, ids in members.items() if ids == set(topic['ids']))
+        assert any(word in topic['label'] for word in THEMES[theme])
+    # 相同题库与种子结果相同
+    assert build_topics(questions, k=3, seed=0) == topics
+    assert build_topics([], k=3) == []
+
+
+def test_topic_index_ignores_missing_questions():
+    bank = QuestionBank([_question(qid, f'题目{qid}') for qid in range(1, 6)], version='v1')
+    index = TopicIndex(bank, {'bank_version': 'v0', 'topics': [
+        {'id': 't01', 'label': '甲', 'ids': [1, 3, 99]},
+        {'id': 't02', 'ids': ['5']},
+    ]})
+    assert index.topics == [{'id': 't01', 'label': '甲', 'count': 2}, {'id': 't02', 'label': 't02', 'count': 1}]
+    assert index.mask('t01') == 0b101 and index.mask('t02') == 0b10000 and index.mask('t09') is None
+
+
+def test_topic_members_either_direction():
+    """遍历主题或用户题目中较小的一方，结果相同"""
+    bank = QuestionBank([_question(qid, f'题目{qid}') for qid in range(1, 41)], version='v1')
+    bits = bank.new_set(range(1, 41, 3)).bits
+    small = {2, 4, 7, 99}
+    large = set(range(1, 41)) | {99}
+    assert sorted(app_module._topic_members(bank, bits, small)) == [4, 7]
+    assert sorted(app_module._topic_members(bank, bits, large)) == list(range(1, 41, 3))
+    assert sorted(app_module._topic_members(bank, bits, {str(k) for k in small}, str)) == ['4', '7']
+
+
+@pytest.fixture
+def topic_client(storage, login, tmp_path, monkeypatch):
+    """主题 t01：每种题型各取若干道题"""
+    client = storage('blob')
+    login(client)
+    bank = app_module.load_question_bank()
+    members = [q['id'] for t in (1, 2, 3) for q in bank.questions_of_type(t)[5:25:4]]
+    path = tmp_path / 'question_topics.json'
+    path.write_text(json.dumps({'bank_version': bank.version, 'topics': [
+        {'id': 't01', 'label': '测试主题', 'ids': members},
+        {'id': 't02', 'label': '空主题', 'ids': []},
+    ]}, ensure_ascii=False), encoding='utf-8')
+    monkeypatch.setattr(app_module, 'QUESTION_TOPICS_FILE', str(path))
+    return client, set(members)
+
+
+def test_practice_and_bank_filter_by_topic(topic_client):
+    client, members = topic_client
+    assert client.get('/get_topics').get_json()['topics'][0] == {'id': 't01', 'label': '测试主题', 'count': 15}
+
+    for _ in range(10):
+        question = client.post('/get_random_question', json={'mode': 'all', 'topic': 't01'}).get_json()
+        assert question['id'] in members
+    question = client.post('/get_random_question', json={'mode': 'all', 'topic': 't01', 'type_filter': 2}).get_json()
+    assert question['id'] in members and question['type'] == 2
+    assert client.post('/get_random_question', json={'topic': 't99'}).get_json() == {'error': '主题不存在，请刷新页面后重试'}
+    assert 'error' in client.post('/get_random_question', json={'topic': 't02'}).get_json()
+
+    served = []
+    for _ in range(2):
+        batch = client.post('/get_practice_batch', json={'mode': 'unanswered', 'topic': 't01', 'count': 5}).get_json()
+        served += [q['id'] for q in batch['questions']]
+    assert set(served) <= members and len(set(served)) == 10
+
+    # 错题与复习模式只出主题内的题
+    bank = app_module.load_question_bank()
+    outside = [q['id'] for q in bank.questions_of_type(1)[:5] if q['id'] not in members]
+    wrong = outside + sorted(members)[:3]
+    client.post('/submit_answers', json={'answers': [{'question_id': qid, 'answer': 'Z'} for qid in wrong]})
+    drawn = client.post('/get_practice_batch', json={'mode': 'wrong', 'topic': 't01', 'count': 10}).get_json()['questions']
+    assert {q['id'] for q in drawn} == set(sorted(members)[:3])
+    review = client.post('/get_practice_batch', json={'mode': 'review', 'topic': 't01'}).get_json()
+    assert '下一道题将于' in review['error']
+
+    result = client.post('/get_question_bank', json={'topic': 't01'}).get_json()
+    listed = [row['id'] for key in ('single_choice', 'multi_choice', 'true_false') for row in result[key]]
+    assert set(listed) == members
+    assert result['single_pagination']['total_count'] == 5
+    result = client.post('/get_question_bank', json={'topic': 't01', 'status_filter': 'wrong'}).get_json()
+    assert {row['id'] for key in ('single_choice', 'multi_choice', 'true_false') for row in result[key]} == set(sorted(members)[:3])
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+复习调度（SM-2）的测试：只保存卡片，堆在内存中由卡片重建
+"""
+
+import json
+
+import app as app_module
+import review_schedule
+from review_schedule import DAY_SECONDS, due_among, due_questions, load_state, new_state, record_review
+
+NOW = 1_700_000_000
+
+
+def test_intervals_follow_sm2():
+    """连续答对的间隔为 1、6、6×难度系数天，答错回到 1 天"""
+    state = new_state()
+    intervals = [record_review(state, 1, 1, True, NOW)[1] for _ in range(3)]
+    assert intervals == [1, 6, round(6 * state['cards']['1'][2])]
+    card = record_review(state, 1, 1, False, NOW)
+    assert card[1] == 1 and card[3] == 0 and card[0] == NOW + DAY_SECONDS
+
+
+def test_due_questions_in_due_order():
+    """按到期时间先后取题，重新调度后旧条目不再出现；只查看不改变堆"""
+    state = new_state()
+    record_review(state, 1, 1, False, NOW)
+    record_review(state, 2, 3, False, NOW - 3600)
+    record_review(state, 3, 1, True, NOW)
+    record_review(state, 3, 1, True, NOW)  # 间隔 6 天
+    later = NOW + 2 * DAY_SECONDS
+    assert due_questions(state, later, count=5) == (['2', '1'], NOW + 6 * DAY_SECONDS)
+    assert due_questions(state, later, question_type=3, count=5) == (['2'], None)
+    heaps = {q_type: sorted(heap) for q_type, heap in state.heaps.items()}
+    assert due_questions(state, later, count=1) == (['2'], None)
+    assert {q_type: sorted(heap) for q_type, heap in state.heaps.items()} == heaps
+    assert due_questions(state, NOW, count=5) == ([], NOW + DAY_SECONDS - 3600)
+
+
+def test_accept_skips_removed_questions():
+    """被 accept 拒绝的卡片（如题库中已删除的题）跳过，不挡住后面到期的题"""
+    state = new_state()
+    record_review(state, 999, 1, False, NOW - 7200)
+    record_review(state, 1, 1, False, NOW)
+    later = NOW + 2 * DAY_SECONDS
+    assert due_questions(state, later, count=5, accept=lambda key: key != '999') == (['1'], None)
+    record_review(state, 999, 1, True, NOW + 30 * DAY_SECONDS)
+    # 被拒绝的题即使最早到期也不作为下一次到期时间
+    assert due_questions(state, NOW, count=5, accept=lambda key: key != '999') == ([], NOW + DAY_SECONDS)
+
+
+def test_due_among_only_looks_at_given_keys():
+    state = new_state()
+    for qid in range(1, 6):
+        record_review(state, qid, 1, False, NOW + qid)
+    later = NOW + 2 * DAY_SECONDS
+    assert due_among(state, ['4', '2', 'missing'], later, count=5) == (['2', '4'], None)
+    assert due_among(state, ['4', '2'], later, count=1) == (['2'], None)
+    assert due_among(state, ['3', '5'], NOW, count=5) == ([], NOW + 3 + DAY_SECONDS)
+
+
+def test_heap_stays_bounded():
+    """反复重新调度同一批题，堆的大小保持在卡片数的常数倍以内"""
+    state = new_state()
+    for step in range(500):
+        record_review(state, step % 10, 1, step % 3 == 0, NOW + step)
+    assert len(state['cards']) == 10
+    assert len(state.heaps['1']) <= 2 * 10 + 16
+    review_schedule._rebuild(state)
+    assert len(state.heaps['1']) == 10
+
+
+def test_only_cards_are_serialized():
+    """保存的大小与卡片数成正比，与重新调度的次数（堆中延迟删除的条目）无关"""
+    for cards in (50, 500):
+        for reviews in (1, 40):
+            state = new_state()
+            for step in range(cards * reviews):
+                record_review(state, step % cards, 1 + step % 3, step % 4 != 0, NOW + step)
+            saved = json.dumps(state)
+            assert set(json.loads(saved)) == {'cards'} and len(json.loads(saved)['cards']) == cards
+            assert 25 * cards < len(saved) < 60 * cards
+            if reviews > 1:
+                assert sum(len(heap) for heap in state.heaps.values()) > 2 * cards
+
+
+def test_loaded_state_rebuilds_heaps_from_cards():
+    state = new_state()
+    types = {'99': 1}
+    for qid in range(1, 30):
+        types[str(qid)] = 1 + qid % 3
+        for step in range(qid % 4 + 1):
+            record_review(state, qid, types[str(qid)], (qid + step) % 3 != 0, NOW + qid * 600 + step)
+    # 旧版本保存的数据带 heaps：丢弃后由卡片重建
+    saved = json.loads(json.dumps(dict(state, heaps={'1': [[0, '1']]})))
+    loaded = load_state(saved)
+    assert set(json.loads(json.dumps(loaded))) == {'cards'} and loaded.heaps is None
+    assert load_state(loaded) is loaded and load_state(None) == {'cards': {}}
+
+    # 加载后、首次取题前的作答只更新卡片，重建的堆包含它
+    record_review(state, 99, 1, False, NOW)
+    record_review(loaded, 99, 1, False, NOW)
+    assert loaded.heaps is None
+    later = NOW + 3 * DAY_SECONDS
+    for q_type in (0, 1, 2, 3):
+        expected = due_questions(state, later, q_type, count=50)
+        assert expected[0] and due_questions(loaded, later, q_type, count=50, type_of=types.get) == expected
+    record_review(loaded, 5, 3, True, later)
+    assert '5' not in due_questions(loaded, later, 0, count=50)[0]
+
+    # 题库中已没有的题（type_of 返回 None）不入堆
+    full = due_questions(load_state(saved), later, 0, count=50, type_of=types.get)[0]
+    pruned = due_questions(load_state(saved), later, 0, count=50, type_of=lambda key: None if key == '2' else types[key])[0]
+    assert '2' in full and pruned == [key for key in full if key != '2']
+
+
+def test_review_mode_after_restart(storage, login, restart_journal):
+    """重启后从卡片重建堆：复习模式照常给出下一道题的到期时间"""
+    client = storage('journal')
+    user_id = login(client)
+    bank = app_module.load_question_bank()
+    question = bank.questions_of_type(3)[0]
+    client.post('/submit_answers', json={'answers': [{'question_id': question['id'], 'answer': 'Z'}]})
+    app_module.compact_journal()
+    with open(app_module.JOURNAL_SNAPSHOT_FILE, 'r', encoding='utf-8') as f:
+        review = json.load(f)['users'][user_id]['review']
+    assert set(review) == {'cards'} and list(review['cards']) == [str(question['id'])]
+
+    restart_journal()
+    for type_filter, message in ((3, '下一道题将于'), (1, '暂无复习题')):
+        response = client.post('/get_practice_batch', json={'mode': 'review', 'type_filter': type_filter}).get_json()
+        assert message in response['error']
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+按用户存储（per_user 模式）的测试：分区摘要与一次性迁移
+"""
+
+import json
+
+import app as app_module
+
+
+def _row_data(user_id, username):
+    data = {key: {} for key in app_module.USER_ROW_SECTIONS.values()}
+    data['users'][user_id] = {'username': username}
+    return data
+
+
+def test_row_digests_recorded_only_after_successful_writes(storage, monkeypatch, tmp_path):
+    """数据库或文件写入失败时不记录摘要，下次保存会重新写入相同的内容"""
+    storage('per_user')
+    data = _row_data('u1', 'alice')
+    key = ('u1', 'progress')
+    db_writes = []
+    monkeypatch.setattr(app_module, 'db_available', lambda: True)
+
+    monkeypatch.setattr(app_module, 'db_save_user_rows', lambda uid, payloads: db_writes.append(payloads) and False)
+    app_module._save_user_rows(data, ['u1'])
+    assert key not in app_module._user_row_digests
+
+    # 分区目录的父路径是普通文件：写文件失败
+    blocker = tmp_path / 'blocker'
+    blocker.write_text('')
+    rows_dir = app_module.USER_ROWS_DIR
+    monkeypatch.setattr(app_module, 'USER_ROWS_DIR', str(blocker / 'users'))
+    monkeypatch.setattr(app_module, 'db_save_user_rows', lambda uid, payloads: db_writes.append(payloads) or True)
+    app_module._save_user_rows(data, ['u1'])
+    assert key not in app_module._user_row_digests
+
+    monkeypatch.setattr(app_module, 'USER_ROWS_DIR', rows_dir)
+    app_module._save_user_rows(data, ['u1'])
+    assert key in app_module._user_row_digests
+    with open(app_module._user_row_file('u1'), 'r', encoding='utf-8') as f:
+        assert json.load(f)['progress'] == {'username': 'alice'}
+    assert len(db_writes) == 3
+
+    # 内容未变化：跳过
+    app_module._save_user_rows(data, ['u1'])
+    assert len(db_writes) == 3
+    data['users']['u1']['username'] = 'alice2'
+    app_module._save_user_rows(data, ['u1'])
+    assert len(db_writes) == 4 and list(db_writes[-1]) == ['progress']
+
+
+def test_migration_from_blob_keeps_every_user(storage, login, user_snapshot, monkeypatch):
+    """整体存储迁移到按用户存储后，每个用户的数据不变；迁移只做一次"""
+    client = storage('blob')
+    questions = app_module.load_question_bank().questions
+    user_ids = []
+    for username in ('alice', 'bobby'):
+        user_ids.append(login(client, username))
+        client.post('/submit_answer', json={'question_id': questions[len(user_ids)]['id'], 'answer': 'Z'})
+    blob = app_module.load_user_data()
+    expected = {uid: user_snapshot(blob, uid) for uid in user_ids}
+
+    monkeypatch.setattr(app_module, 'USER_STORAGE_MODE', 'per_user')
+    assert app_module.migrate_user_data_to_rows() == 2
+    assert app_module.migrate_user_data_to_rows() == 0
+    for uid in user_ids:
+        assert user_snapshot(app_module.load_user_data(uid), uid) == expected[uid]
+    assert {uid: user_snapshot(app_module.load_user_data(), uid) for uid in user_ids} == expected
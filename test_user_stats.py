@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+增量维护的用户统计的测试：与由错题记录、考试记录整体重算的结果一致
+"""
+
+import copy
+import random
+
+import pytest
+
+import app as app_module
+
+
+def _recomputed(user_id):
+    """在数据副本上从头重建聚合统计"""
+    data = copy.deepcopy(app_module.load_user_data(user_id))
+    app_module._rebuild_user_aggregates(data, user_id)
+    return data['users'][user_id]
+
+
+def _comparable(user):
+    aggregates = user['aggregates']
+    # 重建时最后做错时间来自错题记录（精确到秒）
+    return (dict(user['wrong_count']), aggregates['wrong_total'], aggregates['score_sum'],
+            {qid: timestamp[:19] for qid, timestamp in aggregates['wrong_last'].items()})
+
+
+@pytest.mark.parametrize('mode', ['blob', 'journal'])
+def test_incremental_stats_match_full_recompute(storage, login, mode):
+    client = storage(mode)
+    user_id = login(client)
+    bank = app_module.load_question_bank()
+    rng = random.Random(4)
+    pool = rng.sample(bank.questions, 30)
+    for _ in range(80):
+        question = rng.choice(pool)
+        answer = question['correct_answer'] if rng.random() < 0.5 else 'Z'
+        if rng.random() < 0.5:
+            client.post('/submit_answer', json={'question_id': question['id'], 'answer': answer})
+        else:
+            client.post('/submit_answers', json={'answers': [{'question_id': question['id'], 'answer': answer}]})
+
+    exam = client.post('/start_exam', json={}).get_json()
+    answers = {str(q['id']): rng.choice(['A', 'B']) for q in exam['questions'][:20]}
+    result = client.post('/submit_exam', json={'exam_id': exam['exam_id'], 'answers': answers}).get_json()
+
+    user = app_module.load_user_data(user_id)['users'][user_id]
+    assert _comparable(user) == _comparable(_recomputed(user_id))
+    assert user['aggregates']['score_sum'] == result['total_score']
+
+    stats = client.post('/get_user_stats', json={}).get_json()['stats']
+    wrong_records = app_module.load_user_data(user_id)['wrong_questions'][user_id]
+    assert stats['wrong_count'] == len(user['wrong_questions']) == len(wrong_records)
+    assert stats['answered_count'] == len(user['answered_questions'])
+    assert stats['exam_count'] == 1 and stats['avg_score'] == round(result['total_score'], 1)
+
+
+def test_stats_cache_is_invalidated_per_user(storage, login):
+    """一个用户作答只清除自己的统计缓存"""
+    client = storage('journal')
+    bank = app_module.load_question_bank()
+    alice = login(client, 'alice')
+    client.post('/get_user_stats', json={})
+    other = app_module.app.test_client()
+    bobby = login(other, 'bobby')
+    assert alice in app_module._user_stats_cache
+    other.post('/submit_answer', json={'question_id': bank.questions[0]['id'], 'answer': 'Z'})
+    assert alice in app_module._user_stats_cache and bobby not in app_module._user_stats_cache
+
+    client.post('/submit_answer', json={'question_id': bank.questions[1]['id'], 'answer': 'Z'})
+    assert alice not in app_module._user_stats_cache
+    assert client.post('/get_user_stats', json={}).get_json()['stats']['wrong_count'] == 1
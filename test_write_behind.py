@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+延迟写（WRITE_BEHIND=1）的测试：请求只标记脏用户，后台一次合并写入（group commit）
+"""
+
+import pytest
+
+import app as app_module
+
+
+def _count_writes(monkeypatch, name):
+    """包装存储函数，记下每次调用的参数"""
+    calls = []
+    original = getattr(app_module, name)
+
+    def wrapper(*args):
+        calls.append(args)
+        return original(*args)
+
+    monkeypatch.setattr(app_module, name, wrapper)
+    return calls
+
+
+def test_blob_flush_writes_all_dirty_users_once(storage, login, monkeypatch):
+    client = storage('blob', write_behind=True)
+    writes = _count_writes(monkeypatch, '_save_blob_user_data')
+    questions = app_module.load_question_bank().questions
+    user_ids = []
+    for username in ('alice', 'bobby', 'carol'):
+        user_ids.append(login(client, username))
+        client.post('/submit_answer', json={'question_id': questions[0]['id'], 'answer': 'Z'})
+    assert writes == []
+    assert app_module._dirty_users == set(user_ids)
+
+    assert app_module.flush_dirty_users() == 3
+    assert len(writes) == 1 and set(writes[0][0]['users']) == set(user_ids)
+    assert app_module.flush_dirty_users() == 0
+    stats = app_module.get_write_behind_stats()
+    assert stats['flush_count'] >= 1 and stats['last_batch_size'] == 3 and stats['queue_depth'] == 0
+
+    # 落盘的数据与常驻数据一致：丢弃常驻数据后重新加载
+    resident = app_module.load_user_data()
+    monkeypatch.setattr(app_module, '_resident_data', None)
+    reloaded = app_module.load_user_data()
+    for uid in user_ids:
+        assert reloaded['wrong_questions'][uid].keys() == resident['wrong_questions'][uid].keys()
+
+
+def test_failed_flush_requeues_the_batch(storage, login, monkeypatch):
+    client = storage('per_user', write_behind=True)
+    user_id = login(client)
+    assert user_id in app_module._dirty_users
+
+    def fail(data, user_ids):
+        raise OSError('disk full')
+
+    original = app_module._save_user_rows
+    monkeypatch.setattr(app_module, '_save_user_rows', fail)
+    assert app_module.flush_dirty_users() == 0
+    assert app_module._dirty_users == {user_id}
+
+    writes = []
+    monkeypatch.setattr(app_module, '_save_user_rows', lambda data, user_ids: writes.append(set(user_ids)) or original(data, user_ids))
+    assert app_module.drain_write_behind()
+    assert writes == [{user_id}]
+    assert app_module.file_load_user_rows(user_id)[user_id]['profile']
+
+
+@pytest.mark.parametrize('mode', ['blob', 'per_user'])
+def test_reads_see_unflushed_writes(storage, login, mode):
+    """尚未落盘的修改对后续请求可见"""
+    client = storage(mode, write_behind=True)
+    user_id = login(client)
+    question = app_module.load_question_bank().questions[0]
+    client.post('/submit_answer', json={'question_id': question['id'], 'answer': 'Z'})
+    assert app_module._dirty_users
+    stats = client.post('/get_user_stats', json={}).get_json()['stats']
+    assert stats['answered_count'] == 1 and stats['wrong_count'] == 1
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+错题记录的测试：旧格式迁移为按题聚合的记录，题目文本从题库关联，按题型分页与排序
+"""
+
+import datetime
+import json
+
+import app as app_module
+import question_table
+
+
+def _rewrite_saved_user(user_id, change):
+    """直接修改 user_data.json 中的数据（模拟旧版本写入的数据）"""
+    with open(app_module.USER_DATA_FILE, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    change(data)
+    with open(app_module.USER_DATA_FILE, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def _legacy_record(question, answer, when):
+    return {'question_id': str(question['id']), 'user_answer': answer, 'timestamp': when.isoformat(),
+            'question_content': question['content'], 'correct_answer': question['correct_answer'],
+            'analysis': question['analysis'], 'type': question['type']}
+
+
+def test_legacy_wrong_records_are_migrated(storage, login):
+    client = storage('blob')
+    user_id = login(client)
+    bank = app_module.load_question_bank()
+    often, once = bank.questions_of_type(1)[0], bank.questions_of_type(2)[0]
+    start = datetime.datetime(2024, 3, 1, 8, 0)
+    legacy = [_legacy_record(often, f'A{i}', start + datetime.timedelta(hours=i)) for i in range(7)]
+    legacy.append(_legacy_record(once, 'B', start + datetime.timedelta(days=1)))
+    legacy.append({'question_id': 999999, 'user_answer': 'C', 'timestamp': start.isoformat()})
+
+    def to_legacy(data):
+        data['wrong_questions'][user_id] = legacy
+        user = data['users'][user_id]
+        user['wrong_questions'] = [often['id'], once['id'], 999999]
+        user['answered_questions'] = [often['id'], once['id'], 999999]
+        user.pop('wrong_count', None)
+        user.pop('aggregates', None)
+
+    _rewrite_saved_user(user_id, to_legacy)
+    result = client.post('/get_wrong_questions', json={'sort_by': 'count'}).get_json()
+    single = result['single_choice']
+    assert [(item['question_id'], item['wrong_count']) for item in single] == [(often['id'], 7)]
+    item = single[0]
+    assert item['question_content'] == often['content'] and item['analysis'] == often['analysis']
+    assert [attempt['user_answer'] for attempt in item['recent_attempts']] == ['A6', 'A5', 'A4', 'A3', 'A2'][:app_module.WRONG_RECENT_LIMIT]
+    assert item['user_answer'] == 'A6' and item['timestamp'] == (start + datetime.timedelta(hours=6)).isoformat()
+    assert [entry['question_id'] for entry in result['multi_choice']] == [once['id']]
+    # 已从题库删除的题不显示，但计数仍保留
+    assert result['single_pagination']['total_count'] == 1
+
+    stats = app_module.get_user_stats_cached(user_id)
+    assert stats['wrong_count_map'] == {often['id']: 7, once['id']: 1, 999999: 1}
+
+    # 任意一次保存后，存储中的错题记录为聚合格式，不再复制题目文本
+    client.post('/submit_answer', json={'question_id': once['id'], 'answer': 'Z'})
+    with open(app_module.USER_DATA_FILE, 'r', encoding='utf-8') as f:
+        saved = json.load(f)['wrong_questions'][user_id]
+    assert saved[str(often['id'])]['count'] == 7 and len(saved[str(often['id'])]['recent']) == app_module.WRONG_RECENT_LIMIT
+    assert saved[str(once['id'])]['count'] == 2 and saved['999999']['count'] == 1
+    assert all(set(entry) == {'count', 'recent'} for entry in saved.values())
+
+
+def test_wrong_questions_are_paginated_per_type(storage, login):
+    client = storage('blob')
+    user_id = login(client)
+    bank = app_module.load_question_bank()
+    singles = bank.questions_of_type(1)[:12]
+    true_false = bank.questions_of_type(3)[:3]
+    start = datetime.datetime(2024, 3, 1, 8, 0)
+    legacy = []
+    # 单选第 i 题做错 i % 4 + 1 次，最后一次在第 i 小时
+    for i, question in enumerate(singles):
+        for k in range(i % 4 + 1):
+            legacy.append(_legacy_record(question, f'A{k}', start + datetime.timedelta(hours=i, minutes=-k)))
+    for i, question in enumerate(true_false):
+        legacy.append(_legacy_record(question, 'B', start + datetime.timedelta(days=1, hours=i)))
+
+    def to_legacy(data):
+        data['wrong_questions'][user_id] = legacy
+        user = data['users'][user_id]
+        user['wrong_questions'] = [q['id'] for q in singles + true_false]
+        user['answered_questions'] = list(user['wrong_questions'])
+        user.pop('wrong_count', None)
+        user.pop('aggregates', None)
+
+    _rewrite_saved_user(user_id, to_legacy)
+    with open(app_module.USER_DATA_FILE, 'rb') as f:
+        saved = f.read()
+
+    def fetch(**params):
+        return client.post('/get_wrong_questions', json=dict(page_size=5, **params)).get_json()
+
+    def single_ids(result):
+        return [item['question_id'] for item in result['single_choice']]
+
+    by_time = [q['id'] for q in reversed(singles)]
+    by_count = [q['id'] for _, _, q in sorted(((-(i % 4 + 1), -i, q) for i, q in enumerate(singles)), key=lambda row: row[:2])]
+    by_id = sorted((q['id'] for q in singles), key=question_table._id_sort_key)
+    for sort_by, expected in (('timestamp', by_time), ('count', by_count), ('id', by_id)):
+        pages = [single_ids(fetch(sort_by=sort_by, page_single=page)) for page in (1, 2, 3)]
+        assert sum(pages, []) == expected, sort_by
+
+    # 各题型独立分页
+    result = fetch(page_single=3, page_true_false=1)
+    assert len(result['single_choice']) == 2 and len(result['true_false']) == 3 and result['multi_choice'] == []
+    assert result['single_pagination'] == {'total_count': 12, 'current_page': 3, 'total_pages': 3,
+                                           'has_next': False, 'has_prev': True}
+    assert result['true_false_pagination']['total_pages'] == 1
+    assert [item['wrong_count'] for item in result['true_false']] == [1, 1, 1]
+    assert fetch(page_single=4)['single_choice'] == []
+    # 无效的页码与每页条数按默认值处理
+    for page in ('abc', 0, -1, None):
+        assert single_ids(fetch(page_single=page)) == by_time[:5]
+    assert single_ids(fetch(page=2)) == by_time[5:10]
+    assert len(client.post('/get_wrong_questions', json={'page_size': 'x'}).get_json()['single_choice']) == 12
+
+    # 只读：不改写存储的错题记录
+    with open(app_module.USER_DATA_FILE, 'rb') as f:
+        assert f.read() == saved
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+错题加权抽样的测试：树状数组、避开最近出过的题，以及 app 中按用户缓存的抽样器
+"""
+
+import random
+from collections import Counter
+
+import app as app_module
+from wrong_sampler import FenwickSampler, WrongSampler
+
+
+def test_fenwick_totals_follow_updates():
+    """插入（含容量翻倍重建）与修改权重后总和正确"""
+    sampler = FenwickSampler()
+    weights = {}
+    rng = random.Random(3)
+    for i in range(200):
+        key = rng.randint(0, 120)
+        weights[key] = rng.choice([0.0, 0.5, 1.0, 3.0])
+        sampler.set(key, weights[key])
+        assert abs(sampler.total() - sum(weights.values())) < 1e-9
+    assert len(sampler) == len(weights)
+    assert all(sampler.weight(key) == weight for key, weight in weights.items())
+    assert sampler.weight('missing') == 0.0 and 'missing' not in sampler
+
+
+def test_fenwick_samples_by_weight():
+    """抽样频率与权重成正比，权重为 0 的键从不被抽到"""
+    sampler = FenwickSampler()
+    for key, weight in [('a', 1.0), ('b', 0.0), ('c', 3.0), ('d', 0.0), ('e', 4.0)]:
+        sampler.set(key, weight)
+    rng = random.Random(5)
+    counts = Counter(sampler.sample(rng) for _ in range(16000))
+    assert set(counts) == {'a', 'c', 'e'}
+    assert abs(counts['a'] / 16000 - 0.125) < 0.02
+    assert abs(counts['e'] / 16000 - 0.5) < 0.02
+
+    sampler.set('e', 0.0)
+    assert {sampler.sample(rng) for _ in range(500)} == {'a', 'c'}
+    for key in 'ac':
+        sampler.set(key, 0.0)
+    assert sampler.sample(rng) is None
+
+
+def test_wrong_sampler_avoids_recent_questions():
+    """最近出过的题不再抽到；可抽的题都出过时才重复"""
+    sampler = WrongSampler('layout', avoid_last=2)
+    for qid in (1, 2, 3):
+        sampler.update(qid, 1, count=1, last_epoch=1000)
+    rng = random.Random(11)
+    first = sampler.draw(rng, count=2)
+    assert len(set(first)) == 2
+    assert sampler.draw(rng) == [({1, 2, 3} - set(first)).pop()]
+    assert len(sampler.draw(rng, count=5)) == 3
+    assert sampler.draw(rng, type_filter=2) == []
+    assert sampler.draw_among(rng, qids=[3, 99], count=2) == [3]
+
+
+def _answer_wrong(client, questions):
+    client.post('/submit_answers', json={'answers': [{'question_id': q['id'], 'answer': 'Z'} for q in questions]})
+
+
+def _draw_wrong(client, count=3):
+    return client.post('/get_practice_batch', json={'mode': 'wrong', 'count': count}).get_json()['questions']
+
+
+def test_compaction_does_not_touch_live_samplers(storage, login):
+    """压缩日志时回放做错的事件，不能改动内存中的抽样器"""
+    client = storage('journal')
+    user_id = login(client)
+    bank = app_module.load_question_bank()
+    singles = bank.questions_of_type(1)
+    _answer_wrong(client, singles[:4])
+    assert len(_draw_wrong(client)) == 3
+    sampler = app_module._wrong_samplers[user_id]
+    assert sampler.wrong_total == 4 and len(sampler.types) == 4
+
+    assert app_module.compact_journal()
+    assert app_module._wrong_samplers[user_id] is sampler and sampler.wrong_total == 4 and len(sampler.types) == 4
+
+    # 之后的作答仍增量更新同一个抽样器
+    _answer_wrong(client, singles[4:6])
+    assert app_module._wrong_samplers[user_id] is sampler and sampler.wrong_total == 6
+    assert len(sampler.types) == 6
+    _draw_wrong(client)
+    assert app_module._wrong_samplers[user_id] is sampler
+
+
+def test_wrong_samplers_are_bounded(storage, login, monkeypatch):
+    """抽样器按最近使用保留最多 WRONG_SAMPLER_CACHE_SIZE 个"""
+    monkeypatch.setattr(app_module, 'WRONG_SAMPLER_CACHE_SIZE', 2)
+    storage('blob')
+    bank = app_module.load_question_bank()
+    clients = {}
+    for name in ('alice', 'bob', 'carol'):
+        client = app_module.app.test_client()
+        clients[login(client, name)] = client
+        _answer_wrong(client, bank.questions_of_type(1)[:2])
+    alice, bob, carol = clients
+    _draw_wrong(clients[alice])
+    _draw_wrong(clients[bob])
+    _draw_wrong(clients[alice])
+    _draw_wrong(clients[carol])
+    assert list(app_module._wrong_samplers) == [alice, carol]
+    # 被丢弃的用户下次抽样时重建
+    assert len(_draw_wrong(clients[bob], 2)) == 2
+    assert list(app_module._wrong_samplers) == [carol, bob]
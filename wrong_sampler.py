@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+错题模式的加权抽样
+
+- 权重 = 做错次数 × 2^((最后做错时间 - 基准时间) / 半衰期)：做错越多、最近刚做错的题越容易被抽到。
+  任意两题的权重比与当前时间无关，因此不需要随时间重算，只在某题再次做错时更新它自己的权重。
+- 每个题型一棵树状数组（Fenwick 树），更新与抽样都是 O(log n)；不限题型时先按各题型的总权重选题型。
+- 最近出过的 K 道题（环形缓冲区）在抽样时临时置零；可抽的题都在其中时不再回避。
+"""
+
+import random
+from collections import deque
+
+# 指数上限：避免相隔极久的做错时间导致浮点溢出
+_MAX_EXPONENT = 900
+
+
+class FenwickSampler:
+    """按权重抽样的树状数组：键 -> 权重，支持 O(log n) 修改权重与抽样"""
+
+    def __init__(self):
+        self._keys = []      # 槽位 -> 键
+        self._slots = {}     # 键 -> 槽位
+        self._weights = []   # 槽位 -> 权重
+        self._tree = [0.0]   # 下标从 1 开始
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def weight(self, key):
+        slot = self._slots.get(key)
+        return 0.0 if slot is None else self._weights[slot]
+
+    def total(self):
+        i = len(self._weights)
+        total = 0.0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def set(self, key, weight):
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = len(self._keys)
+            self._keys.append(key)
+            self._slots[key] = slot
+            self._weights.append(0.0)
+            if len(self._weights) >= len(self._tree):
+                self._rebuild(2 * len(self._tree))
+        delta = weight - self._weights[slot]
+        self._weights[slot] = weight
+        i = slot + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _rebuild(self, size):
+        # 容量翻倍时 O(n) 重建，均摊到每次插入为 O(1)
+        tree = [0.0] * size
+        weights = self._weights
+        for i in range(1, size):
+            if i <= len(weights):
+                tree[i] += weights[i - 1]
+            parent = i + (i & -i)
+            if parent < size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def sample(self, rng, total=None):
+        """按权重抽取一个键；总权重为 0 时返回 None"""
+        total = self.total() if total is None else total
+        if total <= 0:
+            return None
+        target = rng.random() * total
+        tree = self._tree
+        pos = 0
+        step = 1 << (len(tree).bit_length() - 1)
+        while step:
+            nxt = pos + step
+            if nxt < len(tree) and tree[nxt] <= target:
+                pos = nxt
+                target -= tree[nxt]
+            step >>= 1
+        slot = min(pos, len(self._weights) - 1)
+        if self._weights[slot] <= 0:
+            # 浮点舍入落到了权重为 0 的槽位：取前面最近的非零槽位
+            for slot in range(slot, -1, -1):
+                if self._weights[slot] > 0:
+                    break
+            else:
+                return None
+        return self._keys[slot]
+
+
+class WrongSampler:
+    """一个用户的错题抽样器：按题型分树，附带最近出题的环形缓冲区"""
+
+    def __init__(self, layout_id, half_life_days=14, avoid_last=5, recent=()):
+        self.layout_id = layout_id
+        self.half_life = max(half_life_days, 1e-6) * 86400
+        self.reference = None
+        self.trees = {}
+        self.types = {}
+        self.recent = deque(recent, maxlen=max(avoid_last, 0))
+        # 已计入的做错总次数，与用户聚合中的 wrong_total 一致时抽样器才有效
+        self.wrong_total = 0
+
+    def _weight(self, count, last_epoch):
+        if self.reference is None:
+            self.reference = last_epoch
+        exponent = (last_epoch - self.reference) / self.half_life
+        return count * 2.0 ** max(-_MAX_EXPONENT, min(exponent, _MAX_EXPONENT))
+
+    def update(self, qid, question_type, count, last_epoch):
+        """设置一道错题的做错次数与最后做错时间（新错题或再次做错）"""
+        self.types[qid] = question_type
+        self.trees.setdefault(question_type, FenwickSampler()).set(qid, self._weight(count, last_epoch))
+
+    def draw(self, rng=random, type_filter=0, count=1):
+        """抽取最多 count 道不重复的错题，避开最近出过的题"""
+        trees = [self.trees[type_filter]] if type_filter in self.trees else (
+            [] if type_filter else list(self.trees.values()))
+        if not trees:
+            return []
+        hidden = []
+
+        def hide(qid):
+            tree = self.trees.get(self.types.get(qid))
+            weight = tree.weight(qid) if tree is not None else 0.0
+            if weight > 0:
+                tree.set(qid, 0.0)
+                hidden.append((tree, qid, weight))
+
+        try:
+            for qid in self.recent:
+                hide(qid)
+            avoided = len(hidden)
+            drawn = []
+            while len(drawn) < count:
+                qid = self._draw_once(rng, trees)
+                if qid is None and avoided:
+                    # 可抽的题都在最近出过的题中：恢复它们再抽
+                    for tree, key, weight in hidden[:avoided]:
+                        tree.set(key, weight)
+                    del hidden[:avoided]
+                    avoided = 0
+                    continue
+                if qid is None:
+                    break
+                drawn.append(qid)
+                hide(qid)
+        finally:
+            for tree, key, weight in hidden:
+                tree.set(key, weight)
+        self.recent.extend(drawn)
+        return drawn
+
+    def draw_among(self, rng=random, qids=(), count=1):
+        """只在给定的错题（如某个主题内）中按同样的权重抽取最多 count 道，避开最近出过的题
+
+        候选集一般很小，直接用加权无放回抽样（键 = u^(1/权重) 取最大的 count 个），不经过树。
+        """
+        weighted = []
+        for qid in qids:
+            tree = self.trees.get(self.types.get(qid))
+            weight = tree.weight(qid) if tree is not None else 0.0
+            if weight > 0:
+                weighted.append((qid, weight))
+        recent = set(self.recent)
+        fresh = [item for item in weighted if item[0] not in recent]
+        if len(fresh) < count:
+            # 不够时再从最近出过的题中补足
+            fresh += [item for item in weighted if item[0] in recent]
+        keyed = sorted(((rng.random() ** (1.0 / weight), qid) for qid, weight in fresh), reverse=True)
+        drawn = [qid for _, qid in keyed[:count]]
+        self.recent.extend(drawn)
+        return drawn
+
+    @staticmethod
+    def _draw_once(rng, trees):
+        if len(trees) == 1:
+            return trees[0].sample(rng)
+        totals = [tree.total() for tree in trees]
+        target = rng.random() * sum(totals)
+        for tree, total in zip(trees, totals):
+            if total <= 0:
+                continue
+            if target < total:
+                return tree.sample(rng, total)
+            target -= total
+        for tree, total in zip(reversed(trees), reversed(totals)):
+            if total > 0:
+                return tree.sample(rng, total)
+        return None